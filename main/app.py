@@ -1,20 +1,107 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, url_for
+from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, url_for, g, abort, stream_with_context
 import os
+import io
 import re
+import csv
+import gzip
+import hmac
 import json
-from datetime import datetime
-from collections import defaultdict, Counter
-
+import time
+import shutil
+import hashlib
+import secrets
+import threading
+import warnings
+import traceback
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from collections import OrderedDict
+
+import click
 import pandas as pd
+try:
+    import orjson      # 可选：装了就用它编码 JSON（C 实现，原生支持 NumPy 类型）
+except ImportError:
+    orjson = None
+try:
+    import brotli      # 可选：装了就支持 br 压缩
+except ImportError:
+    brotli = None
+from pandas.api.types import union_categoricals
+from pandas.tseries.api import guess_datetime_format
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from images import FORMATS as IMAGE_FORMATS, ImageVariants
+from metrics import Registry
+from org_aggregates import OrgAggregates
+from partitions import PartitionCache
+from profiling import RequestProfiler
+from ratelimit import ClientLimiter
+from report_cache import ReportCache
+from report_store import ReportStore
+from singleflight import SingleFlight
+from snapshot import load_snapshot, read_snapshot_meta, save_snapshot
+from year_totals import YearTotals
 
 app = Flask(__name__)
 
 # ====== 配置区 ======
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PHOTO_FOLDER = os.path.join(BASE_DIR, 'photos')
-DATA_FOLDER = os.path.join(BASE_DIR, 'data')
+PHOTO_VARIANT_FOLDER = os.path.join(BASE_DIR, 'photos_derived')  # 照片缩小版本（自动生成，可随时删）
+DATA_FOLDER = os.environ.get('REPORT_DATA_DIR') or os.path.join(BASE_DIR, 'data')   # 压测 / 测试时可以指到别的目录
 CSV_PATH = os.path.join(DATA_FOLDER, 'volunteer_records.csv')
 ORG_STATS_PATH = os.path.join(DATA_FOLDER, 'org_stats.json')
+REPORT_STORE_PATH = os.path.join(DATA_FOLDER, 'report_store.sqlite3')  # 离线预计算的报告库
+REPORT_YEAR = 2025   # volunteer_records.csv / org_stats.json 是哪一年的数据（当前年度）
+YEARS_FOLDER = os.path.join(DATA_FOLDER, 'years')  # 往年数据：<年份>.csv，可选 <年份>.org_stats.json
+YEAR_PARTITIONS_IN_MEMORY = 2   # 往年数据第一次被请求时才加载，最多同时留几年，多了卸载最久没用的
+SNAPSHOT_FORMAT = 4    # 清洗逻辑改了就加 1，旧快照自动作废
+REPORT_FORMAT = 1      # 报告的字段 / 生成逻辑改了就加 1，旧的预计算报告库自动作废
+DATA_WATCH_INTERVAL = 5  # 秒：后台检查 CSV / org_stats.json 是否变化的间隔，0 表示不检查
+
+# CSV 达到这个大小就分块流式读取（峰值内存小，格式不对的行写进 <文件名>.rejects.csv），0 = 总是分块读
+STREAM_INGEST_MIN_BYTES = 256 * 1024 * 1024
+STREAM_INGEST_CHUNK_ROWS = 200_000
+
+# /api/org_stats?v=<版本> 的浏览器缓存时长（内容变了版本号就变，所以可以缓存很久）
+ORG_STATS_MAX_AGE = 365 * 24 * 3600
+
+# 报告接口的响应超过这个大小才压缩（gzip，装了 brotli 时优先 br）
+REPORT_COMPRESS_MIN_BYTES = 1024
+
+# 按需剖析 /api/get_annual_data：请求头 X-Profile-Token 和口令一致、或按采样率随机，结果写到 PROFILE_DIR
+PROFILE_DIR = os.environ.get('REPORT_PROFILE_DIR', os.path.join(DATA_FOLDER, 'profiles'))
+PROFILE_TOKEN = os.environ.get('REPORT_PROFILE_TOKEN', '')                      # 空 = 不接受请求头触发
+PROFILE_SAMPLE_RATE = float(os.environ.get('REPORT_PROFILE_SAMPLE_RATE', '0'))  # 0 = 不随机剖析
+PROFILE_KEEP = 50                                                                # 目录里最多留多少个文件
+
+# 批量查询 & 全量导出
+BATCH_MAX_PEOPLE = 100          # /api/get_annual_data_batch 一次最多查多少人（按人数扣限流令牌，不要超过 CLIENT_BURST）
+EXPORT_SHARD_SIZE = 200         # 导出时每批算多少人（统计部分按批向量化）
+EXPORT_TOKEN = os.environ.get('REPORT_EXPORT_TOKEN', '')   # /api/export_reports 的口令，空 = 不开放（命令行导出不受影响）
+
+# 报告接口按客户端限流（每个进程各算各的），0 = 不限
+# 同一个校园网 / 运营商 NAT 出口后面可能有几百名同学共用一个地址，所以额度按“一个出口”而不是“一个人”来定
+CLIENT_MAX_CONCURRENT = 16  # 同一客户端同时在处理的请求数
+CLIENT_RATE = 20.0          # 令牌桶：每秒补充几次请求
+CLIENT_BURST = 100          # 令牌桶容量：短时间内最多连续请求几次；消耗超过这个数的单个请求直接拒绝（413）
+TRUSTED_PROXIES = int(os.environ.get('REPORT_TRUSTED_PROXIES', '0'))  # 前面有几层反向代理（按 X-Forwarded-For 还原客户端地址）
+
+# 照片按这几档宽度生成 WebP / JPEG 缩小版本（需要 Pillow），时光掠影卡片用 GALLERY_IMAGE_WIDTH 这一档
+IMAGE_WIDTHS = (320, 640, 1080)
+GALLERY_IMAGE_WIDTH = 640
+IMAGE_MAX_AGE = 365 * 24 * 3600   # 带版本号的图片地址内容不会变，浏览器可以缓存很久
+
+# 进程内报告缓存（同一个人反复打开 / 分享时直接命中）
+REPORT_CACHE_MAX_ENTRIES = 4096
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 压缩好的完整响应单独一个 LRU：不占报告缓存的名额，也不影响它的命中 / 未命中计数
+COMPRESSED_CACHE_MAX_ENTRIES = 4096
+COMPRESSED_CACHE_MAX_BYTES = 32 * 1024 * 1024
 
 # 活动类型映射到雷达图维度
 TYPE_KEYS = {
@@ -35,11 +122,22 @@ ACTIVE_DAYS_WEIGHT = {
     "商火": 30
 }
 
+# 关键词彩蛋：活动名称匹配到就有机会获得对应称号 (正则, 称号, 权重, 文案)，最多 8 条
+KEYWORD_TAGS = [
+    (r"商火相传", "薪火引路人", 60, "商火相传限定称号。你是新生的引路人，接过传承的火炬，用陪伴温暖了他们的初秋。"),
+    (r"夏令营", "筑梦师", 62, "何处是中国·筑梦夏令营限定称号。感谢你为孩子们筑起了梦想的城堡。"),
+    (r"支教|课堂|授课", "课堂派", 52, "活跃在三尺讲台，传播知识的种子。"),
+    (r"探访|陪伴|慰问", "陪伴系", 52, "你的陪伴，是这一年最长情的告白。"),
+    (r"环保|巡河|净滩", "地球合伙人", 52, "为了蔚蓝澄净的世界，你一直在努力。"),
+]
+
 # 处理numpy类型数据
 import numpy as np
 from flask.json.provider import DefaultJSONProvider
 
 class NumpyJSONProvider(DefaultJSONProvider):
+    """装了 orjson 就用 orjson 编码（NumPy 标量 / 数组直接支持），没装退回标准库 json"""
+
     def default(self, o):
         if isinstance(o, (np.integer,)):
             return int(o)
@@ -49,13 +147,75 @@ class NumpyJSONProvider(DefaultJSONProvider):
             return o.tolist()
         return super().default(o)
 
+    def dumps(self, obj, **kwargs):
+        # Flask 生成响应时只会传 indent / separators，其余参数交给标准库
+        if orjson is None or set(kwargs) - {'indent', 'separators'} or kwargs.get('indent') not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj, indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+    def dumps_bytes(self, obj, indent: bool = False) -> bytes:
+        """直接编码成 UTF-8 字节（紧凑格式），orjson 本来就输出字节，省一次转换"""
+        if orjson is None:
+            return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+        # 日期等交给 default（和标准库分支的输出格式一致）
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
 app.json = NumpyJSONProvider(app)
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
 
 
 
 # ====== 启动时加载数据 ======
-df_records = None      # 志愿流水账
-org_stats = None       # 协会年度公共数据 & 部门文案 & 致信文案
+dataset = None         # 当前这份完整数据（Dataset），处理请求时先取一次引用，后面都用它
+df_records = None      # 志愿流水账（= dataset.df，兼容旧代码）
+org_stats = None       # 协会年度公共数据 & 部门文案 & 致信文案（= dataset.org_stats）
+report_store = None    # 预计算报告库（和当前数据版本对得上才会启用）
+report_cache = ReportCache(REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_MAX_BYTES)
+compressed_cache = ReportCache(COMPRESSED_CACHE_MAX_ENTRIES, COMPRESSED_CACHE_MAX_BYTES)   # 压缩好的响应
+report_flight = SingleFlight()   # 同一个人的报告同时只算一次
+client_limiter = ClientLimiter(CLIENT_MAX_CONCURRENT, CLIENT_RATE, CLIENT_BURST)
+year_totals = YearTotals(YEARS_FOLDER)   # 往年每人的总时长 / 活动次数（算历年累计用）
+image_variants = ImageVariants(PHOTO_FOLDER, PHOTO_VARIANT_FOLDER, IMAGE_WIDTHS)
+request_profiler = RequestProfiler(PROFILE_DIR, PROFILE_KEEP, PROFILE_TOKEN, PROFILE_SAMPLE_RATE)
+
+
+# ====== 监控指标（/metrics） ======
+metrics = Registry()
+http_requests = metrics.counter('http_requests_total', 'HTTP 请求数', ['endpoint', 'method', 'status'])
+http_request_seconds = metrics.histogram('http_request_duration_seconds', 'HTTP 请求耗时（秒）', ['endpoint'])
+report_errors = metrics.counter('report_errors_total', '生成报告出错次数（按异常类型）', ['error'])
+report_sources = metrics.counter('report_source_total', '个人报告从哪来：cache / store / computed / coalesced / not_found', ['source'])
+report_stage_seconds = metrics.histogram('report_stage_duration_seconds', '生成报告各环节耗时（秒）', ['stage'])
+data_loads = metrics.counter('dataset_loads_total', '加载 / 重新加载数据的次数：full / append / org / year（往年）', ['kind'])
+data_load_seconds = metrics.histogram('dataset_load_duration_seconds', '加载数据耗时（秒）', ['kind'],
+                                      buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+metrics.callback('dataset_rows', '当前数据的流水账行数', lambda: len(dataset.df) if dataset else None)
+metrics.callback('dataset_volunteers', '当前数据的志愿者人数', lambda: len(dataset.user_index) if dataset else None)
+metrics.callback('dataset_last_load_seconds', '当前数据加载用了多少秒', lambda: dataset.load_seconds if dataset else None)
+metrics.callback('dataset_loaded_timestamp_seconds', '当前数据的加载时间（Unix 时间戳）', lambda: dataset.loaded_at if dataset else None)
+metrics.callback('dataset_info', '当前数据版本', lambda: [((dataset.version, dataset.org_version), 1)] if dataset else None,
+                 labelnames=['version', 'org_version'])
+metrics.callback('report_cache_entries', '报告缓存条数', lambda: report_cache.stats()['entries'])
+metrics.callback('report_cache_bytes', '报告缓存占用字节数', lambda: report_cache.stats()['bytes'])
+metrics.callback('report_cache_hits_total', '报告缓存命中次数', lambda: report_cache.hits, kind='counter')
+metrics.callback('report_cache_misses_total', '报告缓存未命中次数', lambda: report_cache.misses, kind='counter')
+metrics.callback('report_cache_evictions_total', '报告缓存淘汰次数', lambda: report_cache.evictions, kind='counter')
+metrics.callback('compressed_cache_entries', '压缩响应缓存条数', lambda: compressed_cache.stats()['entries'])
+metrics.callback('compressed_cache_bytes', '压缩响应缓存占用字节数', lambda: compressed_cache.stats()['bytes'])
+metrics.callback('compressed_cache_hits_total', '压缩响应缓存命中次数', lambda: compressed_cache.hits, kind='counter')
+metrics.callback('compressed_cache_misses_total', '压缩响应缓存未命中次数', lambda: compressed_cache.misses, kind='counter')
+metrics.callback('report_inflight', '正在生成的个人报告数（同一个人同时的请求算一个）', lambda: report_flight.in_flight())
+metrics.callback('client_rate_limited_total', '被限流拒绝的请求数：concurrency / rate',
+                 lambda: [((reason,), n) for reason, n in client_limiter.rejected.items()], kind='counter', labelnames=['reason'])
+metrics.callback('year_partitions_loaded', '内存里的往年数据份数', lambda: len(year_partitions.loaded_keys()))
+metrics.callback('year_partition_evictions_total', '往年数据被卸载的次数', lambda: year_partitions.evictions, kind='counter')
 
 
 def normalize_phone(phone: str) -> str:
@@ -63,73 +223,810 @@ def normalize_phone(phone: str) -> str:
     return re.sub(r'\D', '', str(phone))
 
 
-def load_data():
-    global df_records, org_stats
-
-    # 1. 加载 CSV
-    df = pd.read_csv(CSV_PATH, dtype=str)  # 全部先读成 str，后面再转
-    df = df.rename(columns={
-        '姓名': 'name',
-        '学号': 'phone',
-        '活动名称': 'activity_name',
-        '活动类型': 'activity_type',
-        '活动日期': 'activity_date',
-        '服务时长': 'hours',
-        '活动封面图': 'cover_img'
-    })
+TYPE_CN = list(TYPE_KEYS)       # 雷达图维度顺序（中文），行特征里的类型编码就是这里的下标
+SEASONS = ["春", "夏", "秋", "冬"]
+SEASON_OF_MONTH = np.array([3, 3, 3, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3])  # 下标是月份（1~12）
+
+# 所有关键词合成一个正则，一次 match 就知道一个活动名命中了哪几条：
+# 每条是一个可选的前瞻 (?=.*?(?P<k0>...))?，各自独立地在整个名称里找，命中的分组不为 None
+KEYWORD_PATTERN = re.compile(''.join(f'(?=.*?(?P<k{i}>{pattern}))?' for i, (pattern, *_) in enumerate(KEYWORD_TAGS)), re.S)
+
+
+def keyword_mask(name: str) -> int:
+    """活动名称命中的关键词彩蛋，第 i 位对应 KEYWORD_TAGS[i]"""
+    groups = KEYWORD_PATTERN.match(name).groups()
+    return sum(1 << i for i, g in enumerate(groups) if g is not None)
+
+
+# 重复度很高的文本列：存成 category（整数编码 + 一份字符串表），几万行只存几百个活动名
+TEXT_COLUMNS = ['name', 'phone', 'activity_name', 'activity_type', 'cover_img']
+
+
+def encode_text_columns(df: pd.DataFrame) -> pd.DataFrame:
+    for col in TEXT_COLUMNS:
+        if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def category_lookup(series: pd.Series, values, missing):
+    """
+    按“类别”算一次、再用编码展开到每一行：values 是每个类别对应的结果，
+    missing 是缺失值（编码 -1）对应的结果——放在查找表最后一位，-1 正好取到它。
+    """
+    table = np.append(np.asarray(values), missing)
+    return table[series.cat.codes.to_numpy()]
+
+
+def add_row_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    每行只和自己有关的派生字段，加载时一次算好（向量化），请求时直接用：
+    - _type_code: 活动类型在 TYPE_CN 里的下标，不认识的归到“其他”
+    - _est_days:  按 ACTIVE_DAYS_WEIGHT 推算的持续天数（名称含“夏令营”优先）
+    - _month:     yyyymm 整数，日期缺失为 -1
+    - _kw_mask:   活动名称命中的关键词彩蛋（位掩码，见 keyword_mask）
+    文本处理（strip / 查表 / 找关键词）只对每个类别做一次，不逐行做。
+    """
+    df = encode_text_columns(df)
+    types = df['activity_type'].cat.categories.astype(str).str.strip()
+    names = df['activity_name'].cat.categories.astype(str).str.strip()
+    others = TYPE_CN.index('其他')
+
+    type_code = pd.Categorical(types, categories=TYPE_CN).codes
+    type_code = np.where(type_code < 0, others, type_code)
+    df['_type_code'] = category_lookup(df['activity_type'], type_code, others).astype(np.int8)
+
+    default_days = ACTIVE_DAYS_WEIGHT.get('其他', 1)
+    type_days = types.map(lambda t: ACTIVE_DAYS_WEIGHT.get(t, default_days))
+    is_camp = names.str.contains('夏令营', regex=False)
+    est_days = np.where(category_lookup(df['activity_name'], is_camp, False),
+                        ACTIVE_DAYS_WEIGHT.get('夏令营', 1),
+                        category_lookup(df['activity_type'], type_days, default_days))
+    df['_est_days'] = est_days.astype(np.int16)
+
+    dates = df['activity_date']
+    df['_month'] = (dates.dt.year * 100 + dates.dt.month).fillna(-1).astype(np.int32).to_numpy()
+
+    name_masks = np.fromiter((keyword_mask(n) for n in names), dtype=np.uint8, count=len(names))
+    df['_kw_mask'] = category_lookup(df['activity_name'], name_masks, 0).astype(np.uint8)
+    return df
+
+
+def build_user_index(df: pd.DataFrame) -> dict:
+    """
+    建立 (name, phone) → 行号 的索引，行号已按 activity_date 排好序，
+    请求时直接 iloc 取出即可，不用再整表扫描 + 排序。
+    排序方式与 df.sort_values('activity_date') 保持一致（快排，NaT 放最后）。
+    """
+    index = {}
+    if df.empty:
+        return index
+
+    names, phones = df['name'].cat, df['phone'].cat
+    name_codes = names.codes.to_numpy().astype(np.int64)
+    phone_codes = phones.codes.to_numpy().astype(np.int64)
+
+    # (姓名编码, 手机号编码) 合成一个整数，稳定排序后同一个人的行挨在一起、且保持原来的行顺序
+    rows = np.flatnonzero((name_codes >= 0) & (phone_codes >= 0))
+    pair = name_codes[rows] * max(len(phones.categories), 1) + phone_codes[rows]
+    order = pair.argsort(kind='stable')
+    rows, pair = rows[order], pair[order]
+    starts = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]])
+    ends = np.r_[starts[1:], len(rows)]
+
+    dates = df['activity_date'].to_numpy()
+    for a, b in zip(starts, ends):
+        pos = rows[a:b]
+        d = dates[pos]
+        nat = np.isnat(d)
+        key = (names.categories[name_codes[pos[0]]], phones.categories[phone_codes[pos[0]]])
+        index[key] = np.concatenate([pos[~nat][d[~nat].argsort(kind='quicksort')], pos[nat]])
+    return index
+
+
+class CoVolunteerIndex:
+    """
+    星火相聚用的倒排索引：活动 → 参与者（姓名编码）。
+    每个活动只存三段紧凑数组（按活动切片）：
+    - members: 参与者姓名编码（int32）
+    - counts:  该姓名在这个活动里出现的记录数
+    - firsts:  该姓名在这个活动里第一次出现的行号（用于复现 Counter 的并列顺序）
+    """
+
+    CACHE_SIZE = 1024  # 按单个活动缓存参与者计数和排好的顺序，热门活动反复命中
+    CHUNK_ROWS = 1 << 22   # top_many 一批最多展开的参与者行数
+
+    def __init__(self, df: pd.DataFrame):
+        # 直接用 category 编码当参与者 / 活动 ID
+        name_codes = df['name'].cat.codes.to_numpy()
+        act_codes = df['activity_name'].cat.codes.to_numpy()
+        self.names = df['name'].cat.categories
+        activities = df['activity_name'].cat.categories
+        self._cache = OrderedDict()   # 活动编码 → _participants 的结果
+        self._lock = threading.Lock()   # 请求线程共用这份缓存
+
+        n_names = max(len(self.names), 1)
+        valid = (act_codes >= 0) & (name_codes >= 0)
+        rows = np.flatnonzero(valid)
+        pair = act_codes[valid].astype(np.int64) * n_names + name_codes[valid]
+        # return_index 返回的是每组第一次出现的位置（稳定排序）
+        uniq, first_idx, counts = np.unique(pair, return_index=True, return_counts=True)
+
+        self.members = (uniq % n_names).astype(np.int32)
+        self.counts = counts.astype(np.int32)
+        self.firsts = rows[first_idx]
+        self.offsets = np.searchsorted(uniq // n_names, np.arange(len(activities) + 1))
+
+    def _participants(self, act: int):
+        """
+        一个活动的参与者：(姓名编码, 记录数, 首次出现行号, 按 Counter.most_common 排好的下标)。
+        按活动缓存：不同的人参加的活动组合各不相同，单个活动却反复出现。
+        """
+        with self._lock:
+            item = self._cache.get(act)
+            if item is not None:
+                self._cache.move_to_end(act)
+                return item
+
+        s = slice(self.offsets[act], self.offsets[act + 1])
+        members, counts, firsts = self.members[s], self.counts[s], self.firsts[s]
+        item = (members, counts, firsts, np.lexsort((firsts, -counts)))
+        with self._lock:
+            self._cache[act] = item
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return item
+
+    def _ranked(self, act_codes: tuple, limit: int):
+        """合并若干活动的参与者，按 Counter.most_common 的顺序返回姓名编码"""
+        parts = [self._participants(a) for a in act_codes]
+        if len(parts) == 1:
+            # 只有一个活动：缓存里就是排好的
+            members, _, _, order = parts[0]
+            return members[order[:limit]]
+
+        members = np.concatenate([p[0] for p in parts])
+        counts = np.concatenate([p[1] for p in parts])
+        firsts = np.concatenate([p[2] for p in parts])
+
+        uniq, inverse = np.unique(members, return_inverse=True)
+        total = np.bincount(inverse, weights=counts, minlength=len(uniq))
+        first = np.full(len(uniq), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, inverse, firsts)
+
+        # 次数降序；次数相同按首次出现的先后（与 Counter 插入顺序一致）
+        order = np.lexsort((first, -total))[:limit]
+        return uniq[order]
+
+    def top_many(self, users, act_codes, exclude_codes, max_num: int):
+        """
+        一批人各自的同行志愿者（和逐人 top 一样）：users[i] 参加了活动 act_codes[i]（同一人的活动不重复），
+        exclude_codes[u] 是第 u 个人自己的姓名编码。所有人的参与者一起展开、一起计数排序，
+        展开的行数按 CHUNK_ROWS 分批，避免一次占太多内存。
+        """
+        users = np.asarray(users, np.int64)
+        act_codes = np.asarray(act_codes, np.int64)
+        exclude_codes = np.asarray(exclude_codes, np.int64)
+        n_users = len(exclude_codes)
+        n_names = max(len(self.names), 1)
+        results = [[] for _ in range(n_users)]
+
+        starts = self.offsets[act_codes]
+        sizes = self.offsets[act_codes + 1] - starts
+        rows_per_user = np.cumsum(np.bincount(users, weights=sizes, minlength=n_users))
+        lo = 0
+        while lo < n_users:
+            done = rows_per_user[lo - 1] if lo else 0
+            hi = max(int(np.searchsorted(rows_per_user, done + self.CHUNK_ROWS, side='right')), lo + 1)
+            a, b = np.searchsorted(users, [lo, hi])
+            lo = hi
+
+            # 每个 (人, 活动) 展开成这个活动的全部参与者
+            span = sizes[a:b]
+            rows = np.repeat(starts[a:b] - (np.cumsum(span) - span), span) + np.arange(span.sum())
+            key = np.repeat(users[a:b], span) * n_names + self.members[rows]
+            uniq, inverse = np.unique(key, return_inverse=True)
+            total = np.bincount(inverse, weights=self.counts[rows], minlength=len(uniq))
+            first = np.full(len(uniq), np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(first, inverse, self.firsts[rows])
+
+            # 每人内部：次数降序；次数相同按首次出现的先后（与 Counter 插入顺序一致）
+            owner, member = uniq // n_names, uniq % n_names
+            order = np.lexsort((first, -total, owner))
+            owner, member = owner[order], member[order]
+            rank = np.arange(len(order)) - np.searchsorted(owner, owner)
+            keep = (rank <= max_num) & (member != exclude_codes[owner])   # 多取一个，排除本人之后仍然够
+            owner, member = owner[keep], member[keep]
+            names = self.names[member].tolist()
+            heads, cuts = np.unique(owner, return_index=True)
+            for u, s, e in zip(heads.tolist(), cuts.tolist(), np.r_[cuts[1:], len(owner)].tolist()):
+                results[u] = names[s:e][:max_num]
+        return results
+
+    def top(self, activity_codes, exclude_code: int, max_num: int):
+        act_codes = tuple(sorted({int(a) for a in activity_codes if a >= 0}))
+        if not act_codes:
+            return []
+
+        # 多取一个，排除本人之后仍然够 max_num 个
+        ranked = self._ranked(act_codes, max_num + 1)
+        return [self.names[c] for c in ranked if c != exclude_code][:max_num]
+
+
+CSV_COLUMNS = {
+    '姓名': 'name',
+    '学号': 'phone',
+    '活动名称': 'activity_name',
+    '活动类型': 'activity_type',
+    '活动日期': 'activity_date',
+    '服务时长': 'hours',
+    '活动封面图': 'cover_img'
+}
+
+
+def parse_records_csv(csv_bytes: bytes, date_format=None):
+    """
+    解析 + 清洗原始 CSV（慢路径，只在源文件变化时跑），返回 (df, 日期格式)。
+    日期格式不传时按第一条日期推断（和 pd.to_datetime 默认行为一致）；
+    解析追加的新行时传入整份文件推断出的格式，保证和整份重新解析结果相同。
+    """
+    df = pd.read_csv(io.BytesIO(csv_bytes), dtype=str)  # 全部先读成 str，后面再转
+    df = df.rename(columns=CSV_COLUMNS)
 
     # 清洗手机号
     df['phone'] = df['phone'].map(normalize_phone)
 
     # 活动日期转 datetime
-    df['activity_date'] = pd.to_datetime(df['activity_date'], errors='coerce')
+    if date_format is None:
+        first_date = df['activity_date'].dropna()
+        date_format = guess_datetime_format(first_date.iloc[0]) if len(first_date) else None
+    df['activity_date'] = pd.to_datetime(df['activity_date'], format=date_format, errors='coerce')
 
     # 服务时长转 float
     df['hours'] = pd.to_numeric(df['hours'], errors='coerce').fillna(0.0)
 
-    df_records = df
+    return add_row_features(encode_text_columns(df)), date_format
+
+
+def rejects_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + '.rejects.csv'
+
+
+def open_source(source):
+    """source 是文件路径或整段 bytes，统一打开成二进制文件对象"""
+    return open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)
+
+
+def ingest_records_stream(source, reject_path: str, date_format=None, append_rejects: bool = False,
+                          chunk_rows: int = STREAM_INGEST_CHUNK_ROWS):
+    """
+    分块流式解析 + 清洗 CSV，返回 (df, 日期格式, 拒收行数)。source 是文件路径或整段 bytes；
+    chunk_rows 为 None 时整份一次读完（小文件），校验和拒收文件完全一样。
+
+    parse_records_csv 先把整份文件读成字符串列再整列转换，峰值内存是最终数据的好几倍。
+    这里每次只读 chunk_rows 行：学号 / 日期 / 时长就地清洗，写进按行数上限预先分配好的定长数组，
+    文本列只记 category 编码（字符串表随读随长），这一块的字符串随即丢掉。
+    用户索引、同行索引只用到编码，Dataset 里照常建，不再碰字符串。
+
+    有值但格式不对的行（日期解析不了、时长不是数字、学号里一个数字都没有）和列数不对的行
+    不进数据，原样写进拒收文件 reject_path（第一列是原因）；空值照旧（日期 NaT、时长 0）。
+    没有拒收行时结果和 parse_records_csv 完全一样（只保留认识的那几列）。
+    """
+    with open_source(source) as f:
+        n_max = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) + 1
+
+    codes = {col: np.empty(n_max, np.int32) for col in TEXT_COLUMNS}
+    categories = {col: {} for col in TEXT_COLUMNS}    # 字符串 → 编码，按第一次出现的顺序编号
+    dates = hours = None
+    hours_integral = True    # 和 pd.to_numeric 一样：全是整数时长就存成整数
+    columns = None
+    n = n_rejected = 0
+
+    reject_tmp = f'{reject_path}.{os.getpid()}.tmp'
+    if append_rejects and os.path.exists(reject_path):
+        with open(reject_path, 'rb') as old, open(reject_tmp, 'wb') as new:
+            new.write(old.read())
+        write_header = False
+    else:
+        write_header = True
+
+    with open_source(source) as f, open(reject_tmp, 'a', newline='', encoding='utf-8-sig') as rf, \
+            warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', pd.errors.ParserWarning)
+        for raw in pd.read_csv(f, dtype=str, chunksize=chunk_rows or n_max, on_bad_lines='warn'):
+            chunk = raw.rename(columns=CSV_COLUMNS)
+            if columns is None:
+                columns = list(chunk.columns)
+                if write_header:
+                    csv.writer(rf).writerow(['拒收原因'] + list(raw.columns))
+
+            # 学号重复度高：按这一块里不重复的值清洗，再用编码展开；缺失的学号清洗后是 ''（和 parse_records_csv 一样）
+            phone_codes, phone_values = pd.factorize(chunk['phone'])
+            phone_values = phone_values.str.replace(r'\D', '', regex=True).tolist() + ['']   # 同 normalize_phone
+            phone_codes = np.where(phone_codes < 0, len(phone_values) - 1, phone_codes)
+            phone_bad = np.array([v == '' for v in phone_values])
+            phone_bad[-1] = False
+            if date_format is None:
+                first_date = chunk['activity_date'].dropna()
+                date_format = guess_datetime_format(first_date.iloc[0]) if len(first_date) else None
+            date = pd.to_datetime(chunk['activity_date'], format=date_format, errors='coerce')
+            hour = pd.to_numeric(chunk['hours'], errors='coerce')
+
+            reason = np.select(
+                [phone_bad[phone_codes],
+                 chunk['activity_date'].notna().to_numpy() & date.isna().to_numpy(),
+                 chunk['hours'].notna().to_numpy() & hour.isna().to_numpy()],
+                ['学号里没有数字', '日期格式不对', '时长不是数字'], '')
+            bad = reason != ''
+            if bad.any():
+                rejected = raw[bad]
+                rejected.insert(0, '拒收原因', reason[bad])
+                rejected.to_csv(rf, header=False, index=False)
+                n_rejected += int(bad.sum())
+                keep = ~bad
+                chunk, phone_codes, date = chunk[keep], phone_codes[keep], date[keep]
+                hour = pd.to_numeric(chunk['hours'])
+            m = len(chunk)
+
+            for col in TEXT_COLUMNS:
+                if col == 'phone':
+                    local_codes, uniques = phone_codes, phone_values
+                else:
+                    local_codes, uniques = pd.factorize(chunk[col])   # 缺失值编码 -1
+                    uniques = uniques.tolist()
+                # 这一块的编码换成全局编码；只登记真正出现的值（被拒收的行里的值不进类别表）
+                used = np.zeros(len(uniques) + 1, bool)
+                used[local_codes] = True
+                to_global = np.full(len(uniques) + 1, -1, np.int32)   # 最后一位给 -1（缺失值）
+                mapping = categories[col]
+                for i in np.flatnonzero(used[:-1]):
+                    to_global[i] = mapping.setdefault(uniques[i], len(mapping))
+                codes[col][n:n + m] = to_global[local_codes]
+
+            if dates is None:
+                dates = np.empty(n_max, date.dtype)
+                hours = np.empty(n_max, np.float64)
+            dates[n:n + m] = date.to_numpy()
+            hours_integral &= hour.dtype.kind in 'iu'
+            hours[n:n + m] = hour.fillna(0.0).to_numpy()
+            n += m
+
+    # 列数不对的行 pandas 直接跳过，只给一条警告（“Skipping line 行号: ...”，行号按记录数、含表头）；
+    # 事后按行号把原始内容找回来写进拒收文件
+    bad_lines = {}
+    for w in caught:
+        for line_no, detail in re.findall(r'line (\d+): (.+)', str(w.message)):
+            bad_lines[int(line_no)] = detail.strip()
+    if bad_lines:
+        with open_source(source) as f, open(reject_tmp, 'a', newline='', encoding='utf-8-sig') as rf:
+            writer = csv.writer(rf)
+            for line_no, fields in enumerate(csv.reader(io.TextIOWrapper(f, encoding='utf-8-sig', newline='')), 1):
+                if line_no in bad_lines:
+                    writer.writerow([f'列数不对（{bad_lines[line_no]}）'] + fields)
+        n_rejected += len(bad_lines)
+
+    if n_rejected or (append_rejects and not write_header):
+        os.replace(reject_tmp, reject_path)
+    else:
+        os.remove(reject_tmp)
+        if os.path.exists(reject_path):
+            os.remove(reject_path)     # 上次的拒收文件已经过时了
+
+    data = {}
+    for col in columns:
+        if col in categories:
+            cats = pd.Index(list(categories[col]), dtype=str)
+            # 类别表按字典序排好，和 astype('category') 得到的一模一样（快照、编码顺序都一致）
+            data[col] = pd.Categorical.from_codes(codes[col][:n], cats, validate=False).reorder_categories(cats.sort_values())
+        elif col == 'activity_date':
+            data[col] = dates[:n]
+        elif col == 'hours':
+            data[col] = hours[:n].astype(np.int64) if hours_integral else hours[:n]
+    df = pd.DataFrame(data)
+    return add_row_features(df), date_format, n_rejected
+
+
+def snapshot_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + '.snapshot.npz'
+
+
+def snapshot_config_key() -> str:
+    return hashlib.sha1(
+        json.dumps([SNAPSHOT_FORMAT, TYPE_KEYS, ACTIVE_DAYS_WEIGHT, [t[0] for t in KEYWORD_TAGS]],
+                   ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+
+
+def report_config_key() -> str:
+    """影响报告内容的代码版本和配置；预计算报告库的版本 = 数据版本 + 这个"""
+    return hashlib.sha1(
+        json.dumps([REPORT_FORMAT, TYPE_KEYS, ACTIVE_DAYS_WEIGHT, KEYWORD_TAGS], ensure_ascii=False).encode('utf-8')
+    ).hexdigest()[:8]
+
+
+def write_snapshot(csv_path: str, df: pd.DataFrame, csv_info: dict):
+    try:
+        save_snapshot(snapshot_path(csv_path), df, {"config": snapshot_config_key(), **csv_info})
+    except OSError as e:
+        print(f"[snapshot] 写快照失败（不影响使用，下次启动仍会解析 CSV）：{e}")
+
+
+def hash_file(f, limit: int = None):
+    """按块读文件算 sha1（不把整份文件读进内存），limit 是最多读多少字节；返回 hashlib 对象，可以接着 update"""
+    sha1 = hashlib.sha1()
+    while limit is None or limit > 0:
+        block = f.read(1 << 20 if limit is None else min(1 << 20, limit))
+        if not block:
+            break
+        sha1.update(block)
+        if limit is not None:
+            limit -= len(block)
+    return sha1
+
+
+def ingest_records(source, csv_path: str, chunked: bool, date_format=None, append: bool = False):
+    """
+    解析 + 清洗 + 校验，有拒收行时打一行日志；返回 (df, 日期格式)。
+    chunked（文件达到 STREAM_INGEST_MIN_BYTES）时分块读，否则整份一次读——只是读法不同，校验和拒收文件一样。
+    """
+    reject_path = rejects_path(csv_path)
+    df, date_format, n_rejected = ingest_records_stream(source, reject_path, date_format, append_rejects=append,
+                                                        chunk_rows=STREAM_INGEST_CHUNK_ROWS if chunked else None)
+    if n_rejected:
+        print(f"[data] {n_rejected} 行格式不对，没有载入，见 {reject_path}")
+    return df, date_format
 
-    # 2. 加载协会公共数据（总时长、总活动数、部门文案、致信文案等）
-    if os.path.exists(ORG_STATS_PATH):
-        with open(ORG_STATS_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+
+def load_records(csv_path: str):
+    """
+    读取志愿流水账，返回 (df, csv_info)，csv_info 含 size / mtime_ns / sha1 / date_format。
+    优先用二进制快照：大小 + mtime 都对得上直接读快照；mtime 变了但内容哈希一样也用快照；
+    否则走慢路径解析 + 校验 CSV（ingest_records，格式不对的行进拒收文件），顺便重写快照。
+    派生字段依赖 TYPE_KEYS / ACTIVE_DAYS_WEIGHT，这两个配置也算进快照的 key 里。
+    """
+    snap_path = snapshot_path(csv_path)
+    st = os.stat(csv_path)
+    config_key = snapshot_config_key()
+
+    meta = read_snapshot_meta(snap_path) if os.path.exists(snap_path) else None
+    if meta and meta.get('config') == config_key and meta.get('size') == st.st_size:
+        if meta.get('mtime_ns') == st.st_mtime_ns:
+            return load_snapshot(snap_path), {k: meta[k] for k in ('size', 'mtime_ns', 'sha1', 'date_format')}
+
+    streaming = st.st_size >= STREAM_INGEST_MIN_BYTES
+    with open(csv_path, 'rb') as f:
+        if streaming:
+            csv_bytes = None
+            csv_sha1 = hash_file(f).hexdigest()
+            size = f.tell()
+        else:
+            csv_bytes = f.read()
+            csv_sha1 = hashlib.sha1(csv_bytes).hexdigest()
+            size = len(csv_bytes)
+
+    if meta and meta.get('config') == config_key and meta.get('sha1') == csv_sha1:
+        # 只是 mtime 变了（比如重新拷贝了一遍），内容没变
+        df, date_format = load_snapshot(snap_path), meta['date_format']
     else:
-        # 没填就给一份默认的兜底数据，后续可以改成读文件
-        data = {
-            "total_org_hours": "12580",
-            "total_events": "86",
-            "total_people": "1200+",
-            "public_gallery": [],
-            "dept_summaries": {  # 四个部门 50 字总结，用于小游戏弹窗
-                "支教": "这一年，我们用粉笔和笑声点亮了三省五地的课堂。",
-                "关怀": "这一年，我们陪伴了无数个孤独的黄昏和清晨。",
-                "环保": "这一年，我们用行动让星河更清澈。",
-                "心之旅": "这一年，我们在一次次对话中，拥抱彼此的情绪。"
-            },
-            "dept_letters": {  # 不同主力部门给志愿者的信（分行展示）
-                "支教": [
-                    "见字如面，小小的粉笔，曾在你的指尖跳舞。",
-                    "因为有你，那些偏远的教室，多了一束温柔的光。"
-                ],
-                "关怀": [
-                    "你走进的每一间屋子，都悄悄改变了那里的空气。",
-                    "你握住的每一只手，都把冬天拉近了春天。"
-                ],
-                "环保": [
-                    "你弯下腰捡起的一片片垃圾，是守护星河的最初一步。",
-                    "山川湖海，会记得你轻轻的守护。"
-                ],
-                "心之旅": [
-                    "你愿意听别人说话的样子，本身就是一种很温柔的力量。",
-                    "愿你也被温柔以待，在倾听别人的同时，好好照顾自己。"
-                ],
-                "其他": [
-                    "你可能已经忘记那些被你填满的周末，但时光记得。",
-                    "谢谢你在忙碌的日子里，仍然愿意把时间留给公益。"
-                ]
-            }
+        # 大文件从磁盘分块读；小文件上面已经整份读进来了，直接用这份 bytes
+        df, date_format = ingest_records(csv_path if streaming else csv_bytes, csv_path, streaming)
+
+    csv_info = {"size": size, "mtime_ns": st.st_mtime_ns, "sha1": csv_sha1, "date_format": date_format}
+    write_snapshot(csv_path, df, csv_info)
+    return df, csv_info
+
+
+def concat_records(df: pd.DataFrame, df_new: pd.DataFrame) -> pd.DataFrame:
+    """把新解析的行拼到已有数据后面；文本列合并字符串表，已有的编码保持不变"""
+    merged = pd.concat([df.drop(columns=TEXT_COLUMNS), df_new.drop(columns=TEXT_COLUMNS)], ignore_index=True)
+    for col in TEXT_COLUMNS:
+        merged[col] = union_categoricals([df[col], df_new[col]])
+    return merged[df.columns]
+
+
+def read_appended_records(csv_path: str, df: pd.DataFrame, csv_info: dict):
+    """
+    CSV 只是在末尾追加了若干行（原有内容逐字节不变）时，只解析追加的那一段，
+    拼到现有数据后面，返回 (df, csv_info)；不是纯追加就返回 None，由调用方整份重读。
+    """
+    with open(csv_path, 'rb') as f:
+        sha1 = hash_file(f, csv_info['size'])
+        head_size = f.tell()
+        tail = f.read()
+        f.seek(max(head_size - 1, 0))
+        head_last = f.read(1)
+        f.seek(0)
+        header = f.readline()
+    mtime_ns = os.stat(csv_path).st_mtime_ns
+
+    if not tail or head_last != b'\n' or sha1.hexdigest() != csv_info['sha1']:
+        return None
+
+    size = head_size + len(tail)
+    # 和整份重读一样清洗 + 校验，格式不对的新行追加到拒收文件
+    df_new, _ = ingest_records(header + tail, csv_path, size >= STREAM_INGEST_MIN_BYTES, csv_info['date_format'],
+                               append=True)
+    df = concat_records(df, df_new)
+
+    sha1.update(tail)
+    new_info = {"size": size, "mtime_ns": mtime_ns, "sha1": sha1.hexdigest(),
+                "date_format": csv_info['date_format']}
+    write_snapshot(csv_path, df, new_info)
+    return df, new_info
+
+
+def load_org_stats(path: str):
+    """加载协会公共数据（公共相册、部门文案、致信文案等），返回 (data, org_info)"""
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            org_bytes = f.read()
+        st = os.stat(path)
+        org_info = {"size": len(org_bytes), "mtime_ns": st.st_mtime_ns, "sha1": hashlib.sha1(org_bytes).hexdigest()}
+        return json.loads(org_bytes.decode('utf-8')), org_info
+
+    # 没填就给一份默认的兜底数据，后续可以改成读文件（总时长 / 活动场数 / 人数由 Dataset 从流水账算出来补上）
+    data = {
+        "public_gallery": [],
+        "dept_summaries": {  # 四个部门 50 字总结，用于小游戏弹窗
+            "支教": "这一年，我们用粉笔和笑声点亮了三省五地的课堂。",
+            "关怀": "这一年，我们陪伴了无数个孤独的黄昏和清晨。",
+            "环保": "这一年，我们用行动让星河更清澈。",
+            "心之旅": "这一年，我们在一次次对话中，拥抱彼此的情绪。"
+        },
+        "dept_letters": {  # 不同主力部门给志愿者的信（分行展示）
+            "支教": [
+                "见字如面，小小的粉笔，曾在你的指尖跳舞。",
+                "因为有你，那些偏远的教室，多了一束温柔的光。"
+            ],
+            "关怀": [
+                "你走进的每一间屋子，都悄悄改变了那里的空气。",
+                "你握住的每一只手，都把冬天拉近了春天。"
+            ],
+            "环保": [
+                "你弯下腰捡起的一片片垃圾，是守护星河的最初一步。",
+                "山川湖海，会记得你轻轻的守护。"
+            ],
+            "心之旅": [
+                "你愿意听别人说话的样子，本身就是一种很温柔的力量。",
+                "愿你也被温柔以待，在倾听别人的同时，好好照顾自己。"
+            ],
+            "其他": [
+                "你可能已经忘记那些被你填满的周末，但时光记得。",
+                "谢谢你在忙碌的日子里，仍然愿意把时间留给公益。"
+            ]
         }
-    org_stats = data
+    }
+    return data, None
+
+
+def file_signature(path: str):
+    """(大小, mtime)，文件不存在为 None；用来低成本判断文件有没有变"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Dataset:
+    """
+    一份完整、自洽的数据：流水账 + 索引 + 协会公共数据 + 版本号。
+    建好之后只读；数据变了就新建一份，再由 publish_dataset 整份换上，
+    正在处理的请求继续用它手里那一份，不会读到新旧混在一起的数据。
+    """
+
+    def __init__(self, df: pd.DataFrame, org_data: dict, csv_info: dict, org_info, indexes=None, aggregates=None):
+        self.df = df
+        self.csv_info = csv_info    # CSV 的 size / mtime_ns / sha1 / date_format
+        self.org_info = org_info    # org_stats.json 的 size / mtime_ns / sha1，没有文件为 None
+        # 数据版本：CSV + org_stats 内容的哈希，数据一变就变
+        self.version = hashlib.sha1(
+            (csv_info['sha1'] + (org_info['sha1'] if org_info else '')).encode('ascii')
+        ).hexdigest()[:16]
+        # 预计算报告库按这个版本校验：数据没变但报告的生成逻辑改了，旧库一样作废
+        self.report_version = f'{self.version}-{report_config_key()}'
+
+        if indexes is None:
+            indexes = build_user_index(df), CoVolunteerIndex(df)
+        self.user_index, self.co_index = indexes
+
+        # 协会汇总和时长排名：传了上一份的就只用追加的新行更新，否则整份算
+        if aggregates is None:
+            aggregates = OrgAggregates.build(df, self.user_index, [TYPE_KEYS[cn] for cn in TYPE_CN])
+        elif aggregates.n_rows < len(df):
+            aggregates = aggregates.extend(df, self.user_index)
+        self.aggregates = aggregates
+        # 总时长 / 活动场数 / 人数等以流水账算出来的为准，org_stats.json 里手填的会被覆盖
+        self.org_stats = org_data = {**org_data, **aggregates.summary()}
+
+        # 协会公共数据单独下发（/api/org_stats），预先编码好，版本号 = 内容哈希
+        self.org_json = app.json.dumps(org_data).encode('utf-8')
+        self.org_version = hashlib.sha1(self.org_json).hexdigest()[:16]
+        # org_json 里有从流水账算出来的汇总，Last-Modified 取 CSV 和 org_stats.json 里较新的那个
+        modified_ns = max(csv_info['mtime_ns'], org_info['mtime_ns'] if org_info else 0)
+        self.org_modified = datetime.fromtimestamp(modified_ns // 10 ** 9, timezone.utc)
+
+        self.loaded_at = time.time()
+        self.load_seconds = None    # 整个加载过程用时，发布时填上
+
+    @property
+    def user_totals(self) -> dict:
+        """每人这一年的 (总时长, 活动次数)，算历年累计用（总时长和报告里的 totalHours 一致）"""
+        return self.aggregates.user_totals
+
+    @property
+    def source_signature(self):
+        org = (self.org_info['size'], self.org_info['mtime_ns']) if self.org_info else None
+        return (self.csv_info['size'], self.csv_info['mtime_ns']), org
+
+
+_publish_lock = threading.Lock()   # 换数据（发布）和后台重载互斥
+
+
+def publish_dataset(ds: Dataset, kind: str = 'full', load_seconds: float = None):
+    """整份换上新数据（换引用是原子的），然后作废旧缓存、重新对一下预计算报告库"""
+    global dataset, df_records, org_stats
+    if load_seconds is not None:
+        ds.load_seconds = load_seconds
+        data_loads.inc(kind)
+        data_load_seconds.observe(load_seconds, kind)
+
+    dataset = ds
+    df_records, org_stats = ds.df, ds.org_stats
+
+    # 数据换了，旧报告全部作废（key 里也带着版本，这里主要是把内存还回去）
+    report_cache.clear()
+    compressed_cache.clear()
+    load_report_store()
+
+
+def load_data():
+    """（重新）加载全部数据：流水账（有快照读快照）+ 协会公共数据，建好索引后整份换上"""
+    with _publish_lock:
+        start = time.perf_counter()
+        df, csv_info = load_records(CSV_PATH)
+        org_data, org_info = load_org_stats(ORG_STATS_PATH)
+        publish_dataset(Dataset(df, org_data, csv_info, org_info), 'full', time.perf_counter() - start)
+
+
+def reload_data_if_changed() -> bool:
+    """
+    检查 CSV / org_stats.json 是否有变化，有就重建一份新数据并整份换上，返回是否换了。
+    - CSV 只在末尾追加：只解析新增的行（read_appended_records）
+    - CSV 其他改动：整份重读
+    - 只改了 org_stats.json：流水账、索引和协会汇总原样复用
+    """
+    with _publish_lock:
+        ds = dataset
+        csv_sig, org_sig = file_signature(CSV_PATH), file_signature(ORG_STATS_PATH)
+        if (csv_sig, org_sig) == ds.source_signature:
+            return False
+
+        start = time.perf_counter()
+        kind = 'org'
+        df, csv_info, indexes, aggregates = ds.df, ds.csv_info, (ds.user_index, ds.co_index), ds.aggregates
+        if csv_sig != ds.source_signature[0]:
+            appended = read_appended_records(CSV_PATH, ds.df, ds.csv_info) if csv_sig[0] > ds.csv_info['size'] else None
+            kind = 'append' if appended else 'full'
+            df, csv_info = appended or load_records(CSV_PATH)
+            indexes = None
+            if not appended:
+                aggregates = None   # 追加时协会汇总只用新行更新，整份重读就重新算
+
+        org_data, org_info = ds.org_stats, ds.org_info
+        if org_sig != ds.source_signature[1]:
+            org_data, org_info = load_org_stats(ORG_STATS_PATH)
+
+        publish_dataset(Dataset(df, org_data, csv_info, org_info, indexes, aggregates), kind, time.perf_counter() - start)
+        print(f"[reload] 数据已更新：{len(ds.df)} → {len(df)} 行，版本 {ds.version} → {dataset.version}")
+        return True
+
+
+def start_data_watcher(interval: float = DATA_WATCH_INTERVAL):
+    """
+    后台线程定时检查数据文件，有变化就在后台重建并整份替换，不用重启进程。
+    同一个文件签名要连续两次看到才动手，避免读到正在写一半的文件。
+    """
+    if interval <= 0:
+        return None
+
+    def watch():
+        last_seen = None
+        while True:
+            time.sleep(interval)
+            try:
+                seen = file_signature(CSV_PATH), file_signature(ORG_STATS_PATH)
+                if seen == last_seen and seen != dataset.source_signature:
+                    reload_data_if_changed()
+                last_seen = seen
+            except Exception:
+                traceback.print_exc()
+
+    thread = threading.Thread(target=watch, name='data-watcher', daemon=True)
+    thread.start()
+    return thread
+
+
+def load_report_store():
+    """打开预计算报告库；没有、或者是旧数据 / 旧版报告格式生成的，就不用（全部实时计算）"""
+    global report_store
+    report_store = None
+    if not os.path.exists(REPORT_STORE_PATH):
+        return
+
+    store = ReportStore(REPORT_STORE_PATH)
+    if store.data_version != dataset.report_version:
+        print(f"[report_store] 报告库版本 {store.data_version} 与当前数据 / 报告格式 {dataset.report_version} 不一致，已忽略")
+        return
+    report_store = store
+
+# ====== 往年数据（按年份分区，懒加载） ======
+
+def year_csv_path(year: int) -> str:
+    return os.path.join(YEARS_FOLDER, f'{year}.csv')
+
+
+def year_org_stats_path(year: int) -> str:
+    return os.path.join(YEARS_FOLDER, f'{year}.org_stats.json')
+
+
+def available_years() -> list:
+    """有数据的年份（从新到旧）：当前年度 + years/ 目录下的 <年份>.csv"""
+    years = {REPORT_YEAR}
+    if os.path.isdir(YEARS_FOLDER):
+        for entry in os.scandir(YEARS_FOLDER):
+            m = re.fullmatch(r'(\d{4})\.csv', entry.name)
+            if m:
+                years.add(int(m.group(1)))
+    return sorted(years, reverse=True)
+
+
+def load_year_dataset(year: int) -> Dataset:
+    """
+    加载一年的往年数据：流水账（各自有快照）+ 那一年的协会公共数据，索引各建各的。
+    顺便把这一年每人的汇总存下来，之后算历年累计不用再加载这一年。
+    """
+    start = time.perf_counter()
+    df, csv_info = load_records(year_csv_path(year))
+    org_data, org_info = load_org_stats(year_org_stats_path(year))
+    ds = Dataset(df, org_data, csv_info, org_info)
+    ds.load_seconds = time.perf_counter() - start
+    data_loads.inc('year')
+    data_load_seconds.observe(ds.load_seconds, 'year')
+
+    signature = ds.source_signature[0]
+    if year_totals.get(year, signature) is None:
+        year_totals.put(year, signature, ds.user_totals)
+    return ds
+
+
+def year_dataset_stale(year: int, ds: Dataset) -> bool:
+    """往年的文件改过了（不常见，不专门盯着，用到时看一眼签名）"""
+    return (file_signature(year_csv_path(year)), file_signature(year_org_stats_path(year))) != ds.source_signature
+
+
+year_partitions = PartitionCache(load_year_dataset, YEAR_PARTITIONS_IN_MEMORY, year_dataset_stale)
+
+
+def get_year_dataset(year: int = None):
+    """某一年度的数据：不传 / 当前年度就是 dataset；往年的第一次用到时才加载；没有这一年返回 None"""
+    if year is None or year == REPORT_YEAR:
+        return dataset
+    if not os.path.isfile(year_csv_path(year)):
+        return None
+    return year_partitions.get(year)
+
+
+def get_year_totals(year: int) -> dict:
+    """某一年每人的 (总时长, 活动次数)：当前年度用 dataset 现成的；往年读存好的汇总，没有（或过时）才加载那一年"""
+    if year == REPORT_YEAR:
+        return dataset.user_totals
+    signature = file_signature(year_csv_path(year))
+    totals = year_totals.get(year, signature) if signature else None
+    if totals is None:
+        ds = get_year_dataset(year)
+        totals = ds.user_totals if ds is not None else {}
+    return totals
 
 
 load_data()
@@ -137,135 +1034,237 @@ load_data()
 
 # ====== 工具函数：统计 & 组装报告 ======
 
-def get_user_records(name: str, phone: str):
+def get_user_records(name: str, phone: str, ds: Dataset = None):
     """根据姓名 + 手机号筛选该同学的所有记录"""
     if not name or not phone:
         return pd.DataFrame([])
 
-    phone_norm = normalize_phone(phone)
-    mask = (df_records['name'] == name) & (df_records['phone'] == phone_norm)
-    return df_records[mask].sort_values('activity_date')
+    ds = ds or dataset
+    positions = ds.user_index.get((name, normalize_phone(phone)))
+    if positions is None:
+        return ds.df.iloc[[]]
+    return ds.df.iloc[positions]
 
 
-def calc_type_hours(df_user: pd.DataFrame):
-    """按活动类型统计总时长，返回：{teaching: xx, care: xx, ...}, main_type"""
-    stats = {v: 0.0 for v in TYPE_KEYS.values()}
-
-    for _, row in df_user.iterrows():
-        t = str(row['activity_type'] or '').strip()
-        hours = float(row['hours'] or 0)
-        key = TYPE_KEYS.get(t, 'others')
-        stats[key] += hours
-
-    # 主力类型：时长最多的那个维度
-    main_type_key = max(stats, key=stats.get)
-    # 反向映射回中文名
-    main_type_cn = None
-    for cn, en in TYPE_KEYS.items():
-        if en == main_type_key:
-            main_type_cn = cn
-            break
-    if not main_type_cn:
-        main_type_cn = "其他"
+def calc_stats_batch(df: pd.DataFrame, group_ids=None, n_groups: int = 1):
+    """
+    一次向量化统计：雷达图时长 / 活跃天数 / 月度时长 / 季节时长一起算。
+    group_ids 是每一行所属的组号（0 ~ n_groups-1），不传就把整张表当一组；
+    批量预计算时可以一次把所有人的统计都算出来。
+    注意：同一组内的累加顺序就是行顺序（bincount 顺序累加），
+    和逐行 iterrows 相加的浮点结果完全一致，所以行要按日期排好再传进来。
+    """
+    if '_type_code' not in df:
+        df = add_row_features(df.copy())
+
+    n_rows = len(df)
+    g = np.zeros(n_rows, np.int64) if group_ids is None else np.asarray(group_ids, np.int64)
+    hours = df['hours'].to_numpy(dtype=np.float64)
+    type_code = df['_type_code'].to_numpy(np.int64)
+    month = df['_month'].to_numpy(np.int64)
+    n_types = len(TYPE_CN)
+
+    # 雷达图：(组, 类型) 二维桶
+    type_hours = np.bincount(g * n_types + type_code, weights=hours,
+                             minlength=n_groups * n_types).reshape(n_groups, n_types)
+    days = np.bincount(g, weights=df['_est_days'].to_numpy(np.float64), minlength=n_groups)
+
+    # 月份 / 季节：只看有日期的行
+    dated = month >= 0
+    g_d, month_d, hours_d = g[dated], month[dated], hours[dated]
+    keys, inverse = np.unique(g_d * 1000000 + month_d, return_inverse=True)
+    month_hours = np.bincount(inverse, weights=hours_d, minlength=len(keys))
+    key_group = keys // 1000000
+    bounds = np.searchsorted(key_group, np.arange(n_groups + 1))
+    season_hours = np.bincount(g_d * len(SEASONS) + SEASON_OF_MONTH[month_d % 100], weights=hours_d,
+                               minlength=n_groups * len(SEASONS)).reshape(n_groups, len(SEASONS))
+
+    results = []
+    for gi in range(n_groups):
+        raw = type_hours[gi]
+        # 主力类型：时长最多的那个维度（并列取靠前的，和 max() 一致）
+        main_type_cn = TYPE_CN[int(np.argmax(raw))]
+
+        month_stats = [
+            {"month": f"{k // 100:04d}-{k % 100:02d}", "hours": round(float(h), 1)}
+            for k, h in zip(keys[bounds[gi]:bounds[gi + 1]] % 1000000,
+                            month_hours[bounds[gi]:bounds[gi + 1]])
+        ]
+        seasons = {s: float(h) for s, h in zip(SEASONS, season_hours[gi])}
+
+        results.append({
+            "stats": {TYPE_KEYS[cn]: round(float(h), 1) for cn, h in zip(TYPE_CN, raw)},
+            "main_type": main_type_cn,
+            # 为防止特别夸张，简单做一个上限
+            "total_days": min(int(days[gi]), 365),
+            "month_stats": month_stats,
+            "active_months": len(month_stats),
+            "season_hours": seasons,
+            "best_season": SEASONS[int(np.argmax(season_hours[gi]))],
+        })
+    return results
 
-    # 小数处理
-    stats = {k: round(v, 1) for k, v in stats.items()}
 
-    return stats, main_type_cn
+def calc_user_stats(df_user: pd.DataFrame):
+    """单个志愿者的统计（calc_stats_batch 只有一组的情况）"""
+    return calc_stats_batch(df_user)[0]
+
+
+def calc_type_hours(df_user: pd.DataFrame):
+    """按活动类型统计总时长，返回：{teaching: xx, care: xx, ...}, main_type"""
+    user_stats = calc_user_stats(df_user)
+    return user_stats['stats'], user_stats['main_type']
 
 
 def calc_active_days(df_user: pd.DataFrame):
     """根据活动类型估算活跃天数"""
-    days = 0
-    for _, row in df_user.iterrows():
-        t = str(row['activity_type'] or '').strip()
-        name = str(row['activity_name'] or '').strip()
-
-        # 优先看名称里有没有“夏令营”等关键词
-        if '夏令营' in name:
-            days += ACTIVE_DAYS_WEIGHT.get('夏令营', 1)
-        elif t in ACTIVE_DAYS_WEIGHT:
-            days += ACTIVE_DAYS_WEIGHT[t]
-        else:
-            days += ACTIVE_DAYS_WEIGHT.get('其他', 1)
-
-    # 为防止特别夸张，简单做一个上限
-    return min(days, 365)
+    return calc_user_stats(df_user)['total_days']
 
 
 def calc_month_stats(df_user: pd.DataFrame):
     """按月份统计服务时长，用于“志愿足迹”折线图/柱状图"""
-    month_hours = defaultdict(float)
-    for _, row in df_user.iterrows():
-        date = row['activity_date']
-        if pd.isna(date):
-            continue
-        month = date.strftime('%Y-%m')  # e.g. 2024-03
-        month_hours[month] += float(row['hours'] or 0)
+    return calc_user_stats(df_user)['month_stats']
 
-    # 排序输出
-    result = [
-        {"month": m, "hours": round(h, 1)}
-        for m, h in sorted(month_hours.items())
-    ]
-    return result
 
+def group_ids(bounds) -> np.ndarray:
+    """bounds[i]:bounds[i+1] 是第 i 组的行，返回每一行的组号"""
+    return np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
 
-def generate_tags(df_user: pd.DataFrame, total_hours: float, main_type_cn: str):
+
+def first_in_group(mask: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """每组里第一个 mask 为 True 的行号，没有的为 -1"""
+    rows = np.flatnonzero(mask)
+    uniq, first = np.unique(groups[rows], return_index=True)
+    out = np.full(n_groups, -1, np.int64)
+    out[uniq] = rows[first]
+    return out
+
+
+def date_argsort(dates: np.ndarray, ascending: bool = True) -> np.ndarray:
+    """和 df.sort_values('activity_date', ascending=...) 一样的行顺序（快排，缺失的放最后，并列的先后也一样）"""
+    nat = np.isnat(dates)
+    idx = np.flatnonzero(~nat)
+    values = dates[idx]
+    if not ascending:
+        idx, values = idx[::-1], values[::-1]
+    order = idx[values.argsort(kind='quicksort')]
+    if not ascending:
+        order = order[::-1]
+    return np.concatenate([order, np.flatnonzero(nat)])
+
+
+def sort_by_date_within_groups(dates: np.ndarray, bounds, ascending: bool = True) -> np.ndarray:
     """
-    升级版标签生成：返回 [{"name": "标签名", "desc": "解释文案"}, ...]
+    每组各自按日期排序后的行号（组与组的位置不变），和逐组 date_argsort 的结果一样。
+    组内日期已经严格递增、缺失的都在最后（按 user_index 取出来的就是这样）时顺序是确定的，直接算出来；
+    有并列或乱序的组才逐组真的排一次（快排对并列的先后有自己的规律，要照着它来）。
     """
-    # 默认兜底
-    default_tags = [
-        {"name": "星火初燃", "desc": "这是你志愿旅程的起点，星星之火，终将燎原。"},
-        {"name": "全能帮手", "desc": "哪里需要去哪里，你是团队中不可或缺的万能砖。"},
-        {"name": "新手上路", "desc": "欢迎加入志愿大家庭，未来的路我们一起走。"},
-        {"name": "冬日限定", "desc": "在这个冬天，你留下了温暖的足迹。"}
-    ]
+    groups = group_ids(bounds)
+    pos = np.arange(len(dates))
+    nat = np.isnat(dates)
+    same = groups[1:] == groups[:-1]
+    messy = same & ~nat[1:] & (nat[:-1] | ~(dates[1:] > dates[:-1]))
+
+    if ascending:
+        order = np.arange(len(dates))
+    else:
+        # 有日期的倒过来，缺失的保持原来的先后放在最后
+        order = np.lexsort((np.where(nat, pos, -pos), nat, groups))
+    for gi in np.unique(groups[1:][messy]):
+        a, b = bounds[gi], bounds[gi + 1]
+        order[a:b] = a + date_argsort(dates[a:b], ascending)
+    return order
+
+
+def format_dates(dates: np.ndarray, fmt: str) -> np.ndarray:
+    """datetime64 数组按 strftime 格式转成文本，缺失的是空字符串"""
+    text = pd.DatetimeIndex(dates).strftime(fmt).to_numpy(dtype=object)
+    text[np.isnat(dates)] = ""
+    return text
+
+
+def category_texts(series: pd.Series, missing: str = "") -> np.ndarray:
+    """category 列每一行的文本（str），缺失的是 missing"""
+    return category_lookup(series, np.asarray(series.cat.categories.astype(str), dtype=object), missing)
+
 
+def stripped_type_ids(series: pd.Series):
+    """
+    activity_type 去掉首尾空格后的编号（同一个类型写法不同、多了空格的算一个），空的 / 缺失的为 -1；
+    返回 (每行的编号, 编号个数)
+    """
+    texts = series.cat.categories.astype(str).str.strip()
+    ids, uniques = pd.factorize(texts)
+    empty = np.flatnonzero(uniques == '')
+    ids = np.where(np.isin(ids, empty), -1, ids)
+    return category_lookup(series, ids, -1), max(len(uniques), 1)
+
+
+def ensure_report_columns(df_user: pd.DataFrame) -> pd.DataFrame:
+    """单个人的记录（可能是外面传进来的普通 DataFrame）补上 category 编码和派生字段，批量函数才能直接用"""
+    if not isinstance(df_user['activity_type'].dtype, pd.CategoricalDtype) \
+            or not isinstance(df_user['activity_name'].dtype, pd.CategoricalDtype):
+        df_user = encode_text_columns(df_user.copy())
+    if '_kw_mask' not in df_user or '_est_days' not in df_user:
+        df_user = add_row_features(df_user.copy())
+    return df_user
+
+
+DEFAULT_TAGS = [
+    {"name": "星火初燃", "desc": "这是你志愿旅程的起点，星星之火，终将燎原。"},
+    {"name": "全能帮手", "desc": "哪里需要去哪里，你是团队中不可或缺的万能砖。"},
+    {"name": "新手上路", "desc": "欢迎加入志愿大家庭，未来的路我们一起走。"},
+    {"name": "冬日限定", "desc": "在这个冬天，你留下了温暖的足迹。"}
+]
+
+
+def generate_tags(df_user: pd.DataFrame, total_hours: float, main_type_cn: str, user_stats=None):
+    """
+    升级版标签生成：返回 [{"name": "标签名", "desc": "解释文案"}, ...]
+    user_stats 是 calc_user_stats 的结果，调用方已经算过就直接传进来
+    """
     if df_user is None or df_user.empty:
-        return default_tags[:4]
-
-    # ---- 基础数据准备 (保持原有逻辑) ----
-    df = df_user.copy()
-    df['activity_type'] = df['activity_type'].astype(str).fillna("").str.strip()
-    df['activity_name'] = df['activity_name'].astype(str).fillna("").str.strip()
-    df['_hours_f'] = pd.to_numeric(df.get('hours', 0), errors='coerce').fillna(0.0)
-
-    event_cnt = int(len(df))
-    uniq_types = sorted(set([t for t in df['activity_type'].tolist() if t]))
-    type_cnt = len(uniq_types)
-
-    # 计算月份
-    df_valid_date = df[df['activity_date'].notna()].copy()
-    if not df_valid_date.empty:
-        df_valid_date['_month'] = df_valid_date['activity_date'].dt.strftime('%Y-%m')
-        active_months = int(df_valid_date['_month'].nunique())
-    else:
-        active_months = 0
+        return DEFAULT_TAGS[:4]
+
+    df_user = ensure_report_columns(df_user)
+    if user_stats is None:
+        user_stats = calc_user_stats(df_user)
+    return generate_tags_batch(df_user, [0, len(df_user)], [total_hours], [main_type_cn], [user_stats])[0]
+
+
+def generate_tags_batch(df: pd.DataFrame, bounds, total_hours, main_types, all_stats):
+    """
+    一批人的标签，bounds[i]:bounds[i+1] 是第 i 个人的行（每人至少一行），结果和逐人 generate_tags 一样。
+    要扫记录的几项（参加次数、涉及几类活动、命中的关键词彩蛋）整批一次算完，再逐人挑标签。
+    """
+    bounds = np.asarray(bounds)
+    n = len(bounds) - 1
+    groups = group_ids(bounds)
+
+    event_cnt = np.diff(bounds)
+    type_ids, n_type_ids = stripped_type_ids(df['activity_type'])
+    known = type_ids >= 0
+    pairs = np.unique(groups[known] * n_type_ids + type_ids[known])
+    type_cnt = np.bincount(pairs // n_type_ids, minlength=n)
+    # 关键词彩蛋：每个活动名命中哪些关键词加载时已经算好（_kw_mask），按人位或
+    kw_masks = np.bitwise_or.reduceat(df['_kw_mask'].to_numpy(), bounds[:-1]) if n else []
+
+    return [pick_tags(*args) for args in zip(total_hours, main_types, all_stats,
+                                              event_cnt.tolist(), type_cnt.tolist(), np.asarray(kw_masks).tolist())]
+
+
+def pick_tags(total_hours: float, main_type_cn: str, user_stats: dict, event_cnt: int, type_cnt: int, kw_mask: int):
+    """按一个人的汇总数据挑出最多 5 个标签"""
+    active_months = user_stats['active_months']
 
     # 计算主力和占比
-    stats_map, _ = calc_type_hours(df)  # 假设 calc_type_hours 存在
+    stats_map = user_stats['stats']
     total_by_type = sum(stats_map.values()) if stats_map else 0.0
     main_key = TYPE_KEYS.get(main_type_cn, 'others')
     main_share = float(stats_map.get(main_key, 0.0)) / float(total_by_type) if total_by_type > 0 else 0
 
-    # 季节计算
-    season_hours = {"春": 0.0, "夏": 0.0, "秋": 0.0, "冬": 0.0}
-    for _, row in df.iterrows():
-        date = row.get('activity_date')
-        if pd.isna(date): continue
-        m = int(date.month)
-        h = float(row.get('_hours_f', 0.0) or 0.0)
-        if m in [3, 4, 5]:
-            season_hours["春"] += h
-        elif m in [6, 7, 8]:
-            season_hours["夏"] += h
-        elif m in [9, 10, 11]:
-            season_hours["秋"] += h
-        else:
-            season_hours["冬"] += h
-    best_season = max(season_hours, key=season_hours.get) if season_hours else "冬"
+    # 季节
+    best_season = user_stats['best_season']
 
     # ---- 候选池构建 (tag, weight, description) ----
     candidates = []
@@ -322,16 +1321,8 @@ def generate_tags(df_user: pd.DataFrame, total_hours: float, main_type_cn: str):
     candidates.append((season_tag_map.get(best_season, f"{best_season}日限定"), 40, season_desc.get(best_season, "")))
 
     # 5. 关键词彩蛋
-    names_join = " ".join(df['activity_name'].tolist())
-    keyword_tags = [
-        (r"商火相传", "薪火引路人", 60, "商火相传限定称号。你是新生的引路人，接过传承的火炬，用陪伴温暖了他们的初秋。"),
-        (r"夏令营", "筑梦师", 62, "何处是中国·筑梦夏令营限定称号。感谢你为孩子们筑起了梦想的城堡。"),
-        (r"支教|课堂|授课", "课堂派", 52, "活跃在三尺讲台，传播知识的种子。"),
-        (r"探访|陪伴|慰问", "陪伴系", 52, "你的陪伴，是这一年最长情的告白。"),
-        (r"环保|巡河|净滩", "地球合伙人", 52, "为了蔚蓝澄净的世界，你一直在努力。"),
-    ]
-    for pattern, tag, w, desc in keyword_tags:
-        if re.search(pattern, names_join):
+    for i, (_, tag, w, desc) in enumerate(KEYWORD_TAGS):
+        if kw_mask >> i & 1:
             candidates.append((tag, w, desc))
 
     # ---- 筛选逻辑 ----
@@ -358,7 +1349,7 @@ def generate_tags(df_user: pd.DataFrame, total_hours: float, main_type_cn: str):
 
     # 如果不足4个 (极端情况)，用默认补
     while len(final_tags) < 5:
-        for d in default_tags:
+        for d in DEFAULT_TAGS:
             if d['name'] not in [t['name'] for t in final_tags]:
                 final_tags.append(d)
                 if len(final_tags) >= 5: break
@@ -366,6 +1357,84 @@ def generate_tags(df_user: pd.DataFrame, total_hours: float, main_type_cn: str):
     return final_tags[:5]
 
 
+def expand_to_daily_rows(df_sorted: pd.DataFrame):
+    """
+    把每条活动按持续天数线性摊到每天（np.repeat 一次展开，不逐天构造）：
+    - activity_date 视为结束日
+    - start_date = end_date - (est_days - 1)
+    - 每天 hours = 总 hours / est_days
+    返回按 day 排好序的几列数组（没有有效日期时返回 None）：
+    - day: 这一天的日期（datetime64）
+    - hours_day: 这一天分摊到的小时数
+    - activity_name: 原活动名（用于里程碑文案引用）
+    """
+    valid = df_sorted['activity_date'].notna().to_numpy()
+    est_days = np.maximum(df_sorted['_est_days'].to_numpy(np.int64)[valid], 1)
+    n_days = int(est_days.sum())
+    if n_days == 0:
+        return None
+
+    # 注意：generate_milestones 里调用时 _hours_f 还没赋值（第 3 步才算），和原来逐行版本一样按 0 处理
+    if '_hours_f' in df_sorted:
+        total_h = df_sorted['_hours_f'].to_numpy(np.float64)[valid]
+    else:
+        total_h = np.zeros(len(est_days))
+
+    end_day = df_sorted['activity_date'].dt.normalize().to_numpy()[valid]
+    names = category_texts(df_sorted['activity_name'])[valid]
+
+    # 每条活动展开成 est_days 行；结束日是最后一天，所以第 i 行往前推 est_days-1-i 天
+    block_start = np.repeat(np.cumsum(est_days) - est_days, est_days)
+    days_back = np.repeat(est_days - 1, est_days) - (np.arange(n_days) - block_start)
+    day = np.repeat(end_day, est_days) - days_back.astype('timedelta64[D]')
+
+    # 和原来 DataFrame.sort_values("day") 同一种排序（快排），同一天的先后顺序也一致
+    order = day.argsort(kind='quicksort')
+    return {
+        "day": day[order],
+        "hours_day": np.repeat(total_h / est_days, est_days)[order],
+        "activity_name": np.repeat(names, est_days)[order],
+    }
+
+
+def threshold_milestones(daily) -> list:
+    """累计时长首次达成 1/10/30/50/100 小时的那几天（档位可调）"""
+    thresholds = [1, 10, 30, 50, 100]
+    title_map = {
+        1: "点亮第一小时",
+        10: "十时成就",
+        50: "半百见证",
+        100: "百时成就"
+    }
+    milestones = []
+    # 累计时长的前缀和；取前缀最大值保证单调，searchsorted 找到每个档位第一次达到的那一天
+    cum = np.cumsum(daily["hours_day"])
+    reach_idx = np.searchsorted(np.maximum.accumulate(cum), thresholds, side='left')
+    for th, i in zip(thresholds, reach_idx):  # 档位从小到大，达成日期也就从早到晚
+        if i < len(cum):
+            milestones.append({
+                "date": pd.Timestamp(daily["day"][i]).strftime('%Y.%m.%d'),
+                "title": title_map.get(th, f"{th}小时里程碑"),
+                "content": f"在「{daily['activity_name'][i]}」的过程中，你的累计时长首次达到 {th} 小时。"
+            })
+    return milestones
+
+
+def busiest_month_milestone(daily) -> list:
+    """某月累计时长最高（按“自 1970 年起的第几个月”分组求和）"""
+    month_no = daily["day"].astype('datetime64[M]').astype(np.int64)
+    month_sum = pd.Series(daily["hours_day"]).groupby(month_no).sum().sort_values(ascending=False)
+    if month_sum.empty or float(month_sum.iloc[0]) <= 0:
+        return []
+    best_month = f"{1970 + month_sum.index[0] // 12:04d}-{month_sum.index[0] % 12 + 1:02d}"
+    best_hours = float(month_sum.iloc[0])
+    return [{
+        "date": "",
+        "title": "最忙的月份",
+        "content": f"{best_month} 你累计服务 {best_hours:g} 小时——那个月，你一定很闪亮。"
+    }]
+
+
 def generate_milestones(df_user: pd.DataFrame, total_hours: float):
     """
     生成更多条里程碑（会自动根据数据“有则展示、无则跳过”）：
@@ -379,284 +1448,234 @@ def generate_milestones(df_user: pd.DataFrame, total_hours: float):
     - 最忙月份：某月累计时长最高
     - 暖心收官
     """
-    milestones = []
     if df_user.empty:
-        return milestones
-
-    # 确保按日期排序（你的上游 get_user_records 已排序，这里再保险）
-    df_user = df_user.sort_values('activity_date').copy()
-
-    def fmt_date(dt):
-        return dt.strftime('%Y.%m.%d') if (dt is not None and not pd.isna(dt)) else ""
-
-    def safe_str(x):
-        return str(x) if x is not None and not pd.isna(x) else ""
-
-    def expand_to_daily_rows(df_sorted: pd.DataFrame) -> pd.DataFrame:
-        """
-        把每条活动按持续天数线性摊到每天：
-        - activity_date 视为结束日
-        - start_date = end_date - (est_days - 1)
-        - 每天 hours = 总 hours / est_days
-        返回字段：
-        - day: 这一天的日期
-        - hours_day: 这一天分摊到的小时数
-        - activity_name/activity_type: 原活动信息（用于里程碑文案引用）
-        """
-        rows = []
-        for _, row in df_sorted.iterrows():
-            end_dt = row.get('activity_date')
-            if pd.isna(end_dt):
-                continue
-
-            est_days = int(row.get('_est_days', 1) or 1)
-            est_days = max(est_days, 1)
-
-            total_h = float(row.get('_hours_f', 0.0) or 0.0)
-            h_day = total_h / est_days if est_days > 0 else 0.0
-
-            # 结束日记录的是最后一天，所以往前推 est_days-1 天
-            start_dt = end_dt - pd.Timedelta(days=(est_days - 1))
-
-            for i in range(est_days):
-                day = start_dt + pd.Timedelta(days=i)
-                rows.append({
-                    "day": day.normalize(),
-                    "hours_day": h_day,
-                    "activity_name": safe_str(row.get("activity_name")),
-                    "activity_type": safe_str(row.get("activity_type")),
-                    "end_date": end_dt.normalize(),
-                })
-
-        df_daily = pd.DataFrame(rows)
-        if df_daily.empty:
-            return df_daily
-
-        df_daily = df_daily.sort_values("day").reset_index(drop=True)
-        return df_daily
-
-    def estimate_days(row) -> int:
-        """
-        按 ACTIVE_DAYS_WEIGHT 推算“该活动持续天数”：
-        """
-        t = safe_str(row.get('activity_type', '')).strip()
-        n = safe_str(row.get('activity_name', '')).strip()
-        if '夏令营' in n:
-            return int(ACTIVE_DAYS_WEIGHT.get('夏令营', 1))
-        if t in ACTIVE_DAYS_WEIGHT:
-            return int(ACTIVE_DAYS_WEIGHT.get(t, 1))
-        return int(ACTIVE_DAYS_WEIGHT.get('其他', 1))
-
-    # ---- 1) 初次相遇 ----
-    first = df_user.iloc[0]
-    milestones.append({
-        "date": fmt_date(first.get('activity_date')),
-        "title": "志愿启程",
-        "content": f"那一天，你在「{safe_str(first.get('activity_name'))}」留下了第一条志愿记录。"
-    })
-
-    # ---- 2) 连续投入：若某条活动推算天数 > 1，则记录“持续 X 天” ----
-    df_user['_est_days'] = df_user.apply(estimate_days, axis=1)
-    df_multi_day = df_user[df_user['_est_days'] > 1]
-    df_daily = expand_to_daily_rows(df_user)
-
-    if not df_multi_day.empty:
-        row = df_multi_day.iloc[0]  # 第一条“多日活动”
-        milestones.append({
-            "date": fmt_date(row.get('activity_date')),
-            "title": "连续投入",
-            "content": f"在「{safe_str(row.get('activity_name'))}」中，你持续投入了 {int(row['_est_days'])} 天，把热爱变成了坚持。"
-        })
+        return []
+    return generate_milestones_batch(ensure_report_columns(df_user), [0, len(df_user)])[0]
 
-    # ---- 3) 高光时刻：单次服务时长最高（改表述，不再“一口气”）----
-    # 注意：df_user['hours'] 在 load_data 里已转数值；这里再保险转 float
-    df_user['_hours_f'] = pd.to_numeric(df_user.get('hours', 0), errors='coerce').fillna(0.0)
-    idx_max_h = df_user['_hours_f'].idxmax()
-    max_h_row = df_user.loc[idx_max_h]
-    if float(max_h_row['_hours_f']) > 0:
-        d = int(max_h_row['_est_days']) if '_est_days' in max_h_row else estimate_days(max_h_row)
-        h = float(max_h_row['_hours_f'])
-        # 让文案更符合“多日活动”的语境
-        if d > 1:
-            content = f"在「{safe_str(max_h_row.get('activity_name'))}」这段 {d} 天的旅程里，你累计贡献了 {h:g} 小时，真的很燃！"
-        else:
-            content = f"在「{safe_str(max_h_row.get('activity_name'))}」中，你贡献了 {h:g} 小时，这是你的高光时刻。"
-        milestones.append({
-            "date": fmt_date(max_h_row.get('activity_date')),
-            "title": "高光时刻",
-            "content": content
-        })
 
-    # ---- 4) 深度项目：单次持续天数最高 ----
-    idx_max_d = df_user['_est_days'].idxmax()
-    max_d_row = df_user.loc[idx_max_d]
-    if int(max_d_row['_est_days']) > 1:
+def generate_milestones_batch(df: pd.DataFrame, bounds):
+    """
+    一批人的里程碑（见 generate_milestones），bounds[i]:bounds[i+1] 是第 i 个人的行（每人至少一行）。
+    每人先按日期排好（和 sort_values('activity_date') 一样），“第一条 / 第一条多日活动 / 时长最高 /
+    天数最高 / 次数最多的活动 / 第 3 类活动 / 最后一条”都对整批一次找出来，最后逐人拼文案。
+    """
+    bounds = np.asarray(bounds)
+    n = len(bounds) - 1
+    groups = group_ids(bounds)
+    df = df.iloc[sort_by_date_within_groups(df['activity_date'].to_numpy(), bounds)]
+
+    dates = format_dates(df['activity_date'].to_numpy(), '%Y.%m.%d')
+    names = category_texts(df['activity_name'])
+    est_days = df['_est_days'].to_numpy(np.int64)
+    # 注意：df['hours'] 在 load_data 里已转数值；这里再保险转 float
+    hours = pd.to_numeric(df['hours'], errors='coerce').fillna(0.0).to_numpy()
+    firsts, lasts = bounds[:-1], bounds[1:] - 1
+
+    first_multi_day = first_in_group(est_days > 1, groups, n)
+    max_hours = first_in_group(hours == np.maximum.reduceat(hours, firsts)[groups], groups, n)
+    max_days = first_in_group(est_days == np.maximum.reduceat(est_days, firsts)[groups], groups, n)
+
+    # 高频活动：按活动名计数（缺失的不算），次数最多的那个，并列取先出现的
+    act_codes = df['activity_name'].cat.codes.to_numpy().astype(np.int64)
+    n_acts = max(len(df['activity_name'].cat.categories), 1)
+    named = np.flatnonzero(act_codes >= 0)
+    uniq, first_named, counts = np.unique(groups[named] * n_acts + act_codes[named],
+                                          return_index=True, return_counts=True)
+    order = np.lexsort((named[first_named], -counts, uniq // n_acts))
+    heads = order[np.r_[True, np.diff(uniq[order] // n_acts) != 0]] if len(order) else order   # 每人排在最前的那个
+    top_count = np.zeros(n, np.int64)
+    top_row = np.zeros(n, np.int64)
+    top_count[uniq[heads] // n_acts] = counts[heads]
+    top_row[uniq[heads] // n_acts] = named[first_named][heads]
+
+    # 多元参与：去掉首尾空格后不同的活动类型，第 3 种第一次出现的那一行
+    type_ids, n_type_ids = stripped_type_ids(df['activity_type'])
+    known = np.flatnonzero(type_ids >= 0)
+    uniq, first_known = np.unique(groups[known] * n_type_ids + type_ids[known], return_index=True)
+    type_group, type_first = uniq // n_type_ids, known[first_known]
+    type_cnt = np.bincount(type_group, minlength=n)
+    order = np.lexsort((type_first, type_group))
+    rank = np.arange(len(order)) - np.searchsorted(type_group[order], type_group[order])
+    third_type = np.full(n, -1, np.int64)
+    third_type[type_group[order][rank == 2]] = type_first[order][rank == 2]
+
+    results = []
+    for gi in range(n):
+        a, b = firsts[gi], lasts[gi]
+        milestones = []
+
+        # ---- 1) 初次相遇 ----
         milestones.append({
-            "date": fmt_date(max_d_row.get('activity_date')),
-            "title": "深度项目",
-            "content": f"你在「{safe_str(max_d_row.get('activity_name'))}」中持续投入 {int(max_d_row['_est_days'])} 天，热忱与耐心都在路上发光。"
+            "date": dates[a],
+            "title": "志愿启程",
+            "content": f"那一天，你在「{names[a]}」留下了第一条志愿记录。"
         })
 
-    # ---- 5) 里程碑：累计时长首次达成（档位可调）----
-    # 你可以按需改这里的档位
-    thresholds = [1, 10, 30, 50, 100]
-    title_map = {
-        1: "点亮第一小时",
-        10: "十时成就",
-        50: "半百见证",
-        100: "百时成就"
-    }
+        # ---- 2) 连续投入：若某条活动推算天数 > 1，则记录“持续 X 天” ----
+        i = first_multi_day[gi]
+        if i >= 0:  # 第一条“多日活动”
+            milestones.append({
+                "date": dates[i],
+                "title": "连续投入",
+                "content": f"在「{names[i]}」中，你持续投入了 {int(est_days[i])} 天，把热爱变成了坚持。"
+            })
 
-    cum = 0.0
-    reached = set()
-
-    if not df_daily.empty:
-        for _, drow in df_daily.iterrows():
-            cum += float(drow.get("hours_day", 0.0) or 0.0)
-            for th in thresholds:
-                if th not in reached and cum >= th:
-                    milestones.append({
-                        "date": fmt_date(drow.get("day")),
-                        "title": title_map.get(th, f"{th}小时里程碑"),
-                        "content": f"在「{safe_str(drow.get('activity_name'))}」的过程中，你的累计时长首次达到 {th} 小时。"
-                    })
-                    reached.add(th)
-            if len(reached) == len(thresholds):
-                break
-
-    # ---- 6) 高频活动：参与次数最多的活动名 ----
-    # 适合你这种“同一个活动多人多次”的流水数据
-    name_counts = df_user['activity_name'].astype(str).value_counts()
-    if not name_counts.empty and int(name_counts.iloc[0]) >= 3:
-        top_name = name_counts.index[0]
-        top_cnt = int(name_counts.iloc[0])
-        # 取该活动第一次出现的日期
-        first_idx = df_user[df_user['activity_name'].astype(str) == top_name].index[0]
-        milestones.append({
-            "date": fmt_date(df_user.loc[first_idx].get('activity_date')),
-            "title": "高频参与",
-            "content": f"你在「{top_name}」中共出现了 {top_cnt} 次，热爱不是三分钟，而是反复奔赴。"
-        })
+        # ---- 3) 高光时刻：单次服务时长最高（改表述，不再“一口气”）----
+        i = max_hours[gi]
+        if float(hours[i]) > 0:
+            d = int(est_days[i])
+            h = float(hours[i])
+            # 让文案更符合“多日活动”的语境
+            if d > 1:
+                content = f"在「{names[i]}」这段 {d} 天的旅程里，你累计贡献了 {h:g} 小时，真的很燃！"
+            else:
+                content = f"在「{names[i]}」中，你贡献了 {h:g} 小时，这是你的高光时刻。"
+            milestones.append({
+                "date": dates[i],
+                "title": "高光时刻",
+                "content": content
+            })
 
-    # ---- 7) 多元参与：活动类型 >= 3（日期=达成第3个不同类型的那天）----
-    type_set = set([safe_str(x).strip() for x in df_user.get('activity_type', []).tolist()
-                    if safe_str(x).strip()])
-
-    if len(type_set) >= 3:
-        types_seen = set()
-        third_type_date = None
-
-        # df_user 已按 activity_date 排序；这里按时间推进，找到“第3个不同类型”首次出现的日期
-        for _, row in df_user.iterrows():
-            t = safe_str(row.get('activity_type', '')).strip()
-            if not t:
-                continue
-            before = len(types_seen)
-            types_seen.add(t)
-            if before < 3 and len(types_seen) == 3:
-                third_type_date = row.get('activity_date')
-                break
+        # ---- 4) 深度项目：单次持续天数最高 ----
+        i = max_days[gi]
+        if int(est_days[i]) > 1:
+            milestones.append({
+                "date": dates[i],
+                "title": "深度项目",
+                "content": f"你在「{names[i]}」中持续投入 {int(est_days[i])} 天，热忱与耐心都在路上发光。"
+            })
 
-        milestones.append({
-            "date": fmt_date(third_type_date),  # 达成第3个不同类型的日期
-            "title": "多元参与",
-            "content": f"这一年，你跨越了 {len(type_set)} 类志愿方向，温暖不止一种形状。"
-        })
+        # ---- 5) 里程碑：累计时长首次达成 ----
+        # 按天展开时 _hours_f 还没算，时长都按 0（见 expand_to_daily_rows）：累计时长到不了任何档位，
+        # 最忙的月份也是 0 小时，这两条不会出现，也就不用展开；只有传进来的记录自带 _hours_f 时才真的展开
+        daily = expand_to_daily_rows(df.iloc[a:b + 1]) if '_hours_f' in df else None
+        if daily is not None:
+            milestones.extend(threshold_milestones(daily))
+
+        # ---- 6) 高频活动：参与次数最多的活动名 ----
+        # 适合你这种“同一个活动多人多次”的流水数据
+        if top_count[gi] >= 3:
+            i = top_row[gi]   # 该活动第一次出现的那一行
+            milestones.append({
+                "date": dates[i],
+                "title": "高频参与",
+                "content": f"你在「{names[i]}」中共出现了 {int(top_count[gi])} 次，热爱不是三分钟，而是反复奔赴。"
+            })
 
-    # ---- 8) 最忙月份：该月累计时长最高 ----
-    # 需要 activity_date 非空
-    if not df_daily.empty:
-        df_daily["_month"] = df_daily["day"].dt.strftime("%Y-%m")
-        month_sum = df_daily.groupby("_month")["hours_day"].sum().sort_values(ascending=False)
-        if not month_sum.empty and float(month_sum.iloc[0]) > 0:
-            best_month = month_sum.index[0]
-            best_hours = float(month_sum.iloc[0])
+        # ---- 7) 多元参与：活动类型 >= 3（日期=达成第3个不同类型的那天）----
+        if type_cnt[gi] >= 3:
             milestones.append({
-                "date": "",
-                "title": "最忙的月份",
-                "content": f"{best_month} 你累计服务 {best_hours:g} 小时——那个月，你一定很闪亮。"
+                "date": dates[third_type[gi]],  # 达成第3个不同类型的日期
+                "title": "多元参与",
+                "content": f"这一年，你跨越了 {int(type_cnt[gi])} 类志愿方向，温暖不止一种形状。"
             })
 
-    # ---- 9) 暖心收官：最后一次记录（改为“最后一段旅程”更贴合多日活动）----
-    last = df_user.iloc[-1]
-    last_days = int(last.get('_est_days', 1))
-    if last_days > 1:
-        end_text = f"这是本年度最后一段「{safe_str(last.get('activity_name'))}」旅程（持续 {last_days} 天），为你的志愿时光画上温暖句号。"
-    else:
-        end_text = f"这是本年度最后一次「{safe_str(last.get('activity_name'))}」，为你的志愿时光画上一个温暖的句号。"
+        # ---- 8) 最忙月份：该月累计时长最高 ----
+        if daily is not None:
+            milestones.extend(busiest_month_milestone(daily))
 
-    milestones.append({
-        "date": fmt_date(last.get('activity_date')),
-        "title": "暖心收官",
-        "content": end_text
-    })
+        # ---- 9) 暖心收官：最后一次记录（改为“最后一段旅程”更贴合多日活动）----
+        last_days = int(est_days[b])
+        if last_days > 1:
+            end_text = f"这是本年度最后一段「{names[b]}」旅程（持续 {last_days} 天），为你的志愿时光画上温暖句号。"
+        else:
+            end_text = f"这是本年度最后一次「{names[b]}」，为你的志愿时光画上一个温暖的句号。"
 
-    # ---- 去重：按 (title, date) ----
-    seen = set()
-    uniq = []
-    for m in milestones:
-        key = (m.get('title', ''), m.get('date', ''))
-        if key not in seen:
-            seen.add(key)
-            uniq.append(m)
+        milestones.append({
+            "date": dates[b],
+            "title": "暖心收官",
+            "content": end_text
+        })
 
-    # 可选：限制数量，避免太长（比如最多 8 条）
-    return uniq[:8]
+        # ---- 去重：按 (title, date) ----
+        seen = set()
+        uniq_milestones = []
+        for m in milestones:
+            key = (m.get('title', ''), m.get('date', ''))
+            if key not in seen:
+                seen.add(key)
+                uniq_milestones.append(m)
 
+        # 可选：限制数量，避免太长（比如最多 8 条）
+        results.append(uniq_milestones[:8])
+    return results
 
 
 def pick_activities_gallery(df_user: pd.DataFrame, max_num=6):
     """时光掠影：选出若干活动 + 封面图（自动补全 URL）"""
-    activities = []
+    if df_user.empty:
+        return []
+    return pick_activities_gallery_batch(df_user, [0, len(df_user)], max_num)[0]
 
-    for _, row in df_user.sort_values('activity_date', ascending=False).iterrows():
-        img_name = row['cover_img'] if isinstance(row['cover_img'], str) and row['cover_img'] else None
 
-        # 自动拼接 URL
-        if img_name:
-            img_url = url_for('serve_image', filename=img_name)
-        else:
-            img_url = None
+def pick_activities_gallery_batch(df: pd.DataFrame, bounds, max_num=6):
+    """一批人的时光掠影：每人按日期从新到旧取前 max_num 条（和逐人 pick_activities_gallery 一样）"""
+    bounds = np.asarray(bounds)
+    groups = group_ids(bounds)
+    order = sort_by_date_within_groups(df['activity_date'].to_numpy(), bounds, ascending=False)
+    picked = order[np.arange(len(order)) - bounds[groups] < max_num]
+
+    types = df['activity_type'].to_numpy(dtype=object)[picked]
+    titles = df['activity_name'].to_numpy(dtype=object)[picked]
+    covers = df['cover_img'].to_numpy(dtype=object)[picked]
+    dates = format_dates(df['activity_date'].to_numpy()[picked], '%Y.%m')
 
-        activities.append({
-            "type": row['activity_type'],
-            "title": row['activity_name'],
-            "date": row['activity_date'].strftime('%Y.%m') if not pd.isna(row['activity_date']) else "",
+    galleries = [[] for _ in range(len(bounds) - 1)]
+    for gi, activity_type, title, date, img_name in zip(groups[picked], types, titles, dates, covers):
+        # 自动拼接 URL
+        img_url = image_url(img_name) if isinstance(img_name, str) and img_name else None
+        galleries[gi].append({
+            "type": activity_type,
+            "title": title,
+            "date": date,
             "img": img_url
         })
+    return galleries
 
-        if len(activities) >= max_num:
-            break
 
-    return activities
 
+def image_url(filename: str, width: int = GALLERY_IMAGE_WIDTH) -> str:
+    """
+    照片地址：带上原图版本号（内容哈希），可以长期缓存；装了 Pillow 时再带上宽度，发缩小版本。
+    原图不存在时和以前一样只给文件名。
+    """
+    version = image_variants.source_version(filename)
+    if version is None:
+        return url_for('serve_image', filename=filename)
+    if not image_variants.enabled:
+        width = None
+    return url_for('serve_image', filename=filename, w=width, v=version)
 
 
-def calc_co_volunteers(df_user: pd.DataFrame, max_num=300):
+def calc_co_volunteers(df_user: pd.DataFrame, max_num=300, ds: Dataset = None):
     """共同行志愿者：同场活动的其他姓名（简单版本）"""
     if df_user.empty:
         return []
 
-    # 找到这些活动名
-    activity_names = df_user['activity_name'].dropna().unique().tolist()
-    mask = df_records['activity_name'].isin(activity_names)
-    df_related = df_records[mask]
+    # 找到这些活动（编码），合并倒排索引里这几个活动的参与者
+    activity_codes = np.unique(df_user['activity_name'].cat.codes.to_numpy())
+    target_code = int(df_user['name'].cat.codes.iloc[0])
+    co = (ds or dataset).co_index.top(activity_codes, target_code, max_num)
+    return co
 
-    # 所有和 TA 同场出现过的名字（排除自己）
-    target_name = df_user.iloc[0]['name']
-    names = df_related['name'].tolist()
-    names = [n for n in names if n != target_name]
 
-    # 统计出现次数，按热度取前 N 个
-    count = Counter(names)
-    co = [n for n, _ in count.most_common(max_num)]
-    return co
+def calc_co_volunteers_batch(df: pd.DataFrame, bounds, ds: Dataset, max_num=300):
+    """一批人的同行志愿者（df 是 ds.df 里取出来的行，编码一致），和逐人 calc_co_volunteers 一样"""
+    bounds = np.asarray(bounds)
+    groups = group_ids(bounds)
+    act_codes = df['activity_name'].cat.codes.to_numpy().astype(np.int64)
+    n_acts = max(len(df['activity_name'].cat.categories), 1)
+    known = act_codes >= 0
+    pairs = np.unique(groups[known] * n_acts + act_codes[known])   # (第几个人, 活动)，每人的活动不重复
+    targets = df['name'].cat.codes.to_numpy()[bounds[:-1]]
+    return ds.co_index.top_many(pairs // n_acts, pairs % n_acts, targets, max_num)
 
 
-def pick_dept_letter(main_type_cn: str):
+def pick_dept_letter(main_type_cn: str, ds: Dataset = None):
     """根据主力部门选择一封信"""
-    dept_key = main_type_cn if main_type_cn in org_stats.get('dept_letters', {}) else "其他"
-    letter_lines = org_stats.get('dept_letters', {}).get(dept_key, [])
+    org_data = (ds or dataset).org_stats
+    dept_key = main_type_cn if main_type_cn in org_data.get('dept_letters', {}) else "其他"
+    letter_lines = org_data.get('dept_letters', {}).get(dept_key, [])
     if not letter_lines:
         letter_lines = [
             "见字如面。",
@@ -665,52 +1684,358 @@ def pick_dept_letter(main_type_cn: str):
     return letter_lines
 
 
-def build_user_report(name: str, phone: str):
-    """核心：把一位志愿者的所有内容拼成前端需要的 JSON"""
-    df_user = get_user_records(name, phone)
-    if df_user.empty:
-        # 非志愿者 / 没记录
-        guest_data = {
-            "is_volunteer": False,
-            "name": "未来的伙伴",
-            "org_data": org_stats
-        }
-        return guest_data
-
+def build_personal_report(name: str, df_user: pd.DataFrame, user_stats=None, ds: Dataset = None):
+    """把一位志愿者自己的内容拼起来（不含 org_data，那部分大家共用）"""
     total_hours = round(df_user['hours'].sum(), 1)
 
-    radar_stats, main_type_cn = calc_type_hours(df_user)
-    total_days = calc_active_days(df_user)
-    month_stats = calc_month_stats(df_user)
-    tags = generate_tags(df_user, total_hours, main_type_cn)
-    milestones = generate_milestones(df_user, total_hours)
-    activities = pick_activities_gallery(df_user)
-    co_volunteers = calc_co_volunteers(df_user)
-    letter_content = pick_dept_letter(main_type_cn)
-
+    if user_stats is None:
+        with report_stage_seconds.time('stats'):
+            user_stats = calc_user_stats(df_user)
+    with report_stage_seconds.time('tags'):
+        tags = generate_tags(df_user, total_hours, user_stats['main_type'], user_stats)
+    with report_stage_seconds.time('milestones'):
+        milestones = generate_milestones(df_user, total_hours)
+    with report_stage_seconds.time('gallery'):
+        activities = pick_activities_gallery(df_user)
+    with report_stage_seconds.time('co_volunteers'):
+        co_volunteers = calc_co_volunteers(df_user, ds=ds)
+    with report_stage_seconds.time('letter'):
+        letter_content = pick_dept_letter(user_stats['main_type'], ds)
+    return personal_report(name, total_hours, user_stats, tags, milestones, activities, co_volunteers,
+                           letter_content, ds)
+
+
+def personal_report(name: str, total_hours: float, user_stats: dict, tags, milestones, activities,
+                    co_volunteers, letter_content, ds: Dataset = None):
+    """各部分算好之后拼成一位志愿者的报告（逐人和批量共用）"""
     user_data = {
         "is_volunteer": True,
         "name": name,
         "totalHours": total_hours,
-        "mainType": main_type_cn,
-        "stats": radar_stats,             # 雷达图
+        "hours_rank": (ds or dataset).aggregates.rank(total_hours),   # 时长排第几、超过了多少志愿者
+        "mainType": user_stats['main_type'],
+        "stats": user_stats['stats'],     # 雷达图
         "tags": tags,                     # 个性化称号标签
         "activities": activities,         # 时光掠影
         "co_volunteers": co_volunteers,   # 星火相聚
-        "org_data": org_stats,            # 公共数据 & 文案
-        "total_days": total_days,         # 活跃天数估算
+        "total_days": user_stats['total_days'],     # 活跃天数估算
         "milestones": milestones,         # 年度里程碑
-        "month_stats": month_stats,       # 志愿足迹（按月）
+        "month_stats": user_stats['month_stats'],   # 志愿足迹（按月）
         "letter_content": letter_content  # 一封信（按行分段）
     }
     return user_data
 
 
+GUEST_REPORT = {"is_volunteer": False, "name": "未来的伙伴"}   # 非志愿者 / 没记录
+
+
+def get_report_body(name: str, phone: str, ds: Dataset, store=None):
+    """
+    一位志愿者的个人报告（不含协会公共数据），返回编码好的 JSON 字节；查无此人返回 None。
+    顺序：进程内缓存 → 预计算报告库 → 实时计算，拿到的字节进缓存，之后原样使用不再编码。
+    缓存没命中时，同一个人同时到的请求只有一个去查库 / 计算，其余的等它算完拿同一份结果。
+    """
+    phone_norm = normalize_phone(phone)
+    cache_key = (ds.version, name, phone_norm)
+    body = report_cache.get(cache_key)
+    source = 'cache'
+
+    if body is None:
+        (body, source), shared = report_flight.do(cache_key, lambda: _load_report_body(name, phone, ds, store))
+        if shared and body is not None:
+            source = 'coalesced'
+    report_sources.inc(source)
+    return body
+
+
+def _load_report_body(name: str, phone: str, ds: Dataset, store=None):
+    """缓存没命中时：预计算报告库 → 实时计算，拿到的字节进缓存；返回 (body, 来源)，查无此人 body 为 None"""
+    phone_norm = normalize_phone(phone)
+    body = None
+    source = 'store'
+    # 预计算库里有就直接用，没有再实时算
+    if store is not None and store.data_version == ds.report_version and name and phone:
+        with report_stage_seconds.time('store'):
+            body = store.get(name, phone_norm)
+
+    if body is None:
+        with report_stage_seconds.time('lookup'):
+            df_user = get_user_records(name, phone, ds)
+        if df_user.empty:
+            # 不进缓存，免得随手输入的名字把缓存挤满
+            return None, 'not_found'
+        report = build_personal_report(name, df_user, ds=ds)
+        with report_stage_seconds.time('encode'):
+            body = encode_report(report)
+        source = 'computed'
+
+    report_cache.put((ds.version, name, phone_norm), body, len(body))
+    return body, source
+
+
+def get_report_bodies(people, ds: Dataset, store=None) -> list:
+    """
+    一批人的个人报告（编码好的字节，查无此人为 None），顺序和 people（(name, phone) 列表）一致。
+    和 get_report_body 一样先查缓存、再查预计算报告库；剩下要现算的人攒起来，
+    整批一次算完（iter_personal_reports），比逐个算快。
+    """
+    use_store = store is not None and store.data_version == ds.report_version
+    bodies = []
+    pending = {}    # (name, phone) → 在 bodies 里的位置（同一个人可能出现多次）
+    for name, phone in people:
+        phone_norm = normalize_phone(phone)
+        body = report_cache.get((ds.version, name, phone_norm))
+        source = 'cache'
+        if body is None and use_store and name and phone:
+            body = store.get(name, phone_norm)
+            source = 'store'
+            if body is not None:
+                report_cache.put((ds.version, name, phone_norm), body, len(body))
+        if body is None:
+            if name and phone and (name, phone_norm) in ds.user_index:
+                pending.setdefault((name, phone_norm), []).append(len(bodies))
+                source = 'computed'
+            else:
+                source = 'not_found'
+        report_sources.inc(source)
+        bodies.append(body)
+
+    for name, phone, report in iter_personal_reports(list(pending), ds):
+        body = encode_report(report)
+        report_cache.put((ds.version, name, phone), body, len(body))
+        for i in pending[(name, phone)]:
+            bodies[i] = body
+    return bodies
+
+
+def iter_export_lines(ds: Dataset, store=None, shard_size: int = EXPORT_SHARD_SIZE):
+    """
+    逐人产出一行 NDJSON（字节，带换行）：{"name": ..., "phone": ..., "report": {...}}，顺序同 user_index。
+    按 shard_size 一批批算，算完一批就交出去，内存占用和总人数无关；
+    预计算报告库版本对得上就直接读库。导出的报告不进缓存，免得把线上的热数据挤掉。
+    需要在 request context 里调用（掠影里的图片地址要用 url_for）。
+    """
+    use_store = store is not None and store.data_version == ds.report_version
+    keys = iter(ds.user_index)
+    while True:
+        shard = list(islice(keys, shard_size))
+        if not shard:
+            return
+        bodies = {}
+        if use_store:
+            for key in shard:
+                body = store.get(*key)
+                if body is not None:
+                    bodies[key] = body
+        missing = [key for key in shard if key not in bodies]
+        for name, phone, report in iter_personal_reports(missing, ds):
+            bodies[(name, phone)] = encode_report(report)
+
+        for key in shard:
+            name, phone = key
+            yield b'{"name":' + encode_report(name) + b',"phone":' + encode_report(phone) + b',"report":' + bodies[key] + b'}\n'
+
+
+def attach_org_data(body: bytes, ds: Dataset, slim: bool = False) -> bytes:
+    """
+    给编码好的个人报告附上协会公共数据 & 文案，直接拼字节，不再重新编码。
+    slim=True 时只附 org_version，前端再按版本号请求 /api/org_stats（可长期缓存）。
+    """
+    if slim:
+        extra = b'"org_version":' + encode_report(ds.org_version)
+    else:
+        extra = b'"org_data":' + ds.org_json
+    return body[:-1] + b',' + extra + b'}'
+
+
+def build_year_history(name: str, phone: str) -> dict:
+    """历年累计：每年的总时长 / 活动次数和合计，只用每年预先算好的汇总，不加载往年流水账"""
+    years = []
+    if name and phone:
+        key = (name, normalize_phone(phone))
+        for year in available_years():
+            found = get_year_totals(year).get(key)
+            if found:
+                years.append({"year": year, "hours": found[0], "activities": found[1]})
+    return {
+        "years": years,
+        "total_hours": round(sum(y['hours'] for y in years), 1),
+        "total_activities": sum(y['activities'] for y in years),
+        "years_active": len(years),
+    }
+
+
+def build_user_report(name: str, phone: str, slim: bool = False, year: int = None) -> dict:
+    """
+    核心：把一位志愿者的所有内容拼成前端需要的 JSON（year 不传就是当前年度），返回 dict，调用方自己编码一次。
+    接口走的是 get_report_body + attach_org_data（缓存编码好的字节），这里给脚本 / 对比结果用。
+    """
+    ds = get_year_dataset(year)   # 整个请求只用这一份数据
+    if ds is None:
+        raise ValueError(f"没有 {year} 年度的数据")
+    df_user = get_user_records(name, phone, ds)
+    user_data = build_personal_report(name, df_user, ds=ds) if not df_user.empty else dict(GUEST_REPORT)
+    if slim:
+        return {**user_data, "org_version": ds.org_version}
+    return {**user_data, "org_data": ds.org_stats}     # 公共数据 & 文案
+
+
+def pick_content_encoding():
+    """按请求头 Accept-Encoding 选压缩方式：br（装了 brotli 才支持）> gzip > 不压缩"""
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(supported)
+
+
+def compress_body(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def iter_personal_reports(keys=None, ds: Dataset = None):
+    """
+    批量生成志愿者的个人报告（keys 不传就是所有人），产出 (name, phone, report)。
+    所有人的行按人拼成一张表，统计 / 标签 / 里程碑 / 掠影 / 星火相聚都按组一次性算完
+    （*_batch 系列），不再逐人各扫一遍；结果和逐人实时计算的逐字节一致。
+    需要在 request context 里调用（掠影里的图片地址要用 url_for）。
+    """
+    ds = ds or dataset
+    keys = list(ds.user_index) if keys is None else list(keys)
+    positions = [ds.user_index[k] for k in keys]
+    if not keys:
+        return
+
+    # 按人拼接行号（每人内部已按日期排好），bounds[i]:bounds[i+1] 是第 i 个人的行
+    df = ds.df.iloc[np.concatenate(positions)]
+    bounds = np.r_[0, np.cumsum([len(p) for p in positions])]
+    hours = df['hours'].to_numpy()
+    total_hours = [round(hours[a:b].sum(), 1) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    all_stats = calc_stats_batch(df, group_ids(bounds), len(keys))
+    main_types = [s['main_type'] for s in all_stats]
+    all_tags = generate_tags_batch(df, bounds, total_hours, main_types, all_stats)
+    all_milestones = generate_milestones_batch(df, bounds)
+    galleries = pick_activities_gallery_batch(df, bounds)
+    all_co = calc_co_volunteers_batch(df, bounds, ds)
+
+    for i, (name, phone) in enumerate(keys):
+        report = personal_report(name, total_hours[i], all_stats[i], all_tags[i], all_milestones[i], galleries[i],
+                                 all_co[i], pick_dept_letter(main_types[i], ds), ds)
+        yield name, phone, report
+
+
+def encode_report(report: dict) -> bytes:
+    return app.json.dumps_bytes(report)
+
+
+def _encode_report_shard(keys, year: int = None):
+    """
+    算一批人的报告并编码好，year 是哪一年的数据（不传是当前年度）。
+    多进程时在子进程里跑，按年份自己取数据：fork 出来的子进程直接用从父进程继承的那一份
+    （往年的在父进程里已经加载进 year_partitions），只有年份和分片里的 (name, phone) 会被 pickle
+    """
+    ds = get_year_dataset(year)
+    with app.test_request_context():
+        return [(name, phone, encode_report(report)) for name, phone, report in iter_personal_reports(keys, ds)]
+
+
+def iter_encoded_report_shards(workers: int = 1, shard_size: int = 200, year: int = None):
+    """
+    把某一年（不传是当前年度）的所有志愿者按 shard_size 分片，逐片产出 [(name, phone, body_bytes), ...]。
+    workers > 1 时分片交给进程池并行算：
+    - 支持 fork 的系统（Linux / macOS）子进程直接共享父进程已加载的数据和索引；
+    - 不支持 fork 的系统（Windows）子进程 import app 时会自己 load_data 一遍，往年的用到时再加载。
+    输出顺序与串行一致（executor.map 按提交顺序返回），内容逐字节相同。
+    """
+    ds = get_year_dataset(year)
+    keys = list(ds.user_index)
+    shards = [keys[i:i + shard_size] for i in range(0, len(keys), shard_size)]
+    encode_shard = functools.partial(_encode_report_shard, year=year)
+
+    if workers <= 1 or len(shards) <= 1:
+        for shard in shards:
+            yield encode_shard(shard)
+        return
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        yield from pool.map(encode_shard, shards)
+
+
+def static_report_key(salt: str, name: str, phone: str) -> str:
+    """
+    静态导出里一份报告的文件名：sha256(盐 + 姓名 + 清洗后学号)。
+    前端（annualData.js）用同样的算法在浏览器里算出文件名，改这里要同步改那边。
+    """
+    text = f"{salt}\n{name.strip()}\n{normalize_phone(phone)}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def batch_request_cost() -> float:
+    """批量查询按人数消耗限流令牌"""
+    people = (request.get_json(silent=True) or {}).get('people')
+    return float(len(people)) if isinstance(people, list) and people else 1.0
+
+
+def parse_year(value):
+    """请求里的 year：不传 / 空为 None（当前年度），不是整数抛 ValueError"""
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("year 不是有效的年份") from None
+
+
 # ====== Flask 路由 ======
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    http_requests.inc(endpoint, request.method, str(response.status_code))
+    start = g.get('request_start')
+    if start is not None:
+        http_request_seconds.observe(time.perf_counter() - start, endpoint)
+    return response
+
+
 @app.route('/media/images/<path:filename>')
 def serve_image(filename):
-    return send_from_directory(PHOTO_FOLDER, filename)
+    """
+    活动照片。?w=<宽度> 时发对应宽度的缩小版本（浏览器支持就发 WebP，否则 JPEG，第一次请求时生成）；
+    ?v=<版本号> 和原图当前版本一致时允许浏览器长期缓存，否则每次用 ETag 协商。
+    """
+    width = request.args.get('w', type=int)
+    variant = None
+    if width and image_variants.enabled:
+        fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+        variant = image_variants.variant(filename, width, fmt)
+        if variant is None and image_variants.source_path(filename) is None:
+            abort(404)
+        # 原图打不开、生成不了缩小版本时照常发原图
+
+    if variant is not None:
+        path, etag = variant
+        resp = send_file(path, mimetype=IMAGE_FORMATS[fmt][1], etag=etag, conditional=True)
+        resp.vary.add('Accept')
+    else:
+        resp = send_from_directory(PHOTO_FOLDER, filename)
+
+    version = request.args.get('v')
+    if version and version == image_variants.source_version(filename):
+        resp.cache_control.no_cache = None   # send_file 默认带 no-cache
+        resp.cache_control.public = True
+        resp.cache_control.max_age = IMAGE_MAX_AGE
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp
 
 
 @app.route('/')
@@ -720,24 +2045,334 @@ def hello_world():
 
 @app.route('/annual_report')
 def annual_report_page():
-    return render_template('annual_report.html')
+    # /annual_report?year=2024 看往年的报告
+    year = request.args.get('year', type=int)
+    return render_template('annual_report.html', year=year, report_year=year or REPORT_YEAR)
+
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    """报告缓存的命中 / 未命中等计数，用来调缓存大小"""
+    return jsonify({"data_version": dataset.version, **report_cache.stats(), "compressed": compressed_cache.stats(),
+                    "year_partitions": year_partitions.stats()})
+
+
+@app.route('/api/org_stats')
+def get_org_stats():
+    """
+    协会公共数据（总时长、部门文案、致信文案、公共相册等），所有人都一样，单独下发。
+    带 ?v=<org_version> 且和当前版本一致时允许浏览器长期缓存；否则每次用 ETag 协商。
+    往年的用 ?year=<年份>。
+    """
+    ds = get_year_dataset(request.args.get('year', type=int))
+    if ds is None:
+        abort(404)
+    resp = app.response_class(ds.org_json, mimetype='application/json')
+    resp.set_etag(ds.org_version)
+    resp.last_modified = ds.org_modified
+    if request.args.get('v') == ds.org_version:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = ORG_STATS_MAX_AGE
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
 
 
 @app.route('/api/get_annual_data', methods=['POST'])
+@client_limiter.limited()
+@request_profiler.profiled
 def get_annual_data():
     data = request.get_json() or {}
     name = (data.get('name') or '').strip()
     phone = (data.get('phone') or '').strip()
+    slim = bool(data.get('slim'))   # 前端单独缓存协会公共数据时传 true
+    try:
+        year = parse_year(data.get('year'))   # 不传就是当前年度
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
     try:
-        user_data = build_user_report(name, phone)
-        return jsonify({"success": True, "data": user_data})
+        ds = get_year_dataset(year)
+        if ds is None:
+            return jsonify({"success": False, "error": f"没有 {year} 年度的数据"}), 404
+        encoding = pick_content_encoding()
+        # 压缩后的响应也缓存（只缓存志愿者的，单独一个 LRU，不算进报告缓存的命中率），命中时原样发送
+        variant_key = (ds.version, name, normalize_phone(phone), slim, encoding)
+        payload = compressed_cache.get(variant_key) if encoding else None
+
+        if payload is None:
+            body = get_report_body(name, phone, ds, report_store)
+            user_data = attach_org_data(body or encode_report(GUEST_REPORT), ds, slim)
+            payload = b'{"success":true,"data":' + user_data + b'}'
+            if encoding and len(payload) >= REPORT_COMPRESS_MIN_BYTES:
+                with report_stage_seconds.time('compress'):
+                    payload = compress_body(payload, encoding)
+                if body is not None:
+                    compressed_cache.put(variant_key, payload, len(payload))
+            else:
+                encoding = None
+
+        resp = app.response_class(payload, mimetype='application/json')
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+        resp.vary.add('Accept-Encoding')
+        return resp
     except Exception as e:
-        import traceback
+        report_errors.inc(type(e).__name__)
         traceback.print_exc()  # ← 打印完整错误堆栈
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/get_annual_data_batch', methods=['POST'])
+@client_limiter.limited(cost=batch_request_cost)
+@request_profiler.profiled
+def get_annual_data_batch():
+    """
+    一次查多个人：{"people": [{"name": ..., "phone": ...}, ...]，可选 year / slim}。
+    data 按请求顺序给出每人的报告（查不到的是访客报告，is_volunteer 为 false），
+    协会公共数据整批只附一次（slim 时只给 org_version）。
+    """
+    data = request.get_json() or {}
+    people = data.get('people')
+    slim = bool(data.get('slim'))
+    if not isinstance(people, list) or not all(isinstance(p, dict) for p in people):
+        return jsonify({"success": False, "error": "people 应为 [{\"name\": ..., \"phone\": ...}, ...]"}), 400
+    if len(people) > BATCH_MAX_PEOPLE:
+        return jsonify({"success": False, "error": f"一次最多查 {BATCH_MAX_PEOPLE} 人"}), 400
+    try:
+        year = parse_year(data.get('year'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    try:
+        ds = get_year_dataset(year)
+        if ds is None:
+            return jsonify({"success": False, "error": f"没有 {year} 年度的数据"}), 404
+        pairs = [(str(p.get('name') or '').strip(), str(p.get('phone') or '').strip()) for p in people]
+        guest = encode_report(GUEST_REPORT)
+        bodies = [body or guest for body in get_report_bodies(pairs, ds, report_store)]
+
+        org = b'"org_version":' + encode_report(ds.org_version) if slim else b'"org_data":' + ds.org_json
+        payload = b'{"success":true,' + org + b',"data":[' + b','.join(bodies) + b']}'
+        encoding = pick_content_encoding()
+        if encoding and len(payload) >= REPORT_COMPRESS_MIN_BYTES:
+            with report_stage_seconds.time('compress'):
+                payload = compress_body(payload, encoding)
+        else:
+            encoding = None
+
+        resp = app.response_class(payload, mimetype='application/json')
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+        resp.vary.add('Accept-Encoding')
+        return resp
+    except Exception as e:
+        report_errors.inc(type(e).__name__)
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/export_reports')
+def export_reports():
+    """
+    全部志愿者的报告，NDJSON 流式输出（一行一人，边算边发）；往年的用 ?year=<年份>。
+    涉及所有人的数据：请求头 X-Export-Token 必须和配置的口令一致，没配口令时这个接口不开放。
+    """
+    if not EXPORT_TOKEN:
+        abort(404)
+    given = request.headers.get('X-Export-Token', '')
+    if not hmac.compare_digest(given.encode('utf-8'), EXPORT_TOKEN.encode('utf-8')):
+        abort(403)
+    try:
+        year = parse_year(request.args.get('year'))
+    except ValueError:
+        abort(400)
+    ds = get_year_dataset(year)
+    if ds is None:
+        abort(404)
+
+    resp = app.response_class(stream_with_context(iter_export_lines(ds, report_store)), mimetype='application/x-ndjson')
+    resp.headers['Content-Disposition'] = f'attachment; filename=reports-{year or REPORT_YEAR}.ndjson'
+    return resp
+
+
+@app.route('/api/year_totals', methods=['POST'])
+def get_year_totals_api():
+    """历年累计：每年的总时长 / 活动次数和合计（只读每年预先算好的汇总）"""
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    phone = (data.get('phone') or '').strip()
+    try:
+        return jsonify({"success": True, "data": build_year_history(name, phone)})
+    except Exception as e:
+        report_errors.inc(type(e).__name__)
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/metrics')
+def metrics_page():
+    """Prometheus 抓取用：请求数 / 耗时、报告各环节耗时、出错次数、数据规模和加载耗时、缓存情况"""
+    return app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ====== 命令行 ======
+
+@app.cli.command('precompute')
+@click.option('--out', default=REPORT_STORE_PATH, show_default=True, help='报告库输出路径')
+@click.option('--workers', default=1, show_default=True, help='并行进程数，0 表示用满所有 CPU 核')
+@click.option('--shard-size', default=200, show_default=True, help='每个任务分到的志愿者人数')
+def precompute_command(out, workers, shard_size):
+    """离线批量生成所有志愿者的报告，写入预计算报告库"""
+    workers = workers or os.cpu_count() or 1
+    ds = dataset
+
+    def items(bar):
+        for shard in iter_encoded_report_shards(workers, shard_size):
+            yield from shard
+            bar.update(len(shard))
+
+    with click.progressbar(length=len(ds.user_index), label=f'生成报告（{workers} 进程）', file=click.get_text_stream('stderr')) as bar:
+        count = ReportStore.write(out, ds.report_version, items(bar))
+    click.echo(f"已写入 {count} 份报告 → {out}（版本 {ds.report_version}）")
+
+    if os.path.abspath(out) == os.path.abspath(REPORT_STORE_PATH):
+        load_report_store()
+
+
+@app.cli.command('export-reports')
+@click.option('--out', default='-', show_default=True, help='输出文件，- 为标准输出；以 .gz 结尾时 gzip 压缩')
+@click.option('--year', type=int, default=None, help='年度，不传为当前年度')
+def export_reports_command(out, year):
+    """把所有志愿者的报告导出成 NDJSON（一行一人，边算边写，内存占用和人数无关）"""
+    ds = get_year_dataset(year)
+    if ds is None:
+        raise click.ClickException(f"没有 {year} 年度的数据")
+
+    if out == '-':
+        f = click.get_binary_stream('stdout')
+    else:
+        f = gzip.open(out, 'wb') if out.endswith('.gz') else open(out, 'wb')
+    count = 0
+    try:
+        with app.test_request_context(), \
+                click.progressbar(length=len(ds.user_index), label='导出报告', file=click.get_text_stream('stderr')) as bar:
+            for line in iter_export_lines(ds, report_store):
+                f.write(line)
+                count += 1
+                bar.update(1)
+    finally:
+        if out != '-':
+            f.close()
+    click.echo(f"已导出 {count} 份报告 → {out}（数据版本 {ds.version}）", err=True)
+
+
+@app.cli.command('static-export')
+@click.option('--out', required=True, help='输出目录（必须不存在或为空），整个目录交给 nginx / CDN')
+@click.option('--year', type=int, default=None, help='年度，不传为当前年度')
+@click.option('--salt', default=None, help='文件名用的盐，不传就随机生成（每次导出都不同）')
+@click.option('--workers', default=1, show_default=True, help='并行进程数，0 表示用满所有 CPU 核')
+@click.option('--shard-size', default=200, show_default=True, help='每个任务分到的志愿者人数')
+def static_export_command(out, year, salt, workers, shard_size):
+    """
+    把所有人的报告导出成静态文件，上线高峰期查询不经过 Python：
+      index.html                       静态模式的页面（浏览器里算文件名，直接取下面的文件）
+      static/、media/images/           前端资源和活动照片（原图）
+      reports/<前两位>/<哈希>.json     每人一份，内容同 /api/get_annual_data（slim）
+      reports/org/<org_version>.json、reports/guest.json、reports/manifest.json
+    文件名是加盐哈希，不知道姓名 + 学号就猜不到。每个 .json 旁边另有一份预先压好的 .json.gz：
+    普通 CDN / 对象存储直接发 .json，nginx 开 gzip_static 时发 .json.gz。
+    """
+    ds = get_year_dataset(year)
+    if ds is None:
+        raise click.ClickException(f"没有 {year} 年度的数据")
+    if os.path.isdir(out) and os.listdir(out):
+        raise click.ClickException(f"{out} 不是空目录，请换一个新目录导出")
+    workers = workers or os.cpu_count() or 1
+    salt = salt or secrets.token_hex(16)
+    reports_dir = os.path.join(out, 'reports')
+
+    def write_json(path: str, data: bytes):
+        """写 path 和 path.gz 两份：原文给不会处理预压缩文件的 CDN / 对象存储，.gz 给 nginx 的 gzip_static"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))   # 离线压一次，用最高压缩比
+
+    count = 0
+    with app.test_request_context(), \
+            click.progressbar(length=len(ds.user_index), label=f'导出报告（{workers} 进程）', file=click.get_text_stream('stderr')) as bar:
+        for shard in iter_encoded_report_shards(workers, shard_size, year):
+            for name, phone, body in shard:
+                key = static_report_key(salt, name, phone)
+                payload = b'{"success":true,"data":' + attach_org_data(body, ds, slim=True) + b'}'
+                write_json(os.path.join(reports_dir, key[:2], f'{key}.json'), payload)
+            count += len(shard)
+            bar.update(len(shard))
+
+        write_json(os.path.join(reports_dir, 'org', f'{ds.org_version}.json'), ds.org_json)
+        write_json(os.path.join(reports_dir, 'guest.json'),
+                 b'{"success":true,"data":' + attach_org_data(encode_report(GUEST_REPORT), ds, slim=True) + b'}')
+        with open(os.path.join(reports_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({"year": year or REPORT_YEAR, "data_version": ds.version, "org_version": ds.org_version,
+                       "reports": count, "salt": salt, "created_at": int(time.time())}, f, ensure_ascii=False, indent=2)
+
+        # 页面里的地址都是从站点根目录起的（/static/…、/media/images/…），整个目录要放在站点根目录
+        static_reports = {"base": request.script_root + '/reports/', "salt": salt}
+        html = render_template('annual_report.html', year=year, report_year=year or REPORT_YEAR,
+                               static_reports=static_reports)
+    with open(os.path.join(out, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+
+    shutil.copytree(app.static_folder, os.path.join(out, 'static'))
+    if os.path.isdir(PHOTO_FOLDER):
+        shutil.copytree(PHOTO_FOLDER, os.path.join(out, 'media', 'images'))
+    click.echo(f"已导出 {count} 份报告 → {out}（数据版本 {ds.version}，盐 {salt}）")
+
+
+@app.cli.command('year-totals')
+def year_totals_command():
+    """预先算好往年每年每人的汇总（years/<年份>.totals.json），历年累计就不用临时加载往年数据"""
+    for year in available_years():
+        if year == REPORT_YEAR:
+            continue
+        if year_totals.get(year, file_signature(year_csv_path(year))) is not None:
+            click.echo(f"{year}：已是最新")
+            continue
+        ds = load_year_dataset(year)
+        click.echo(f"{year}：{len(ds.user_index)} 人，{len(ds.df)} 行 → {year_totals.path(year)}")
+
+
+@app.cli.command('image-variants')
+def image_variants_command():
+    """预先生成 photos/ 下所有照片的缩小版本（不跑也行，第一次被请求时会自动生成）"""
+    if not image_variants.enabled:
+        raise click.ClickException('需要先安装 Pillow：pip install pillow')
+    total = 0
+    for filename, count in image_variants.generate_all():
+        total += count
+        click.echo(f"{filename}：{count} 个")
+    click.echo(f"共 {total} 个 → {PHOTO_VARIANT_FOLDER}")
+
+
+@app.cli.command('memory-report')
+def memory_report_command():
+    """对比 df_records 文本列用普通字符串和用 category 编码时的内存占用"""
+    encoded = df_records.memory_usage(deep=True, index=False)
+    plain = df_records.astype({c: object for c in TEXT_COLUMNS if c in df_records}).memory_usage(deep=True, index=False)
+
+    click.echo(f"{'列':<16}{'字符串(KB)':>14}{'编码后(KB)':>14}")
+    for col in df_records.columns:
+        click.echo(f"{col:<16}{plain[col] / 1024:>14.1f}{encoded[col] / 1024:>14.1f}")
+    click.echo(f"{'合计':<16}{plain.sum() / 1024:>14.1f}{encoded.sum() / 1024:>14.1f}"
+               f"   （{len(df_records)} 行，节省 {1 - encoded.sum() / max(plain.sum(), 1):.0%}）")
+
+
 if __name__ == '__main__':
+    # debug 模式下真正处理请求的是重载器拉起的子进程，数据监听只在它里面开
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_data_watcher()
     # 调试阶段可以开启 debug，线上记得关掉
     app.run(port=4399, debug=True)
@@ -0,0 +1,138 @@
+"""
+活动照片的缩小版本：按几档固定宽度生成 WebP / JPEG，存在磁盘上，生成一次之后直接发文件。
+
+- 文件名里带原图内容的哈希（版本号），原图换了自然生成新文件，旧文件不会被误用
+- 可以批量预先生成（flask --app app image-variants），也可以第一次被请求时再生成
+- Pillow 是可选依赖：没装就一律发原图
+- 原图打不开（不是图片 / 文件不完整）时也发原图，同一版本的原图只试一次
+"""
+import os
+import hashlib
+import threading
+
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image, ImageOps
+    RENDER_ERRORS = (OSError, ValueError, Image.DecompressionBombError)   # UnidentifiedImageError 是 OSError 的子类
+except ImportError:
+    Image = None
+    RENDER_ERRORS = ()
+
+# 格式 → (Pillow 格式名, MIME, 保存参数)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+
+class ImageVariants:
+    def __init__(self, source_dir: str, cache_dir: str, widths):
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir
+        self.widths = tuple(sorted(widths))
+        self._versions = {}     # 原图路径 → ((size, mtime_ns), 版本号)
+        self._broken = set()    # 生成失败过的原图版本，不再重试
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None
+
+    def source_path(self, filename: str):
+        """原图路径；文件名不安全或文件不存在返回 None"""
+        path = safe_join(self.source_dir, filename)
+        return path if path and os.path.isfile(path) else None
+
+    def source_version(self, filename: str):
+        """原图内容哈希（前 12 位），按 size + mtime 缓存，原图不变就不重复算；原图不存在返回 None"""
+        path = self.source_path(filename)
+        if path is None:
+            return None
+        st = os.stat(path)
+        sig = (st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            cached = self._versions.get(path)
+        if cached and cached[0] == sig:
+            return cached[1]
+
+        with open(path, 'rb') as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._versions[path] = (sig, version)
+        return version
+
+    def pick_width(self, width: int) -> int:
+        """对齐到固定的几档宽度（不接受任意宽度，免得被刷出一堆文件）"""
+        for w in self.widths:
+            if w >= width:
+                return w
+        return self.widths[-1]
+
+    def variant(self, filename: str, width: int, fmt: str):
+        """
+        返回 (文件路径, 版本号)，没有就现在生成；原图不存在 / 打不开 / 没装 Pillow 返回 None。
+        版本号由原图版本 + 宽度 + 格式组成，内容确定，可以直接当强 ETag 用。
+        """
+        if not self.enabled or fmt not in FORMATS:
+            return None
+        version = self.source_version(filename)
+        if version is None:
+            return None
+
+        width = self.pick_width(width)
+        stem = os.path.splitext(filename)[0].replace('/', '__')
+        path = os.path.join(self.cache_dir, f'{stem}.{version}.{width}w.{fmt}')
+        if not os.path.exists(path):
+            if version in self._broken:
+                return None
+            try:
+                self._render(self.source_path(filename), path, width, fmt)
+            except RENDER_ERRORS as e:
+                print(f"[images] {filename} 生成缩小版本失败，改发原图：{e!r}")
+                with self._lock:
+                    self._broken.add(version)
+                return None
+        return path, f'{version}-{width}-{fmt}'
+
+    def _render(self, source: str, path: str, width: int, fmt: str):
+        pil_format, _, save_args = FORMATS[fmt]
+        with Image.open(source) as im:
+            im = ImageOps.exif_transpose(im)   # 手机照片按 EXIF 方向摆正
+            if im.width > width:               # 只缩小，不放大
+                im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+
+            if fmt == 'jpeg' and im.mode != 'RGB':
+                # JPEG 没有透明通道，透明部分铺白底
+                rgba = im.convert('RGBA')
+                im = Image.new('RGB', rgba.size, (255, 255, 255))
+                im.paste(rgba, mask=rgba.getchannel('A'))
+            elif im.mode not in ('RGB', 'RGBA'):
+                im = im.convert('RGBA')
+
+            # 先写临时文件再替换，并发请求同一张图时不会读到写了一半的文件
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                im.save(tmp_path, pil_format, **save_args)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+
+    def generate_all(self):
+        """把 source_dir 下所有照片的所有宽度 / 格式都生成出来，逐个产出 (文件名, 生成的个数)"""
+        for root, _, files in os.walk(self.source_dir):
+            for name in sorted(files):
+                if not name.lower().endswith(SOURCE_EXTENSIONS):
+                    continue
+                filename = os.path.relpath(os.path.join(root, name), self.source_dir).replace(os.sep, '/')
+                count = 0
+                for width in self.widths:
+                    for fmt in FORMATS:
+                        if self.variant(filename, width, fmt):
+                            count += 1
+                yield filename, count
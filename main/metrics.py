@@ -0,0 +1,292 @@
+"""
+进程内监控指标，按 Prometheus 文本格式输出（/metrics）。
+
+只实现用得到的三种：计数器、直方图、回调（输出时现取值，适合数据行数、缓存条数这类已有的数）。
+记录一次只是加锁改几个数，计时用 perf_counter，开销在微秒级。
+
+多进程部署（serve.py）时所有 worker 共用一个端口，Prometheus 每次抓到的是其中随便一个 worker，
+所以各进程要合起来输出（share）：每个进程定时把自己的计数器、直方图、counter 类型的回调写进共享目录
+（<目录>/<pid>.json），输出时把目录里所有进程的加起来；已经退出的 worker 由父进程并进自己的那份（retire），
+换 worker 时计数也不会往回掉。gauge 类型的回调（数据行数、缓存条数等）不相加，取的是回答这次抓取的那个 worker 的值。
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows 没有；多进程共享只在 serve.py（Linux / macOS）里用
+    fcntl = None
+
+# 默认直方图分桶（秒）：覆盖 0.1ms ~ 10s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _add_values(a, b):
+    """两个进程的同一条时间序列相加：计数器是数，直方图是 [各桶计数, 总和]"""
+    if isinstance(a, (list, tuple)):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+    return a + b
+
+
+def _merge(total: dict, part: dict):
+    """{指标名: {标签元组: 值}} 相加进 total"""
+    for name, values in part.items():
+        target = total.setdefault(name, {})
+        for labels, value in values.items():
+            target[labels] = _add_values(target[labels], value) if labels in target else value
+
+
+class Counter:
+    summable = True   # 多进程时各进程相加
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self, values: dict = None):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        items = sorted((self.snapshot() if values is None else values).items())
+        for labels, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Histogram:
+    summable = True
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}    # labels → [每个桶的计数（非累计，最后一个是 +Inf）, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """with hist.time('tags'): ... 记录这段代码的耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self, values: dict = None):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        items = sorted((self.snapshot() if values is None else values).items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                yield f'{self.name}_bucket{le} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Callback:
+    """
+    输出时调用 fn 取值。fn 返回一个数，或者 [(标签值元组, 数), ...]。
+    kind 是 gauge 或 counter（比如缓存命中次数这种本来就在别处累计的数）；多进程时只有 counter 相加。
+    """
+
+    def __init__(self, name: str, help_text: str, fn, kind: str = 'gauge', labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.summable = kind == 'counter'
+
+    def snapshot(self):
+        value = self.fn()
+        if value is None:
+            return None
+        return {tuple(labels): v for labels, v in (value if isinstance(value, list) else [((), value)])}
+
+    def reset(self):
+        pass   # 值在别处累计，这里管不着
+
+    def render(self, values: dict = None):
+        if values is None:
+            values = self.snapshot()
+        if values is None:
+            return
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for labels, v in values.items():
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._share_dir = None
+        self._share_name = None
+        self._retired = {}   # 已经退出的进程留下的累计值（只在父进程里用）
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, fn, kind: str = 'gauge', labelnames=()) -> Callback:
+        return self._add(Callback(name, help_text, fn, kind, labelnames))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    # ---- 多进程：共享目录 ----
+
+    def share(self, directory: str, name: str = None, reset: bool = False):
+        """
+        之后这个进程的可相加指标写进 directory/<name>.json（name 默认是 pid），输出时合并目录里所有进程的。
+        fork 出来的 worker 传 reset=True：从父进程继承来的计数清零，只记自己的，不然父进程的数会算 N 遍。
+        """
+        self._share_dir = directory
+        self._share_name = name or str(os.getpid())
+        if reset:
+            self._retired = {}
+            for metric in self._metrics:
+                metric.reset()
+        self.write_shared()
+
+    def start_share_thread(self, interval: float = 1.0):
+        """后台定时写共享文件（worker 里用；抓取时别的 worker 的数最多晚 interval 秒）"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.write_shared()
+
+        threading.Thread(target=loop, name='metrics-share', daemon=True).start()
+
+    def write_shared(self):
+        if self._share_dir is None:
+            return
+        path = os.path.join(self._share_dir, f'{self._share_name}.json')
+        values = self._local_values()
+        _merge(values, self._retired)
+        data = {name: [[list(labels), value] for labels, value in series.items()] for name, series in values.items()}
+        tmp = f'{path}.{threading.get_ident()}.tmp'   # 后台线程和抓取请求可能同时在写
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def retire(self, name: str):
+        """进程 name 已经退出：它最后写下的数并进本进程（父进程）的那份，删掉它的文件"""
+        if self._share_dir is None:
+            return
+        path = os.path.join(self._share_dir, f'{name}.json')
+        with self._dir_lock(fcntl.LOCK_EX):   # 并进来和删文件之间不能有人来读，不然会多算一遍
+            values = self._read_shared(path)
+            if values is None:
+                return
+            _merge(self._retired, values)
+            self.write_shared()
+            os.remove(path)
+
+    @contextmanager
+    def _dir_lock(self, mode):
+        with open(os.path.join(self._share_dir, '.lock'), 'a') as f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_shared(path: str):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return {name: {tuple(labels): value for labels, value in series} for name, series in data.items()}
+
+    def _local_values(self) -> dict:
+        values = {}
+        for metric in self._metrics:
+            if metric.summable:
+                series = metric.snapshot()
+                if series is not None:
+                    values[metric.name] = series
+        return values
+
+    def _shared_values(self) -> dict:
+        """本进程现在的值 + 共享目录里其他进程的（包括父进程那份里已退出的 worker）"""
+        self.write_shared()
+        values = self._local_values()
+        _merge(values, self._retired)
+        own = f'{self._share_name}.json'
+        with self._dir_lock(fcntl.LOCK_SH):
+            for entry in os.listdir(self._share_dir):
+                if entry.endswith('.json') and entry != own:
+                    _merge(values, self._read_shared(os.path.join(self._share_dir, entry)) or {})
+        return values
+
+    def render(self) -> str:
+        shared = self._shared_values() if self._share_dir is not None else None
+        lines = []
+        for metric in self._metrics:
+            if shared is not None and metric.summable:
+                if metric.name in shared:
+                    lines.extend(metric.render(shared[metric.name]))
+            else:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,154 @@
+"""
+协会整体的汇总和志愿者时长排名，加载数据时直接从流水账算出来（不再手填）。
+
+- 总时长 / 活动场数 / 人数，按活动类型、按月份的时长和人次
+- 活动场数按 (活动名称, 日期) 去重：同名活动在不同日期办的算不同场
+- 每人总时长排好序存成数组，某人排第几、超过了多少人用二分查找，不用每次扫一遍
+- 追加新记录时只用新行更新：总数、按类型、按月直接累加，排名数组只换掉这次有新记录的人
+- 建好之后只读，更新是返回一份新的（和 Dataset 一样整份换上）
+"""
+import numpy as np
+import pandas as pd
+
+DAY_BITS = 20   # 活动场次的 key = (活动名称编码 << DAY_BITS) + 日期是第几天 + 1，日期缺失为 0
+
+
+class OrgAggregates:
+    def __init__(self, type_keys, n_rows, type_hours, type_records, event_keys, event_types,
+                 months, month_hours, month_records, user_totals, sorted_hours):
+        self.type_keys = list(type_keys)    # _type_code 下标 → 雷达图维度（teaching / care / ...）
+        self.n_rows = n_rows                # 已经算进来的行数，之后的行是追加的
+        self.type_hours = type_hours        # 按类型的总时长
+        self.type_records = type_records    # 按类型的人次（记录数）
+        self.event_keys = event_keys        # 所有活动场次的 key（排好序、去重）
+        self.event_types = event_types      # 每场活动涉及哪些类型（位掩码，和 event_keys 对齐）
+        self.months = months                # yyyymm（排好序）
+        self.month_hours = month_hours
+        self.month_records = month_records
+        self.user_totals = user_totals      # (name, phone) → (总时长, 活动次数)，总时长和报告里的 totalHours 一致
+        self.sorted_hours = sorted_hours    # 每人总时长，从小到大
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, user_index: dict, type_keys) -> 'OrgAggregates':
+        """从整份流水账算（df 要有 add_row_features 加的派生列）"""
+        empty = cls(type_keys, 0, np.zeros(len(type_keys)), np.zeros(len(type_keys), np.int64),
+                    np.zeros(0, np.int64), np.zeros(0, np.uint8),
+                    np.zeros(0, np.int64), np.zeros(0), np.zeros(0, np.int64), {}, np.zeros(0))
+        return empty.extend(df, user_index)
+
+    def extend(self, df: pd.DataFrame, user_index: dict) -> 'OrgAggregates':
+        """
+        df 是追加之后的完整数据（前 n_rows 行和之前一样），只看后面新加的行，返回更新后的一份。
+        user_index 是新数据的索引，有新记录的人按它重新算总时长。
+        """
+        new = df.iloc[self.n_rows:]
+        if new.empty:
+            return self
+        hours = new['hours'].to_numpy(np.float64)
+        type_code = new['_type_code'].to_numpy(np.int64)
+        month = new['_month'].to_numpy(np.int64)
+        n_types = len(self.type_keys)
+
+        type_hours = self.type_hours + np.bincount(type_code, weights=hours, minlength=n_types)
+        type_records = self.type_records + np.bincount(type_code, minlength=n_types)
+
+        # 活动场次：新行的 key 和已有的合并去重，涉及的类型按位或上去
+        act_codes = new['activity_name'].cat.codes.to_numpy().astype(np.int64)
+        dates = new['activity_date'].to_numpy()
+        day = np.where(np.isnat(dates), 0, dates.astype('datetime64[D]').astype(np.int64) + 1)
+        named = act_codes >= 0
+        keys = np.concatenate([self.event_keys, (act_codes[named] << DAY_BITS) + day[named]])
+        bits = np.concatenate([self.event_types, (1 << type_code[named]).astype(np.uint8)])
+        event_keys, inverse = np.unique(keys, return_inverse=True)
+        event_types = np.zeros(len(event_keys), np.uint8)
+        np.bitwise_or.at(event_types, inverse, bits)
+
+        # 按月：只看有日期的行，和已有的月份合并
+        dated = month >= 0
+        months, inverse = np.unique(np.concatenate([self.months, month[dated]]), return_inverse=True)
+        old, added = inverse[:len(self.months)], inverse[len(self.months):]
+        month_hours = np.bincount(old, weights=self.month_hours, minlength=len(months)) \
+            + np.bincount(added, weights=hours[dated], minlength=len(months))
+        month_records = np.bincount(old, weights=self.month_records, minlength=len(months)).astype(np.int64) \
+            + np.bincount(added, minlength=len(months))
+
+        # 有新记录的人重新算总时长（整份算时就是所有人），一次 reduceat 把每人的行加起来
+        if self.n_rows == 0:
+            touched = list(user_index)
+        else:
+            names, phones = new['name'].cat, new['phone'].cat
+            name_codes = names.codes.to_numpy().astype(np.int64)
+            phone_codes = phones.codes.to_numpy().astype(np.int64)
+            known = (name_codes >= 0) & (phone_codes >= 0)
+            width = max(len(phones.categories), 1)
+            pairs = np.unique(name_codes[known] * width + phone_codes[known])
+            name_cats, phone_cats = names.categories.tolist(), phones.categories.tolist()
+            touched = [key for key in ((name_cats[a], phone_cats[b])
+                                       for a, b in zip((pairs // width).tolist(), (pairs % width).tolist()))
+                       if key in user_index]
+
+        user_totals = dict(self.user_totals)
+        removed = [user_totals[key][0] for key in touched if key in user_totals]
+        added = []
+        if touched:
+            positions = [user_index[key] for key in touched]
+            counts = np.fromiter(map(len, positions), np.int64, len(positions))
+            starts = np.r_[0, np.cumsum(counts)[:-1]]
+            sums = np.add.reduceat(df['hours'].to_numpy()[np.concatenate(positions)], starts)
+            for key, total, count in zip(touched, sums.tolist(), counts.tolist()):
+                user_totals[key] = (round(float(total), 1), count)
+                added.append(user_totals[key][0])
+
+        return OrgAggregates(self.type_keys, len(df), type_hours, type_records, event_keys, event_types,
+                             months, month_hours, month_records, user_totals,
+                             replace_sorted(self.sorted_hours, removed, added))
+
+    @property
+    def total_people(self) -> int:
+        return len(self.user_totals)
+
+    def rank(self, hours: float) -> dict:
+        """总时长为 hours 的人排第几（并列算同一名）、超过了百分之多少的其他志愿者"""
+        n = len(self.sorted_hours)
+        below = int(np.searchsorted(self.sorted_hours, hours, 'left'))
+        above = n - int(np.searchsorted(self.sorted_hours, hours, 'right'))
+        return {
+            "rank": above + 1,
+            "total": n,
+            "percentile": round(below * 100 / (n - 1), 1) if n > 1 else 0.0,
+        }
+
+    def summary(self) -> dict:
+        """放进协会公共数据（org_data）里的部分"""
+        return {
+            "total_org_hours": round(float(self.type_hours.sum()), 1),
+            "total_events": len(self.event_keys),
+            "total_people": self.total_people,
+            "total_records": int(self.type_records.sum()),
+            "type_totals": {
+                key: {
+                    "hours": round(float(self.type_hours[i]), 1),
+                    "records": int(self.type_records[i]),
+                    "events": int(np.count_nonzero(self.event_types & (1 << i))),
+                }
+                for i, key in enumerate(self.type_keys)
+            },
+            "month_totals": [
+                {"month": f"{m // 100:04d}-{m % 100:02d}", "hours": round(float(h), 1), "records": int(r)}
+                for m, h, r in zip(self.months, self.month_hours, self.month_records)
+            ],
+        }
+
+
+def replace_sorted(arr: np.ndarray, removed, added) -> np.ndarray:
+    """从有序数组里去掉 removed 里的值（各去一个）、插入 added，结果仍然有序，不整体重排"""
+    if len(removed):
+        removed = np.sort(np.asarray(removed, np.float64))
+        # 同一个值要去掉几个，就从它第一次出现的位置往后数几个
+        first = np.searchsorted(removed, removed, 'left')
+        pos = np.searchsorted(arr, removed, 'left') + (np.arange(len(removed)) - first)
+        arr = np.delete(arr, pos)
+    if len(added):
+        added = np.sort(np.asarray(added, np.float64))
+        arr = np.insert(arr, np.searchsorted(arr, added, 'left'), added)
+    return arr
@@ -0,0 +1,77 @@
+"""
+按年份分区的往年数据：第一次被请求时才加载，内存里最多留 max_loaded 份，多了卸载最久没用的（LRU）。
+
+- 同一年份同时来多个请求只加载一次，其余的等它加载完直接用；不同年份互不阻塞
+- is_stale(key, value) 由调用方给出（一般是比对源文件签名），返回 True 就丢掉旧的重新加载
+- 卸载只是不再引用，正在用这份数据的请求不受影响
+"""
+import threading
+from collections import OrderedDict
+
+
+class PartitionCache:
+    def __init__(self, loader, max_loaded: int, is_stale=None):
+        self.loader = loader
+        self.max_loaded = max_loaded
+        self.is_stale = is_stale
+        self._loaded = OrderedDict()   # key → value，最近用过的在最后
+        self._loading = {}             # key → 这个 key 的加载锁
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            value = self._loaded.get(key)
+        if value is None:
+            return None
+        if self.is_stale is not None and self.is_stale(key, value):
+            self.discard(key)
+            return None
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def get(self, key):
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # 排队期间可能已经被别的请求加载好了
+            value = self._lookup(key)
+            if value is not None:
+                return value
+
+            value = self.loader(key)
+            with self._lock:
+                self._loaded[key] = value
+                self.loads += 1
+                while len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._loaded.pop(key, None)
+
+    def loaded_keys(self) -> list:
+        with self._lock:
+            return list(self._loaded)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": list(self._loaded),
+                "max_loaded": self.max_loaded,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,86 @@
+"""
+线上按需剖析单个请求：把整个请求放在 cProfile 下跑，结果写成 .prof 文件（可用 snakeviz / pstats 查看）。
+
+两种触发方式（都不开时什么也不做）：
+- 请求头带上和配置一致的口令（X-Profile-Token），只剖析这一个请求，响应头 X-Profile-File 给出文件名
+- 按采样率随机剖析
+
+同一时间只剖析一个请求（cProfile 不能在多个线程里同时开），轮到时正忙就照常处理不剖析。
+目录里只保留最近 keep 个文件。
+"""
+import os
+import hmac
+import time
+import random
+import cProfile
+import threading
+from functools import wraps
+
+from flask import request
+
+TOKEN_HEADER = 'X-Profile-Token'
+
+
+class RequestProfiler:
+    def __init__(self, directory: str, keep: int = 50, token: str = '', sample_rate: float = 0.0):
+        self.directory = directory
+        self.keep = keep
+        self.token = token
+        self.sample_rate = sample_rate
+        self._busy = threading.Lock()
+
+    def _wanted(self):
+        """这次要不要剖析：返回 'token' / 'sample' / None"""
+        if self.token:
+            given = request.headers.get(TOKEN_HEADER)
+            if given and hmac.compare_digest(given.encode('utf-8'), self.token.encode('utf-8')):
+                return 'token'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def profiled(self, view):
+        """装饰路由函数"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            trigger = self._wanted()
+            if trigger is None or not self._busy.acquire(blocking=False):
+                return view(*args, **kwargs)
+
+            try:
+                profile = cProfile.Profile()
+                start = time.perf_counter()
+                resp = profile.runcall(view, *args, **kwargs)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                filename = self._save(profile, view.__name__, elapsed_ms)
+            finally:
+                self._busy.release()
+
+            if trigger == 'token' and filename and hasattr(resp, 'headers'):
+                resp.headers['X-Profile-File'] = filename
+            return resp
+        return wrapper
+
+    def _save(self, profile: cProfile.Profile, label: str, elapsed_ms: float):
+        """写文件（文件名带时间和耗时，方便挑慢的看），再删掉多出来的旧文件；写不了只打印，不影响请求"""
+        now = time.time()
+        filename = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1e6) % 1_000_000:06d}_{label}_{elapsed_ms:.0f}ms.prof"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, filename))
+            self._prune()
+        except OSError as e:
+            print(f"[profile] 写剖析文件失败：{e}")
+            return None
+        return filename
+
+    def _prune(self):
+        files = [e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith('.prof')]
+        if len(files) <= self.keep:
+            return
+        files.sort(key=lambda e: e.stat().st_mtime)
+        for entry in files[:len(files) - self.keep]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
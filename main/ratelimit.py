@@ -0,0 +1,96 @@
+"""
+按客户端限流：同时在处理的请求数上限 + 令牌桶限速，超出的请求直接返回 429，不进入报告计算。
+
+- 令牌桶：每秒补充 rate 个，最多攒 burst 个；一次请求消耗 cost 个（批量查询按人数算），
+  cost 比 burst 还大的请求永远攒不够，直接拒绝（413），不会被打折放行
+- 并发：同一客户端同时在处理的请求超过 max_concurrent 个就拒绝
+- 客户端按 request.remote_addr 区分（在反向代理后面要先用 ProxyFix 还原真实地址）
+- 每个进程各管各的；客户端表超过 max_clients 时清掉空闲的（没有请求在处理、令牌已补满）
+"""
+import math
+import time
+import threading
+from functools import wraps
+
+from flask import request, jsonify
+
+
+class ClientLimiter:
+    def __init__(self, max_concurrent: int = 0, rate: float = 0.0, burst: float = 0.0, max_clients: int = 10000):
+        self.max_concurrent = max_concurrent   # 0 = 不限并发
+        self.rate = rate                       # 0 = 不限速
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        self._clients = {}    # 客户端 → [剩余令牌, 上次补充的时间, 正在处理的请求数]
+        self._lock = threading.Lock()
+        self.rejected = {'concurrency': 0, 'rate': 0, 'size': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0 or self.rate > 0
+
+    def try_acquire(self, client: str, cost: float = 1.0):
+        """放行返回 None（处理完要调 release）；拒绝返回 (原因, 建议多少秒后重试)，原因为 size 时重试也没用"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._clients.get(client)
+            if state is None:
+                if len(self._clients) >= self.max_clients:
+                    self._prune(now)
+                state = self._clients[client] = [self.burst, now, 0]
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+
+            if self.rate > 0 and cost > self.burst:
+                self.rejected['size'] += 1
+                return 'size', 0
+            if self.max_concurrent and state[2] >= self.max_concurrent:
+                self.rejected['concurrency'] += 1
+                return 'concurrency', 1
+            if self.rate > 0:
+                if state[0] < cost:
+                    self.rejected['rate'] += 1
+                    return 'rate', max(1, math.ceil((cost - state[0]) / self.rate))
+                state[0] -= cost
+            state[2] += 1
+            return None
+
+    def release(self, client: str):
+        with self._lock:
+            state = self._clients.get(client)
+            if state is not None:
+                state[2] -= 1
+
+    def _prune(self, now: float):
+        for client, (tokens, last, active) in list(self._clients.items()):
+            if active == 0 and (self.rate <= 0 or tokens + (now - last) * self.rate >= self.burst):
+                del self._clients[client]
+
+    def limited(self, cost=None):
+        """
+        装饰路由函数；cost 是返回这次请求消耗多少令牌的函数（不传就是 1）。
+        被拒绝时返回 429 + Retry-After（单个请求就超过令牌桶容量时返回 413），响应格式和接口出错时一样。
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                client = request.remote_addr or ''
+                rejected = self.try_acquire(client, cost() if cost else 1.0)
+                if rejected is not None:
+                    reason, retry_after = rejected
+                    if reason == 'size':
+                        resp = jsonify({"success": False, "error": f"一次请求的量太大，最多 {int(self.burst)}"})
+                        resp.status_code = 413
+                        return resp
+                    resp = jsonify({"success": False, "error": "请求太频繁，请稍后再试"})
+                    resp.status_code = 429
+                    resp.headers['Retry-After'] = str(retry_after)
+                    return resp
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    self.release(client)
+            return wrapper
+        return decorator
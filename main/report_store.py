@@ -0,0 +1,65 @@
+"""
+预计算报告库：每位志愿者一行，(name, phone) → 已编码好的报告 JSON。
+
+用 sqlite 单文件存储：离线批量写一次（先写临时文件再整体替换），
+线上只读、按主键查，每个线程各自持有一个只读连接。
+"""
+import os
+import sqlite3
+from functools import cached_property
+import threading
+
+
+class ReportStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    @cached_property
+    def data_version(self):
+        """生成这份报告库时的数据版本，和当前数据对不上就不能用（文件只会整份替换，读一次就够）"""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def get(self, name: str, phone: str):
+        """按 (姓名, 清洗后手机号) 取报告，返回 bytes；库里没有返回 None"""
+        row = self._conn().execute(
+            "SELECT body FROM reports WHERE name = ? AND phone = ?", (name, phone)
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    @classmethod
+    def write(cls, path: str, data_version: str, items) -> int:
+        """
+        items: 可迭代的 (name, phone, body_bytes)。
+        写到临时文件，全部写完后 os.replace，线上读到的永远是完整的一份。
+        """
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE reports (name TEXT, phone TEXT, body BLOB, PRIMARY KEY (name, phone))")
+            conn.execute("INSERT INTO meta VALUES ('data_version', ?)", (data_version,))
+            count = 0
+            for name, phone, body in items:
+                conn.execute("INSERT INTO reports VALUES (?, ?, ?)", (name, phone, body))
+                count += 1
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.replace(tmp_path, path)
+        return count
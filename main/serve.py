@@ -0,0 +1,247 @@
+"""
+线上多进程启动入口：数据只在父进程加载、建索引一次，再 fork 出多个 worker 共享（写时复制）。
+
+    python serve.py --port 4399 --workers 4 --threads 8
+
+- 父进程：import app（加载数据）→ 监听端口 → gc.freeze() → fork workers；
+  之后负责拉起意外退出的 worker，并定时检查数据文件，有变化就在父进程重新加载，
+  再逐个换掉 worker（新的先起来，旧的处理完手上的请求再退出）
+- worker：共用父进程监听的端口，每个 worker 用固定大小的线程池处理请求；
+  手上的请求（处理中 + 排队）到了 threads + queue 个就先不 accept，新连接留在内核队列里给别的 worker
+- gc.freeze() 把加载好的对象移出垃圾回收的扫描范围，GC 不会去碰这些对象，
+  对应的内存页在 worker 里就一直和父进程共享，worker 多了内存不跟着翻倍
+- 信号：TERM / INT 停止服务，HUP 强制重新加载数据并换掉所有 worker
+- /metrics：各 worker 的计数合起来输出（metrics.Registry.share，共享目录是启动时建的临时目录），
+  不管抓到哪个 worker 都是整个服务的总数，换 worker 时也不会往回掉
+
+调试仍然用 `python app.py`。
+"""
+import os
+import gc
+import sys
+import time
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+import app as report_app
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    用固定大小线程池处理请求的 WSGI server（werkzeug 自带的多线程版本是来一个请求开一个线程）。
+    线程池的队列本身不设上限，这里用信号量限住手上的请求数（threads 个在处理 + 最多 queue 个排队），
+    满了 accept 循环就停下来等，不会把连接无限堆在内存里。
+    """
+
+    def __init__(self, host, port, app, threads: int, queue: int, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+        self.slots = threading.BoundedSemaphore(threads + queue)
+
+    def get_request(self):
+        # 监听端口是非阻塞的：几个 worker 同时被唤醒时，没抢到连接的直接返回，不会卡在 accept 上
+        conn, addr = self.socket.accept()
+        conn.setblocking(True)
+        return conn, addr
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()   # 满了就等一个请求处理完，这期间不再 accept
+        self.pool.submit(self._process_request_in_pool, request, client_address)
+
+    def _process_request_in_pool(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+
+def run_worker(listener: socket.socket, threads: int, queue: int, metrics_dir: str):
+    """worker 进程：在继承来的监听端口上处理请求，直到收到 TERM"""
+    report_app.metrics.share(metrics_dir, reset=True)   # 从父进程继承来的计数清零，只记自己的
+    report_app.metrics.start_share_thread()
+    server = PooledWSGIServer(*listener.getsockname()[:2], report_app.app, threads, queue, fd=listener.fileno())
+
+    def stop(signum, frame):
+        # shutdown() 要等 serve_forever 退出，不能在跑 serve_forever 的线程里直接调
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        server.serve_forever()
+    finally:
+        server.pool.shutdown(wait=True)   # 手上的请求处理完再关
+        server.server_close()
+        report_app.metrics.write_shared()   # 最后的计数留给父进程并进去
+
+
+class Master:
+    def __init__(self, listener: socket.socket, workers: int, threads: int, queue: int, watch_interval: float,
+                 metrics_dir: str):
+        self.listener = listener
+        self.workers = workers
+        self.threads = threads
+        self.queue = queue
+        self.metrics_dir = metrics_dir
+        self.watch_interval = watch_interval
+        self.children = set()     # 正在服务的 worker
+        self.retiring = set()     # 数据更新后被换下来、正在处理完手上请求的 worker
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.listener, self.threads, self.queue, self.metrics_dir)
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children.add(pid)
+        return pid
+
+    def freeze(self):
+        """让已加载的数据留在不被 GC 扫描的代里（fork 之前做，worker 才能一直共享这些内存页）"""
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    def replace_workers(self):
+        """数据换了：按新数据起一批 worker，再让旧的处理完手上的请求后退出"""
+        self.freeze()
+        old, self.children = self.children, set()
+        for _ in range(self.workers):
+            self.spawn()
+        for pid in old:
+            self.retiring.add(pid)
+            self.signal_child(pid, signal.SIGTERM)
+
+    def signal_child(self, pid: int, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        """回收退出的 worker（它的监控计数并进父进程那份）；不是我们让它退的，主循环会补一个"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            report_app.metrics.retire(str(pid))
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif pid in self.children:
+                self.children.discard(pid)
+                if not self.stopping:
+                    print(f"[serve] worker {pid} 意外退出（{status}），重新拉起")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_hup)
+
+        report_app.metrics.share(self.metrics_dir)   # 父进程自己的计数（加载数据次数等）+ 已退出的 worker
+        self.freeze()
+        for _ in range(self.workers):
+            self.spawn()
+        host, port = self.listener.getsockname()[:2]
+        print(f"[serve] http://{host}:{port}  {self.workers} 个 worker × {self.threads} 线程，"
+              f"{len(report_app.df_records)} 行数据，版本 {report_app.dataset.version}")
+
+        last_check, last_seen = time.monotonic(), None
+        while not self.stopping:
+            time.sleep(0.5)
+            self.reap()
+            report_app.metrics.write_shared()
+            while not self.stopping and len(self.children) < self.workers:
+                self.spawn()
+
+            if self.reload_requested:
+                self.reload_requested = False
+                try:
+                    report_app.load_data()
+                except Exception:
+                    # 新数据有问题：打出来，继续用旧数据，worker 也不换
+                    traceback.print_exc()
+                    continue
+                self.replace_workers()
+                continue
+
+            # 和 app.start_data_watcher 一样：同一个文件签名连续两次看到才重新加载
+            if self.watch_interval > 0 and time.monotonic() - last_check >= self.watch_interval:
+                last_check = time.monotonic()
+                seen = report_app.file_signature(report_app.CSV_PATH), report_app.file_signature(report_app.ORG_STATS_PATH)
+                try:
+                    if seen == last_seen and seen != report_app.dataset.source_signature:
+                        if report_app.reload_data_if_changed():
+                            self.replace_workers()
+                except Exception:
+                    traceback.print_exc()
+                last_seen = seen
+
+        for pid in self.children | self.retiring:
+            self.signal_child(pid, signal.SIGTERM)
+        while True:
+            try:
+                os.wait()
+            except ChildProcessError:
+                break
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_hup(self, signum, frame):
+        self.reload_requested = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='年度报告多进程服务')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=4399)
+    parser.add_argument('--workers', type=int, default=0, help='worker 进程数，0 表示和 CPU 核数一样')
+    parser.add_argument('--threads', type=int, default=8, help='每个 worker 的线程数')
+    parser.add_argument('--queue', type=int, default=None,
+                        help='每个 worker 最多排队等线程的请求数，默认和 --threads 一样；满了就先不接新连接')
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--watch-interval', type=float, default=report_app.DATA_WATCH_INTERVAL,
+                        help='检查数据文件变化的间隔（秒），0 表示不检查')
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, 'fork'):
+        sys.exit('serve.py 需要 os.fork（Linux / macOS）')
+
+    listener = socket.create_server((args.host, args.port), backlog=args.backlog)
+    listener.set_inheritable(True)
+    listener.setblocking(False)
+    queue = args.threads if args.queue is None else args.queue
+    metrics_dir = tempfile.mkdtemp(prefix='report-metrics-')
+    try:
+        Master(listener, args.workers or os.cpu_count() or 1, args.threads, queue, args.watch_interval, metrics_dir).run()
+    finally:
+        listener.close()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+同一个 key 同时只算一次（single-flight）：第一个请求去算，同时到的其余请求等它算完，拿同一个结果。
+
+链接在群里传开时，同一个人的报告会在几毫秒内被请求几十次；缓存还没填上之前，
+这些请求不再各算一遍。算的过程抛了异常，等着的请求也拿到同一个异常。
+只合并“同时在算”的请求，算完就撤掉，结果要不要缓存由调用方决定。
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}    # key → 正在算的 _Call
+        self._lock = threading.Lock()
+        self.shared = 0     # 等别人算好、直接拿结果的次数
+
+    def do(self, key, fn):
+        """返回 (fn() 的结果, 是否是等别人算好的)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,72 @@
+"""
+清洗后数据的二进制快照（NumPy .npz），启动时直接读列，不再解析 CSV。
+
+- 字符串列 / category 列存成 “整数编码 + 字符串表”，缺失值编码为 -1，
+  读回来时 category 列还是 category，字符串列还原成字符串
+- 其余列（日期 / 时长 / 派生字段）按原 dtype 原样存
+- meta 是一段 JSON，由调用方决定放什么（一般是源文件的大小 / mtime / 哈希）
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def _is_text(series: pd.Series) -> bool:
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+def save_snapshot(path: str, df: pd.DataFrame, meta: dict):
+    """写到临时文件再 os.replace，读的一方不会看到写了一半的快照"""
+    arrays = {}
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            arrays[f'{i}.codes'] = series.cat.codes.to_numpy().astype(np.int32)
+            arrays[f'{i}.cats'] = np.asarray(series.cat.categories, dtype=str)
+            columns.append({"name": col, "kind": "category"})
+        elif _is_text(series):
+            codes, cats = pd.factorize(series)
+            arrays[f'{i}.codes'] = codes.astype(np.int32)
+            arrays[f'{i}.cats'] = np.asarray(cats, dtype=str)
+            columns.append({"name": col, "kind": "text"})
+        else:
+            arrays[f'{i}.values'] = series.to_numpy()
+            columns.append({"name": col, "kind": "values"})
+
+    arrays['meta'] = np.array(json.dumps({**meta, "columns": columns}, ensure_ascii=False))
+
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot_meta(path: str):
+    """只读 meta（npz 是按需解压的，不会把整份数据读进来）；读不了返回 None"""
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            return json.loads(str(npz['meta']))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_snapshot(path: str) -> pd.DataFrame:
+    with np.load(path, allow_pickle=False) as npz:
+        meta = json.loads(str(npz['meta']))
+        data = {}
+        for i, column in enumerate(meta['columns']):
+            if column['kind'] == 'category':
+                categories = pd.Index(npz[f'{i}.cats'].astype(object), dtype=str)
+                data[column['name']] = pd.Categorical.from_codes(npz[f'{i}.codes'], categories)
+            elif column['kind'] == 'text':
+                codes = npz[f'{i}.codes']
+                cats = npz[f'{i}.cats'].astype(object)
+                valid = codes >= 0
+                values = np.full(len(codes), np.nan, dtype=object)
+                values[valid] = cats[codes[valid]]
+                data[column['name']] = pd.Series(values, dtype=str)
+            else:
+                data[column['name']] = pd.Series(npz[f'{i}.values'])
+    return pd.DataFrame(data)
@@ -1,17 +1,82 @@
-export async function fetchAnnualData({ name, phone }) {
-  const apiUrl = window.API_URL || "/api/get_annual_data";
-  const resp = await fetch(apiUrl, {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-      "X-Requested-With": "XMLHttpRequest",
-    },
-    body: JSON.stringify({ name, phone }),
-  });
+// 协会公共数据（所有人都一样）按版本号只取一次：org_version → Promise<org_data>
+const orgStatsCache = new Map();
+
+// 要看哪一年的报告（页面地址 ?year=2024），null 为当前年度
+function reportYear() {
+  return window.REPORT_YEAR ?? null;
+}
+
+// 静态模式：{ base, salt }，报告是 flask static-export 导出的静态文件，不经过 Python
+const staticReports = window.STATIC_REPORTS || null;
+
+// 和 app.py 的 static_report_key 一致：sha256(盐 + 姓名 + 只留数字的学号)
+async function staticReportKey(name, phone) {
+  const text = `${staticReports.salt}\n${name.trim()}\n${String(phone).replace(/\D/g, "")}`;
+  const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+async function fetchStaticReport({ name, phone }) {
+  const key = await staticReportKey(name, phone);
+  let resp = await fetch(`${staticReports.base}${key.slice(0, 2)}/${key}.json`);
+  if (resp.status === 404) {
+    // 没有这个人的文件：和接口一样返回访客报告
+    resp = await fetch(`${staticReports.base}guest.json`);
+  }
+  return resp;
+}
+
+export function fetchOrgStats(version, year = reportYear()) {
+  if (!orgStatsCache.has(version)) {
+    let url;
+    if (staticReports) {
+      url = `${staticReports.base}org/${encodeURIComponent(version)}.json`;
+    } else {
+      const orgUrl = window.ORG_STATS_URL || "/api/org_stats";
+      const params = new URLSearchParams({ v: version });
+      if (year != null) {
+        params.set("year", year);
+      }
+      url = `${orgUrl}?${params}`;
+    }
+    const promise = fetch(url).then((resp) => {
+      if (!resp.ok) {
+        throw new Error("Request failed");
+      }
+      return resp.json();
+    });
+    // 失败了不留在缓存里，下次重新请求
+    promise.catch(() => orgStatsCache.delete(version));
+    orgStatsCache.set(version, promise);
+  }
+  return orgStatsCache.get(version);
+}
+
+export async function fetchAnnualData({ name, phone, year = reportYear() }) {
+  let resp;
+  if (staticReports) {
+    resp = await fetchStaticReport({ name, phone });
+  } else {
+    const apiUrl = window.API_URL || "/api/get_annual_data";
+    resp = await fetch(apiUrl, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-Requested-With": "XMLHttpRequest",
+      },
+      // slim：报告里不带协会公共数据，只带版本号，公共数据单独请求并缓存
+      body: JSON.stringify({ name, phone, slim: true, year }),
+    });
+  }
 
   const json = await resp.json().catch(() => ({}));
   if (!resp.ok) {
     throw new Error(json?.message || "Request failed");
   }
+
+  const data = json?.data;
+  if (data && !data.org_data && data.org_version) {
+    data.org_data = await fetchOrgStats(data.org_version, year);
+  }
   return json;
 }
@@ -46,7 +46,8 @@ export function makePoster() {
         document.getElementById('p-label2').innerText = "核心领域";
     } else {
         nameEl.innerText = "未来的伙伴";
-        descEl.innerHTML = `2024年的故事里还没找到你，<br>愿2025年，我们能并肩同行。`;
+        const year = window.DISPLAY_YEAR;   // 报告是哪一年的，模板里给出
+        descEl.innerHTML = `${year}年的故事里还没找到你，<br>愿${year + 1}年，我们能并肩同行。`;
 
         document.getElementById('p-data1').innerText = data.org_data.total_people || 500;
         document.getElementById('p-label1').innerText = "汇聚爱心";
@@ -9,6 +9,7 @@ import { showHeatmapTip } from "../features/heatmap.js";
  * - imports initRadar/initConstellation/showHeatmapTip
  */
 export function generateDynamicSlides(data) {
+    const year = window.DISPLAY_YEAR;   // 报告是哪一年的，模板里给出
     if (state.swiper.slides.length > 2) {
         state.swiper.removeSlide([2, 3, 4]);
     }
@@ -62,6 +63,15 @@ export function generateDynamicSlides(data) {
         `;
     }).join('');
 
+    // 时长排名：超过了多少伙伴（只有一位志愿者时不显示）
+    const rank = data.hours_rank;
+    const rankHtml = rank && rank.total > 1 ? `
+        <div style="margin-top:18px; text-align:center; font-size:0.85rem; color:#666; line-height:1.6;">
+            全年服务 <b style="color:#A61C26;">${data.totalHours}</b> 小时，在 ${rank.total} 位志愿者中排第 ${rank.rank}<br>
+            超过了 <b style="color:#A61C26;">${rank.percentile}%</b> 的伙伴
+        </div>
+    ` : '';
+
     // === 4. 组装 Slide HTML (印章 + 现代列表) ===
     slides.push(`
         <div class="swiper-slide">
@@ -87,6 +97,7 @@ export function generateDynamicSlides(data) {
                 <div class="skill-list" style="margin-top:25px;">
                     ${barsHtml}
                 </div>
+                ${rankHtml}
                 <div style="margin-top:20px; text-align:center;">
                     <span class="data-doubt-link" onclick="openDataExplanation()">
                         如对数据有疑问请点击此处反馈哦~
@@ -339,7 +350,7 @@ export function generateDynamicSlides(data) {
                         </div>
                         
                         <div style="text-align:right; margin-top:10px; color:var(--ruc-red); font-size:0.85rem; flex-shrink: 0;">
-                            2025 商院青协
+                            ${year} 商院青协
                         </div>
                     </div>
                 </div>
@@ -401,7 +412,7 @@ export function generateDynamicSlides(data) {
         slides.push(`
             <div class="swiper-slide">
                 <div class="paper-card ani" data-ani="animate__fadeInUp" style="text-align:center; padding: 40px 20px;">
-                    <div style="color:var(--ruc-red); letter-spacing:2px; font-weight:bold; margin-bottom:20px;">RMBS 2025</div>
+                    <div style="color:var(--ruc-red); letter-spacing:2px; font-weight:bold; margin-bottom:20px;">RMBS ${year}</div>
                     <h1 style="font-size:2rem; color:#333; margin:0;">汇聚微光</h1>
                     <div style="margin-top:40px; display:flex; flex-direction:column; gap:25px;">
                         <div>
@@ -412,6 +423,10 @@ export function generateDynamicSlides(data) {
                             <div style="font-size:2.5rem; color:var(--ruc-red); font-family:'Impact';">${org.total_events}</div>
                             <div style="font-size:0.8rem; color:#666;">开展公益活动 (场)</div>
                         </div>
+                        <div>
+                            <div style="font-size:2.5rem; color:var(--ruc-red); font-family:'Impact';">${org.total_people}</div>
+                            <div style="font-size:0.8rem; color:#666;">参与志愿者 (人)</div>
+                        </div>
                     </div>
                 </div>
             </div>
@@ -0,0 +1,57 @@
+"""
+测试用的数据：import app 之前先把数据目录（REPORT_DATA_DIR）指到一个临时目录，
+里面放 gen_records 生成的模拟流水账（当前年度 + 一份往年），不读也不改 data/ 下的真实数据。
+
+在 main/ 目录下运行：python -m pytest -q
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'tools'))
+
+from gen_records import generate  # noqa: E402
+
+ROWS = 3000          # 当前年度的行数，几百位志愿者，够覆盖多日活动、重名、脏数据
+PAST_YEAR = 2024
+PAST_ROWS = 2000
+
+DATA_DIR = tempfile.mkdtemp(prefix='report-tests-')
+os.makedirs(os.path.join(DATA_DIR, 'years'))
+generate(ROWS, seed=7).to_csv(os.path.join(DATA_DIR, 'volunteer_records.csv'), index=False, encoding='utf-8-sig')
+generate(PAST_ROWS, seed=PAST_YEAR, year=PAST_YEAR).to_csv(
+    os.path.join(DATA_DIR, 'years', f'{PAST_YEAR}.csv'), index=False, encoding='utf-8-sig')
+os.environ['REPORT_DATA_DIR'] = DATA_DIR
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def report_app():
+    import app
+    return app
+
+
+@pytest.fixture
+def request_context(report_app):
+    """掠影里的图片地址要用 url_for，生成报告需要 request context"""
+    with report_app.app.test_request_context():
+        yield
+
+
+@pytest.fixture
+def records_csv(tmp_path):
+    """写一份模拟流水账到 tmp_path，返回 (路径, 原始 DataFrame)；测试可以自己截取 / 追加"""
+    def write(rows: int = ROWS, seed: int = 11, **kwargs):
+        df = generate(rows, seed=seed, **kwargs)
+        path = str(tmp_path / f'records_{rows}_{seed}.csv')
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+        return path, df
+    return write
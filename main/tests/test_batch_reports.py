@@ -0,0 +1,66 @@
+"""批量生成的报告要和逐人实时计算的逐字节一致"""
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_stats_batch_matches_per_user(report_app):
+    ds = report_app.dataset
+    keys = list(ds.user_index)
+    positions = [ds.user_index[k] for k in keys]
+    order = np.concatenate(positions)
+    group_ids = np.repeat(np.arange(len(keys)), [len(p) for p in positions])
+
+    batch = report_app.calc_stats_batch(ds.df.iloc[order], group_ids, len(keys))
+    assert len(batch) == len(keys)
+    for pos, stats in zip(positions, batch):
+        assert stats == report_app.calc_user_stats(ds.df.iloc[pos])
+
+
+def test_batch_reports_match_single(report_app, request_context):
+    ds = report_app.dataset
+    count = 0
+    for name, phone, report in report_app.iter_personal_reports(ds=ds):
+        single = report_app.build_personal_report(name, report_app.get_user_records(name, phone, ds), ds=ds)
+        assert report_app.encode_report(report) == report_app.encode_report(single), (name, phone)
+        count += 1
+    assert count == len(ds.user_index)
+
+
+def test_batch_lookup_matches_single(report_app, request_context):
+    ds = report_app.dataset
+    people = list(ds.user_index)[:50] + [('不存在的人', '123')]
+
+    report_app.report_cache.clear()
+    batch = report_app.get_report_bodies(people, ds)
+    report_app.report_cache.clear()
+    single = [report_app.get_report_body(name, phone, ds) for name, phone in people]
+    assert batch == single
+    assert batch[-1] is None
+
+
+def test_group_date_sort_matches_sort_values(report_app):
+    """按组排日期（有并列、乱序、缺失）要和每组各自 sort_values 的行顺序一样"""
+    rng = np.random.default_rng(3)
+    days = rng.integers(0, 20, 400).astype('datetime64[D]').astype('datetime64[ns]')
+    days[rng.random(400) < 0.2] = np.datetime64('NaT')
+    days[:60] = np.sort(days[:60])   # 前面几组是排好的，走不用排序的那条路
+    bounds = np.r_[0, np.sort(rng.choice(np.arange(1, 400), 40, replace=False)), 400]
+    for ascending in (True, False):
+        order = report_app.sort_by_date_within_groups(days, bounds, ascending)
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            expected = pd.DataFrame({'activity_date': days[a:b]}).sort_values('activity_date', ascending=ascending)
+            np.testing.assert_array_equal(order[a:b] - a, expected.index.to_numpy())
+
+
+def test_co_volunteers_threads_match_serial(report_app):
+    """星火相聚的按活动缓存被请求线程共用：并发查和逐个查一样，缓存不超过上限"""
+    ds = report_app.Dataset(report_app.dataset.df, report_app.dataset.org_stats, report_app.dataset.csv_info,
+                            report_app.dataset.org_info)
+    ds.co_index.CACHE_SIZE = 16
+    frames = [report_app.get_user_records(name, phone, ds) for name, phone in ds.user_index]
+    serial = [report_app.calc_co_volunteers(df, ds=ds) for df in frames]
+    with ThreadPoolExecutor(8) as pool:
+        threaded = list(pool.map(lambda df: report_app.calc_co_volunteers(df, ds=ds), frames * 3))
+    assert threaded == serial * 3
+    assert len(ds.co_index._cache) <= 16
@@ -0,0 +1,27 @@
+"""压缩响应单独缓存，不影响报告缓存的命中 / 未命中计数"""
+import gzip
+import json
+
+
+def test_compressed_variant_does_not_skew_report_cache(report_app):
+    client = report_app.app.test_client()
+    name, phone = next(iter(report_app.dataset.user_index))
+    report_app.report_cache.clear()
+    report_app.compressed_cache.clear()
+    before = report_app.report_cache.stats()
+    compressed_before = report_app.compressed_cache.stats()
+
+    bodies = []
+    for _ in range(2):
+        resp = client.post('/api/get_annual_data', json={'name': name, 'phone': phone},
+                           headers={'Accept-Encoding': 'gzip'})
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        bodies.append(json.loads(gzip.decompress(resp.data)))
+    assert bodies[0] == bodies[1] and bodies[0]['data']['name'] == name
+
+    after = report_app.report_cache.stats()
+    compressed_after = report_app.compressed_cache.stats()
+    # 第一次：压缩缓存没命中 → 报告缓存没命中（现算）；第二次直接命中压缩缓存，报告缓存不再被查
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses']) == (0, 1)
+    assert (compressed_after['hits'] - compressed_before['hits'],
+            compressed_after['misses'] - compressed_before['misses']) == (1, 1)
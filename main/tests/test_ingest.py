@@ -0,0 +1,82 @@
+"""分块流式读取和整份读取结果一致；格式不对的行进拒收文件（大小文件、追加都一样）"""
+import os
+
+import pandas as pd
+
+REJECT_REASONS = ['日期格式不对', '时长不是数字', '学号里没有数字']
+
+
+def malformed_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """三行格式不对的记录，拒收原因依次是 REJECT_REASONS"""
+    bad = df.iloc[:3].copy()
+    bad.iloc[0, bad.columns.get_loc('活动日期')] = '不是日期'
+    bad.iloc[1, bad.columns.get_loc('服务时长')] = '两小时'
+    bad.iloc[2, bad.columns.get_loc('学号')] = '无'
+    return bad
+
+
+def write_mixed(df: pd.DataFrame, path: str) -> str:
+    mixed = pd.concat([df.iloc[:100], malformed_rows(df), df.iloc[100:]], ignore_index=True)
+    mixed.to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+
+def read_reasons(reject_path: str) -> list:
+    return pd.read_csv(reject_path, dtype=str, encoding='utf-8-sig')['拒收原因'].tolist()
+
+
+def test_stream_matches_whole_file(report_app, records_csv):
+    path, _ = records_csv()
+    with open(path, 'rb') as f:
+        whole, whole_format = report_app.parse_records_csv(f.read())
+
+    reject_path = report_app.rejects_path(path)
+    streamed, stream_format, n_rejected = report_app.ingest_records_stream(path, reject_path, chunk_rows=500)
+
+    assert n_rejected == 0
+    assert not os.path.exists(reject_path)
+    assert stream_format == whole_format
+    pd.testing.assert_frame_equal(streamed, whole)
+
+
+def test_stream_rejects_malformed_rows(report_app, records_csv, tmp_path):
+    path, df = records_csv()
+    mixed_path = write_mixed(df, str(tmp_path / 'mixed.csv'))
+
+    reject_path = report_app.rejects_path(mixed_path)
+    streamed, _, n_rejected = report_app.ingest_records_stream(mixed_path, reject_path, chunk_rows=64)
+    with open(path, 'rb') as f:
+        clean, _ = report_app.parse_records_csv(f.read())
+
+    assert n_rejected == 3
+    assert read_reasons(reject_path) == REJECT_REASONS
+    # 去掉拒收的行以后，和干净的那份一样（类别表里也没有拒收行的值）
+    pd.testing.assert_frame_equal(streamed, clean)
+
+
+def test_small_file_load_rejects_malformed_rows(report_app, records_csv, tmp_path):
+    """不到 STREAM_INGEST_MIN_BYTES 的文件整份一次读，校验和拒收文件和分块读一样"""
+    path, df = records_csv()
+    mixed_path = write_mixed(df, str(tmp_path / 'mixed.csv'))
+    assert os.path.getsize(mixed_path) < report_app.STREAM_INGEST_MIN_BYTES
+
+    loaded, _ = report_app.load_records(mixed_path)
+    with open(path, 'rb') as f:
+        clean, _ = report_app.parse_records_csv(f.read())
+
+    assert read_reasons(report_app.rejects_path(mixed_path)) == REJECT_REASONS
+    pd.testing.assert_frame_equal(loaded, clean)
+
+
+def test_appended_malformed_rows_rejected(report_app, records_csv):
+    path, df = records_csv(rows=500)
+    df_head, info = report_app.load_records(path)
+    reject_path = report_app.rejects_path(path)
+    assert not os.path.exists(reject_path)
+
+    tail = pd.concat([df.iloc[:2], malformed_rows(df), df.iloc[2:4]], ignore_index=True)
+    tail.to_csv(path, mode='a', header=False, index=False, encoding='utf-8')
+    df_appended, _ = report_app.read_appended_records(path, df_head, info)
+
+    assert len(df_appended) == len(df_head) + 4
+    assert read_reasons(reject_path) == REJECT_REASONS
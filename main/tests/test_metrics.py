@@ -0,0 +1,48 @@
+"""多进程共享监控指标：各进程的计数相加，进程退出后总数不往回掉"""
+import pytest
+
+import metrics
+
+pytestmark = pytest.mark.skipif(metrics.fcntl is None, reason='多进程共享要 fcntl（Linux / macOS）')
+
+
+def make_registry(directory, name):
+    registry = metrics.Registry()
+    requests = registry.counter('requests_total', '请求数', ['path'])
+    latency = registry.histogram('latency_seconds', '耗时', buckets=(0.1, 1))
+    registry.callback('rows', '数据行数', lambda: 7)
+    registry.share(str(directory), name=name, reset=True)
+    return registry, requests, latency
+
+
+def samples(text: str) -> dict:
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line and not line.startswith('#')}
+
+
+def test_shared_registries_sum_and_stay_monotonic(tmp_path):
+    master, _, _ = make_registry(tmp_path, 'master')
+    a, requests_a, latency_a = make_registry(tmp_path, 'a')
+    b, requests_b, latency_b = make_registry(tmp_path, 'b')
+
+    requests_a.inc('/x', amount=3)
+    latency_a.observe(0.05)
+    requests_b.inc('/x', amount=2)
+    requests_b.inc('/y')
+    latency_b.observe(0.5)
+    b.write_shared()
+
+    seen = samples(a.render())
+    assert seen['requests_total{path="/x"}'] == 5
+    assert seen['requests_total{path="/y"}'] == 1
+    assert seen['latency_seconds_bucket{le="0.1"}'] == 1
+    assert seen['latency_seconds_bucket{le="1"}'] == 2
+    assert seen['latency_seconds_count'] == 2
+    assert seen['rows'] == 7   # gauge 不相加
+    assert samples(b.render()) == seen
+
+    # b 退出：父进程把它的数并过去，总数不变
+    master.retire('b')
+    assert not (tmp_path / 'b.json').exists()
+    assert samples(a.render()) == seen
+    assert samples(master.render()) == seen
@@ -0,0 +1,14 @@
+"""报告页面上显示的年份跟着要看的那一年走"""
+from conftest import PAST_YEAR
+
+
+def test_report_page_shows_requested_year(report_app):
+    client = report_app.app.test_client()
+    current = client.get('/annual_report').get_data(as_text=True)
+    past = client.get(f'/annual_report?year={PAST_YEAR}').get_data(as_text=True)
+
+    assert f'<title>{report_app.REPORT_YEAR} RMBS' in current
+    assert f'window.DISPLAY_YEAR = {report_app.REPORT_YEAR};' in current
+    assert f'<title>{PAST_YEAR} RMBS' in past
+    assert f'<div class="poster-year-cn">{PAST_YEAR}</div>' in past
+    assert f'window.DISPLAY_YEAR = {PAST_YEAR};' in past
@@ -0,0 +1,67 @@
+"""多进程预计算 / 导出和单进程逐字节一致"""
+import os
+import json
+import sqlite3
+
+from conftest import PAST_YEAR
+
+
+def read_store(path: str):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT name, phone, body FROM reports ORDER BY name, phone").fetchall()
+
+
+def read_export(out: str) -> dict:
+    """静态导出的 reports/ 目录：相对路径 → 内容（manifest 去掉导出时间）"""
+    files = {}
+    reports_dir = os.path.join(out, 'reports')
+    for root, _, names in os.walk(reports_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, reports_dir)] = f.read()
+    manifest = json.loads(files.pop('manifest.json'))
+    manifest.pop('created_at')
+    files['manifest.json'] = manifest
+    return files
+
+
+def test_parallel_shards_match_serial(report_app):
+    serial = [item for shard in report_app.iter_encoded_report_shards(1, 50) for item in shard]
+    parallel = [item for shard in report_app.iter_encoded_report_shards(2, 50) for item in shard]
+    assert len(serial) == len(report_app.dataset.user_index)
+    assert parallel == serial
+
+
+def test_precompute_workers_match(report_app, tmp_path):
+    runner = report_app.app.test_cli_runner()
+    stores = []
+    for workers in (1, 3):
+        out = str(tmp_path / f'store_{workers}.sqlite3')
+        result = runner.invoke(args=['precompute', '--out', out, '--workers', str(workers), '--shard-size', '40'])
+        assert result.exit_code == 0, result.output
+        stores.append(read_store(out))
+    assert len(stores[0]) == len(report_app.dataset.user_index)
+    assert stores[1] == stores[0]
+
+
+def test_static_export_past_year_workers_match(report_app, tmp_path):
+    runner = report_app.app.test_cli_runner()
+    exports = []
+    for workers in (1, 2):
+        out = str(tmp_path / f'export_{workers}')
+        result = runner.invoke(args=['static-export', '--out', out, '--year', str(PAST_YEAR), '--salt', 'test',
+                                     '--workers', str(workers), '--shard-size', '40'])
+        assert result.exit_code == 0, result.output
+        exports.append(read_export(out))
+
+    past = report_app.get_year_dataset(PAST_YEAR)
+    assert exports[0]['manifest.json']['year'] == PAST_YEAR
+    assert exports[0]['manifest.json']['reports'] == len(past.user_index)
+    assert exports[1] == exports[0]
+
+    # 报告里的内容是那一年的（不是当前年度的）
+    name, phone = next(iter(past.user_index))
+    key = report_app.static_report_key('test', name, phone)
+    report = json.loads(exports[1][os.path.join(key[:2], f'{key}.json')])['data']
+    assert report['month_stats'] and all(m['month'].startswith(f'{PAST_YEAR}-') for m in report['month_stats'])
@@ -0,0 +1,50 @@
+"""CSV 末尾追加后只解析新行的结果，要和整份重新读取一致"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def test_append_matches_full_reload(report_app, records_csv, tmp_path, request_context):
+    full_path, df = records_csv()
+    org_data, org_info = report_app.load_org_stats(str(tmp_path / 'no_org_stats.json'))
+
+    path = str(tmp_path / 'appended.csv')
+    n = len(df) * 2 // 3
+    df.iloc[:n].to_csv(path, index=False, encoding='utf-8-sig')
+    df_head, info_head = report_app.load_records(path)
+    ds_head = report_app.Dataset(df_head, org_data, info_head, org_info)
+
+    df.iloc[n:].to_csv(path, mode='a', header=False, index=False, encoding='utf-8')
+    appended = report_app.read_appended_records(path, df_head, info_head)
+    assert appended is not None
+    df_appended, info_appended = appended
+    ds_appended = report_app.Dataset(df_appended, org_data, info_appended, org_info, aggregates=ds_head.aggregates)
+
+    df_full, info_full = report_app.load_records(full_path)
+    ds_full = report_app.Dataset(df_full, org_data, info_full, org_info)
+
+    assert info_appended['sha1'] == info_full['sha1']
+    assert ds_appended.version == ds_full.version
+    # 追加时类别表是合并出来的（编码顺序不同），值要一样
+    pd.testing.assert_frame_equal(df_appended, df_full, check_categorical=False)
+
+    assert set(ds_appended.user_index) == set(ds_full.user_index)
+    for key, positions in ds_full.user_index.items():
+        np.testing.assert_array_equal(ds_appended.user_index[key], positions)
+
+    assert ds_appended.org_json == ds_full.org_json
+    assert ds_appended.user_totals == ds_full.user_totals
+    np.testing.assert_array_equal(ds_appended.aggregates.sorted_hours, ds_full.aggregates.sorted_hours)
+
+    for name, phone in ds_full.user_index:
+        reports = [report_app.build_personal_report(name, report_app.get_user_records(name, phone, ds), ds=ds)
+                   for ds in (ds_appended, ds_full)]
+        assert report_app.encode_report(reports[0]) == report_app.encode_report(reports[1]), (name, phone)
+
+
+def test_non_append_change_needs_full_reload(report_app, records_csv):
+    path, df = records_csv(rows=500)
+    df_old, info = report_app.load_records(path)
+    df.iloc[::-1].to_csv(path, index=False, encoding='utf-8-sig')   # 改了原有内容，不是纯追加
+    assert report_app.read_appended_records(path, df_old, info) is None
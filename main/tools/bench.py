@@ -0,0 +1,247 @@
+"""
+报告流水线基准测试：加载数据、报告里每个环节、整份 build_user_report 的耗时，以及峰值内存。
+
+用法（在 main/ 目录下）：
+    python tools/bench.py --rows 100k                         # 没有就先用 gen_records 生成 data/bench/records_100k.csv
+    python tools/bench.py --csv data/bench/records_100k.csv --out bench_100k.json
+    python tools/bench.py --rows 100k --baseline bench_100k.json   # 和保存的结果对比，变慢超过阈值时退出码为 1
+
+耗时单位 ms；内存用 tracemalloc 单独再跑一遍统计（不影响计时）。
+"""
+import os
+import sys
+import gc
+import json
+import shutil
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gen_records import generate, parse_rows  # noqa: E402
+
+BENCH_DATA_FOLDER = os.path.join(BASE_DIR, 'data', 'bench')
+report_app = None   # import 时就会加载数据，等 load_app 指好数据目录再 import
+
+# 报告里的各个环节（按 build_personal_report 的顺序）
+STAGES = ['get_user_records', 'calc_user_stats', 'generate_tags', 'generate_milestones',
+          'calc_co_volunteers', 'build_personal_report', 'encode_report',
+          'build_user_report', 'get_report_body(冷)', 'get_report_body(缓存命中)']
+
+
+def prepare_csv(rows_text: str) -> str:
+    """data/bench/records_<rows>.csv，没有就生成一份（固定随机种子，每次一样）"""
+    path = os.path.join(BENCH_DATA_FOLDER, f'records_{rows_text.lower()}.csv')
+    if not os.path.exists(path):
+        os.makedirs(BENCH_DATA_FOLDER, exist_ok=True)
+        print(f"生成 {rows_text} 行测试数据 → {path}")
+        generate(parse_rows(rows_text)).to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+
+def load_app(csv_path: str, data_dir: str):
+    """
+    把 app 的数据目录（REPORT_DATA_DIR）指到 data_dir，放一份 csv_path 的拷贝再 import：
+    快照等都写在 data_dir 里，不读也不改 data/ 下的真实数据，也没有离线报告库（只测实时计算）
+    """
+    global report_app
+    shutil.copyfile(csv_path, os.path.join(data_dir, 'volunteer_records.csv'))
+    os.environ['REPORT_DATA_DIR'] = data_dir
+    import app
+    report_app = app
+
+
+def summarize(samples) -> dict:
+    arr = np.asarray(samples, dtype=np.float64)
+    return {
+        "n": int(len(arr)),
+        "mean": round(float(arr.mean()), 4),
+        "p50": round(float(np.percentile(arr, 50)), 4),
+        "p95": round(float(np.percentile(arr, 95)), 4),
+        "max": round(float(arr.max()), 4),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def bench_load(csv_path: str, repeat: int) -> dict:
+    """冷启动（解析 CSV）/ 热启动（读快照）/ 建索引 / 整个 load_data，各跑 repeat 次"""
+    snap_path = report_app.snapshot_path(report_app.CSV_PATH)
+    with open(csv_path, 'rb') as f:
+        csv_bytes = f.read()
+
+    samples = {key: [] for key in ("parse_records_csv", "load_snapshot", "build_indexes",
+                                   "load_data(无快照)", "load_data(有快照)")}
+    for _ in range(repeat):
+        ms, (df, _) = timed(report_app.parse_records_csv, csv_bytes)
+        samples["parse_records_csv"].append(ms)
+
+        if os.path.exists(snap_path):
+            os.remove(snap_path)
+        samples["load_data(无快照)"].append(timed(report_app.load_data)[0])   # 解析 + 写快照 + 建索引
+        samples["load_data(有快照)"].append(timed(report_app.load_data)[0])
+        samples["load_snapshot"].append(timed(report_app.load_snapshot, snap_path)[0])
+
+        ds = report_app.dataset
+        samples["build_indexes"].append(timed(report_app.Dataset, df, ds.org_stats, ds.csv_info, ds.org_info)[0])
+
+    return {key: summarize(v) for key, v in samples.items()}
+
+
+def run_report_stages(keys, samples=None):
+    """对每位抽到的志愿者把报告的各环节跑一遍；samples 传 dict 时记录各环节耗时"""
+    ds = report_app.dataset
+    record = (lambda stage, ms: samples[stage].append(ms)) if samples is not None else (lambda stage, ms: None)
+
+    for name, phone in keys:
+        ms, df_user = timed(report_app.get_user_records, name, phone, ds)
+        record('get_user_records', ms)
+        ms, user_stats = timed(report_app.calc_user_stats, df_user)
+        record('calc_user_stats', ms)
+        total_hours = round(df_user['hours'].sum(), 1)
+        ms, _ = timed(report_app.generate_tags, df_user, total_hours, user_stats['main_type'], user_stats)
+        record('generate_tags', ms)
+        ms, _ = timed(report_app.generate_milestones, df_user, total_hours)
+        record('generate_milestones', ms)
+        ms, _ = timed(report_app.calc_co_volunteers, df_user, ds=ds)
+        record('calc_co_volunteers', ms)
+        ms, report = timed(report_app.build_personal_report, name, df_user, ds=ds)
+        record('build_personal_report', ms)
+        ms, _ = timed(report_app.encode_report, report)
+        record('encode_report', ms)
+
+        ms, _ = timed(report_app.build_user_report, name, phone)
+        record('build_user_report', ms)
+
+        report_app.report_cache.clear()
+        ms, _ = timed(report_app.get_report_body, name, phone, ds)
+        record('get_report_body(冷)', ms)
+        ms, _ = timed(report_app.get_report_body, name, phone, ds)
+        record('get_report_body(缓存命中)', ms)
+
+
+def peak_memory_mb(fn, *args) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+    finally:
+        tracemalloc.stop()
+
+
+def run(csv_path: str, n_users: int, seed: int, load_repeat: int = 3) -> dict:
+    timings = bench_load(csv_path, load_repeat)
+    ds = report_app.dataset
+    keys = sorted(ds.user_index)
+    keys = random.Random(seed).sample(keys, min(n_users, len(keys)))
+
+    samples = {stage: [] for stage in STAGES}
+    with report_app.app.test_request_context():
+        run_report_stages(keys[:5])            # 预热
+        run_report_stages(keys, samples)
+        timings.update({stage: summarize(v) for stage, v in samples.items()})
+
+        memory = {
+            "load_data": peak_memory_mb(report_app.load_data),
+            "reports": peak_memory_mb(run_report_stages, keys),
+        }
+    memory["max_rss"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+    return {
+        "meta": {
+            "csv": csv_path,
+            "rows": len(ds.df),
+            "volunteers": len(ds.user_index),
+            "sampled": len(keys),
+            "seed": seed,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "orjson": report_app.orjson is not None,
+            "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        "timings_ms": timings,
+        "peak_memory_mb": memory,
+    }
+
+
+def print_results(result: dict):
+    meta = result['meta']
+    print(f"\n数据：{meta['csv']}（{meta['rows']} 行，{meta['volunteers']} 位志愿者，抽样 {meta['sampled']} 位）")
+    print(f"{'环节':<28}{'次数':>6}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for stage, s in result['timings_ms'].items():
+        print(f"{stage:<28}{s['n']:>6}{s['mean']:>10.3f}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['max']:>10.3f}")
+    print("峰值内存(MB)：" + "，".join(f"{k} {v}" for k, v in result['peak_memory_mb'].items()))
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """逐项和基线比：耗时看 p50，内存看峰值；返回变慢 / 变大超过阈值的项"""
+    pairs = [(f"{stage} p50", s['p50'], baseline['timings_ms'].get(stage, {}).get('p50'))
+             for stage, s in result['timings_ms'].items()]
+    pairs += [(f"内存 {k}", v, baseline['peak_memory_mb'].get(k)) for k, v in result['peak_memory_mb'].items()]
+
+    regressions = []
+    print(f"\n对比基线（{baseline['meta']['time']}，阈值 {threshold:.0%}）")
+    print(f"{'指标':<34}{'基线':>12}{'本次':>12}{'变化':>10}")
+    for label, new, old in pairs:
+        if not old:
+            print(f"{label:<34}{'-':>12}{new:>12.3f}{'':>10}")
+            continue
+        change = new / old - 1
+        flag = '  ← 变慢' if change > threshold else ''
+        print(f"{label:<34}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(label)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='报告流水线基准测试')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='用已有的流水账 CSV')
+    source.add_argument('--rows', help='用 data/bench/ 下的模拟数据（如 10k / 100k / 1M），没有就生成')
+    parser.add_argument('--users', type=int, default=200, help='抽样多少位志愿者测报告耗时')
+    parser.add_argument('--seed', type=int, default=1, help='抽样的随机种子')
+    parser.add_argument('--load-repeat', type=int, default=3, help='加载数据的各项测几次')
+    parser.add_argument('--out', help='把结果保存成 JSON（可作为以后的基线）')
+    parser.add_argument('--baseline', help='和之前保存的结果对比')
+    parser.add_argument('--threshold', type=float, default=0.1, help='超过基线多少算变慢（0.1 = 10%%）')
+    args = parser.parse_args(argv)
+
+    csv_path = os.path.abspath(args.csv) if args.csv else prepare_csv(args.rows)
+    with tempfile.TemporaryDirectory() as data_dir:
+        load_app(csv_path, data_dir)
+        result = run(csv_path, args.users, args.seed, args.load_repeat)
+    print_results(result)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存 → {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项超过阈值：{'、'.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+生成模拟的志愿流水账 CSV（和 data/volunteer_records.csv 同样的表头），用来压测 / 跑基准。
+
+- 活动热度长尾分布：少数大型活动几百上千人参加，大多数活动只有几个人
+- 志愿者活跃度也是长尾：多数人一年参加一两次，少数骨干几十次
+- 活动类型覆盖雷达图的 5 类和 app.ACTIVE_DAYS_WEIGHT 里的多日类型，多日活动时长按天数放大
+- 可以混入少量脏数据（学号带横线 / 空格、缺日期、缺时长、类型前后有空格）
+
+用法（在 main/ 目录下）：
+    python tools/gen_records.py --rows 100k --out data/bench/records_100k.csv
+"""
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# 单日活动：类型 → 活动名称用词（部分词会命中报告里的关键词彩蛋）
+SINGLE_DAY_NAMES = {
+    '支教': ['周末课堂', '阳光授课', '乡村支教', '英语角', '科学小课堂'],
+    '关怀': ['敬老院探访', '社区陪伴', '节日慰问', '助残活动', '暖冬行动'],
+    '环保': ['河道巡河', '净滩行动', '垃圾分类宣传', '植树活动', '旧衣回收'],
+    '心之旅': ['心灵茶话会', '情绪树洞', '朋辈倾听', '正念工作坊'],
+    '其他': ['迎新志愿', '运动会服务', '图书馆整理', '讲座引导', '商火相传'],
+}
+# 多日活动的天数，和 app.py 的 ACTIVE_DAYS_WEIGHT 一致
+# （不 import app：import 时会加载真实数据、写快照；这里只影响模拟数据的时长，不一致也不会出错）
+MULTI_DAY_DAYS = {
+    '线上支教': 35,
+    '夏令营': 14,
+    '返乡实践': 7,
+    'Buddy': 48,
+    '蒲公英': 28,
+    '商火': 30,
+}
+# 多日活动：类型 → 活动名称用词
+MULTI_DAY_NAMES = {
+    '线上支教': ['线上支教'],
+    '夏令营': ['何处是中国·筑梦夏令营', '乡村夏令营'],
+    '返乡实践': ['返乡实践'],
+    'Buddy': ['国际学生 Buddy'],
+    '蒲公英': ['蒲公英计划'],
+    '商火': ['商火新生陪伴'],
+}
+# 各类型活动的占比
+TYPE_SHARE = {
+    '支教': 0.24, '关怀': 0.2, '环保': 0.16, '心之旅': 0.1, '其他': 0.1,
+    '线上支教': 0.06, '夏令营': 0.04, '返乡实践': 0.04, 'Buddy': 0.02, '蒲公英': 0.02, '商火': 0.02,
+}
+# 多日活动集中的月份（其余类型全年均匀）
+TYPE_MONTHS = {'夏令营': [7, 8], '返乡实践': [1, 2, 7, 8], '商火': [9, 10]}
+
+SURNAMES = list('王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈')
+GIVEN_CHARS = list('子涵欣怡梓萱思语浩宇俊杰雨桐可馨一诺佳怡明轩若曦晨阳嘉怡天佑紫涵博文雅琪宇航诗涵皓轩')
+
+HEADER = ['姓名', '学号', '活动名称', '活动类型', '活动日期', '服务时长', '活动封面图']
+
+
+def parse_rows(text: str) -> int:
+    """支持 10k / 1.5M 这样的写法"""
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def zipf_weights(n: int, s: float, rng) -> np.ndarray:
+    """长尾权重（打乱顺序，免得编号小的总是最热门）"""
+    w = 1.0 / np.arange(1, n + 1) ** s
+    rng.shuffle(w)
+    return w / w.sum()
+
+
+def make_activities(n: int, year: int, rng) -> pd.DataFrame:
+    types = np.array(list(TYPE_SHARE))
+    share = np.array(list(TYPE_SHARE.values()))
+    act_type = rng.choice(types, size=n, p=share / share.sum())
+
+    names, dates, hours = [], [], []
+    for i, t in enumerate(act_type):
+        words = SINGLE_DAY_NAMES.get(t) or MULTI_DAY_NAMES[t]
+        names.append(f"{words[rng.integers(len(words))]}·第{i + 1}期")
+
+        month = rng.choice(TYPE_MONTHS[t]) if t in TYPE_MONTHS else rng.integers(1, 13)
+        dates.append(f"{year}/{month}/{rng.integers(1, 29)}")
+
+        days = MULTI_DAY_DAYS.get(t, 1)
+        per_day = rng.choice([0.5, 1, 1.5, 2, 2.5, 3, 4])
+        hours.append(round(per_day * days if days > 1 else per_day, 1))
+
+    return pd.DataFrame({'name': names, 'type': act_type, 'date': dates, 'hours': hours})
+
+
+def make_volunteers(n: int, rng) -> pd.DataFrame:
+    surnames = rng.choice(SURNAMES, size=n)
+    given = [''.join(rng.choice(GIVEN_CHARS, size=rng.integers(1, 3))) for _ in range(n)]
+    # 学号不重复；姓名允许重名（重名的人靠学号区分）
+    phones = 2020000000 + rng.choice(60_000_000, size=n, replace=False)
+    return pd.DataFrame({'name': np.char.add(surnames, given), 'phone': phones.astype(str)})
+
+
+def generate(rows: int, seed: int = 2025, year: int = 2025, dirty: float = 0.01) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n_acts = max(rows // 40, 10)
+    n_users = max(rows // 8, 10)
+
+    acts = make_activities(n_acts, year, rng)
+    users = make_volunteers(n_users, rng)
+
+    act_idx = rng.choice(n_acts, size=rows, p=zipf_weights(n_acts, 1.1, rng))
+    user_idx = rng.choice(n_users, size=rows, p=zipf_weights(n_users, 0.8, rng))
+
+    df = pd.DataFrame({
+        '姓名': users['name'].to_numpy()[user_idx],
+        '学号': users['phone'].to_numpy()[user_idx].astype(object),
+        '活动名称': acts['name'].to_numpy()[act_idx],
+        '活动类型': acts['type'].to_numpy()[act_idx].astype(object),
+        '活动日期': acts['date'].to_numpy()[act_idx].astype(object),
+        '服务时长': acts['hours'].to_numpy()[act_idx].astype(str).astype(object),
+        '活动封面图': np.where(rng.random(rows) < 0.6, np.char.add(act_idx.astype(str), '.jpg'), ''),
+    })
+
+    if dirty > 0:
+        def pick():
+            return rng.random(rows) < dirty / 4
+        phones = df['学号']
+        mask = pick()
+        df.loc[mask, '学号'] = phones[mask].str[:4] + '-' + phones[mask].str[4:]
+        mask = pick()
+        df.loc[mask, '学号'] = ' ' + phones[mask]
+        df.loc[pick(), '活动日期'] = ''
+        df.loc[pick(), '服务时长'] = ''
+        mask = pick()
+        df.loc[mask, '活动类型'] = ' ' + df.loc[mask, '活动类型'] + ' '
+
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成模拟的志愿流水账 CSV')
+    parser.add_argument('--rows', default='10k', help='行数，如 10k / 100k / 1M')
+    parser.add_argument('--out', required=True, help='输出 CSV 路径')
+    parser.add_argument('--seed', type=int, default=2025, help='随机种子（同样的参数生成同样的文件）')
+    parser.add_argument('--year', type=int, default=2025)
+    parser.add_argument('--dirty', type=float, default=0.01, help='脏数据比例')
+    args = parser.parse_args(argv)
+
+    rows = parse_rows(args.rows)
+    df = generate(rows, args.seed, args.year, args.dirty)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    df.to_csv(args.out, index=False, encoding='utf-8-sig')
+    print(f"已生成 {len(df)} 行 → {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+压测 /api/get_annual_data：按真实比例混合“志愿者查自己的报告”和“访客随便输一个”的请求，
+固定并发数连续发请求，统计吞吐量、延迟分位数（p50 / p95 / p99）和出错率。
+
+用法（在 main/ 目录下）：
+    python tools/loadtest.py --rows 100k                               # 用 serve.py 在本机起一个服务压
+    python tools/loadtest.py --rows 100k --concurrency 32 --out load_100k.json
+    python tools/loadtest.py --rows 100k --baseline load_100k.json     # 和保存的结果对比，变差超过阈值时退出码为 1
+    python tools/loadtest.py --url http://127.0.0.1:4399 --csv data/volunteer_records.csv   # 压已经在跑的服务
+
+- 本机起服务时数据用 data/bench/ 下的模拟流水账（和 bench.py 同一份），不读离线报告库，只测实时计算 + 缓存；
+  按客户端限流（CLIENT_*）会关掉，否则所有请求都来自 127.0.0.1，很快就被 429
+- 压已有的服务时限流照常生效，被拒绝的请求按状态码 429 计入出错
+- 志愿者按流水账里出现的人等概率抽（可重复抽到，缓存命中也算在里面）；访客是流水账里没有的姓名 + 学号
+- 耗时单位 ms，从发出请求到读完响应；客户端是 Python 线程，并发很高时客户端自己可能先成为瓶颈
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# ====== 配置区 ======
+BENCH_DATA_FOLDER = os.path.join(BASE_DIR, 'data', 'bench')
+SERVER_START_TIMEOUT = 300   # 等本机服务加载完数据、开始接受请求的最长时间（秒）
+REQUEST_TIMEOUT = 30         # 单个请求的超时（秒），超时按出错计
+ERROR_RATE_SLACK = 0.01      # 对比基线时出错率多出 1 个百分点以上才算变差
+
+
+# ====== 本机服务 ======
+def serve_child(port: int, workers: int, threads: int):
+    """
+    子进程里跑：关掉限流，再交给 serve.py 起多进程服务。
+    数据目录（REPORT_DATA_DIR）由 start_server 指到临时目录，import app 时加载的就是模拟数据
+    """
+    import logging
+    import app as report_app
+    import serve
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)   # 不打印每个请求的访问日志
+    report_app.client_limiter.max_concurrent = 0
+    report_app.client_limiter.rate = 0
+    serve.main(['--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+                '--threads', str(threads), '--watch-interval', '0'])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(csv_path: str, data_dir: str, workers: int, threads: int):
+    """
+    起一个 serve.py 子进程，等它能响应请求；返回 (进程, 地址)。
+    子进程的数据目录指到 data_dir（放一份 csv_path 的拷贝）：快照写在那里，不碰 data/ 下的真实数据，
+    也没有离线报告库（只测实时计算 + 缓存）
+    """
+    shutil.copyfile(csv_path, os.path.join(data_dir, 'volunteer_records.csv'))
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-child', '--csv', csv_path,
+                             '--port', str(port), '--workers', str(workers), '--threads', str(threads)],
+                            cwd=BASE_DIR, env={**os.environ, 'REPORT_DATA_DIR': data_dir})
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f'本机服务启动失败（退出码 {proc.returncode}）')
+        try:
+            with urllib.request.urlopen(f'{url}/api/cache_stats', timeout=2):
+                return proc, url
+        except OSError:
+            time.sleep(0.5)
+    stop_server(proc)
+    sys.exit(f'本机服务 {SERVER_START_TIMEOUT} 秒内没有启动起来')
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ====== 请求序列 ======
+def prepare_csv(rows_text: str) -> str:
+    """data/bench/records_<rows>.csv，没有就生成一份（和 bench.py 用同一份）"""
+    path = os.path.join(BENCH_DATA_FOLDER, f'records_{rows_text.lower()}.csv')
+    if not os.path.exists(path):
+        from gen_records import generate, parse_rows
+        os.makedirs(BENCH_DATA_FOLDER, exist_ok=True)
+        print(f"生成 {rows_text} 行测试数据 → {path}")
+        generate(parse_rows(rows_text)).to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+
+def load_people(csv_path: str) -> list:
+    """流水账里出现过的 (姓名, 学号)，学号保持原样（带横线 / 空格的也照样发，由服务端规范化）"""
+    df = pd.read_csv(csv_path, usecols=['姓名', '学号'], dtype=str, encoding='utf-8-sig').dropna()
+    df = df.apply(lambda col: col.str.strip())
+    df = df[(df['姓名'] != '') & (df['学号'] != '')].drop_duplicates()
+    return list(df.itertuples(index=False, name=None))
+
+
+def make_requests(people: list, n: int, guest_ratio: float, seed: int) -> list:
+    """生成 n 个请求：[(类型, 请求体)]，类型是 volunteer / guest"""
+    rng = random.Random(seed)
+    known = set(people)
+    requests = []
+    for _ in range(n):
+        if not people or rng.random() < guest_ratio:
+            while True:
+                person = (f'访客{rng.randrange(100000)}', str(rng.randrange(10 ** 10, 10 ** 11)))
+                if person not in known:
+                    break
+            kind = 'guest'
+        else:
+            person, kind = rng.choice(people), 'volunteer'
+        body = json.dumps({"name": person[0], "phone": person[1], "slim": True}, ensure_ascii=False).encode('utf-8')
+        requests.append((kind, body))
+    return requests
+
+
+# ====== 发请求 ======
+def send(url: str, body: bytes):
+    """发一个请求，返回 (状态码, 耗时 ms)；连不上 / 超时的状态码记为 0"""
+    req = urllib.request.Request(f'{url}/api/get_annual_data', data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip',      # 和浏览器一样要压缩版本，压缩也算在耗时里
+    })
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = 0
+    return status, (time.perf_counter() - start) * 1000
+
+
+def run_load(url: str, requests: list, concurrency: int):
+    """concurrency 个线程一起把请求发完，每个线程收到响应才发下一个；返回 ([(类型, 状态码, 耗时)], 总耗时秒)"""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda item: (item[0], *send(url, item[1])), requests))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def summarize(samples) -> dict:
+    arr = np.asarray(samples, dtype=np.float64)
+    if not len(arr):
+        return {"n": 0}
+    return {
+        "n": int(len(arr)),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def run(url: str, csv_path: str, args) -> dict:
+    people = load_people(csv_path)
+    requests = make_requests(people, args.warmup + args.requests, args.guest_ratio, args.seed)
+
+    if args.warmup:
+        run_load(url, requests[:args.warmup], args.concurrency)
+    results, elapsed = run_load(url, requests[args.warmup:], args.concurrency)
+
+    status = {}
+    for _, code, _ in results:
+        status[str(code)] = status.get(str(code), 0) + 1
+    errors = sum(1 for _, code, _ in results if code != 200)
+
+    return {
+        "meta": {
+            "url": url if args.url else None,
+            "csv": csv_path,
+            "volunteers": len(people),
+            "requests": len(results),
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "guest_ratio": args.guest_ratio,
+            "seed": args.seed,
+            "server": None if args.url else {"workers": args.workers, "threads": args.threads},
+            "python": platform.python_version(),
+            "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2),
+        "errors": errors,
+        "error_rate": round(errors / max(len(results), 1), 4),
+        "status": status,
+        # 出错的请求（包括 429）不计入延迟
+        "latency_ms": {
+            kind: summarize([ms for k, code, ms in results if code == 200 and kind in ('all', k)])
+            for kind in ('all', 'volunteer', 'guest')
+        },
+    }
+
+
+# ====== 输出 / 对比 ======
+def print_results(result: dict):
+    meta = result['meta']
+    print(f"\n数据：{meta['csv']}（{meta['volunteers']} 位志愿者，访客占 {meta['guest_ratio']:.0%}）")
+    print(f"{meta['requests']} 个请求，并发 {meta['concurrency']}，用时 {result['duration_s']} 秒，"
+          f"吞吐 {result['throughput_rps']} 次/秒，出错 {result['errors']} 个（{result['error_rate']:.2%}）")
+    print("状态码：" + "，".join(f"{code} × {n}" for code, n in sorted(result['status'].items())))
+    print(f"{'延迟(ms)':<12}{'次数':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for kind, s in result['latency_ms'].items():
+        if s['n']:
+            print(f"{kind:<12}{s['n']:>8}{s['mean']:>10.2f}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{s['max']:>10.2f}")
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """和基线比：延迟看整体 p50 / p95 / p99，吞吐量变低、出错率变高也算变差；返回变差的项"""
+    new_lat, old_lat = result['latency_ms']['all'], baseline['latency_ms']['all']
+    # (指标, 基线, 本次, 越大越差)
+    pairs = [(f"延迟 {p}", old_lat.get(p), new_lat.get(p), True) for p in ('p50', 'p95', 'p99')]
+    pairs.append(("吞吐量", baseline['throughput_rps'], result['throughput_rps'], False))
+
+    regressions = []
+    print(f"\n对比基线（{baseline['meta']['time']}，阈值 {threshold:.0%}）")
+    print(f"{'指标':<16}{'基线':>12}{'本次':>12}{'变化':>10}")
+    for label, old, new, higher_is_worse in pairs:
+        if not old or new is None:
+            print(f"{label:<16}{'-':>12}{new if new is not None else '-':>12}{'':>10}")
+            continue
+        change = new / old - 1
+        flag = '  ← 变差' if (change > threshold if higher_is_worse else change < -threshold) else ''
+        print(f"{label:<16}{old:>12.2f}{new:>12.2f}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(label)
+
+    old_err, new_err = baseline['error_rate'], result['error_rate']
+    flag = '  ← 变差' if new_err > old_err + ERROR_RATE_SLACK else ''
+    print(f"{'出错率':<16}{old_err:>12.2%}{new_err:>12.2%}{'':>10}{flag}")
+    if flag:
+        regressions.append('出错率')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='/api/get_annual_data 压测')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='用已有的流水账 CSV（--url 时用来抽志愿者）')
+    source.add_argument('--rows', help='用 data/bench/ 下的模拟数据（如 10k / 100k / 1M），没有就生成')
+    parser.add_argument('--url', help='压已经在跑的服务（如 http://127.0.0.1:4399），不传就在本机起一个')
+    parser.add_argument('--workers', type=int, default=2, help='本机服务的 worker 进程数')
+    parser.add_argument('--threads', type=int, default=8, help='本机服务每个 worker 的线程数')
+    parser.add_argument('--requests', type=int, default=2000, help='计入统计的请求数')
+    parser.add_argument('--warmup', type=int, default=100, help='正式开始前先发几个请求预热（不计入统计）')
+    parser.add_argument('--concurrency', type=int, default=16, help='同时在发的请求数')
+    parser.add_argument('--guest-ratio', type=float, default=0.2, help='访客请求占多少（0.2 = 20%%）')
+    parser.add_argument('--seed', type=int, default=1, help='请求序列的随机种子')
+    parser.add_argument('--out', help='把结果保存成 JSON（可作为以后的基线）')
+    parser.add_argument('--baseline', help='和之前保存的结果对比')
+    parser.add_argument('--threshold', type=float, default=0.1, help='超过基线多少算变差（0.1 = 10%%）')
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--serve-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve_child:
+        serve_child(args.port, args.workers, args.threads)
+        return
+
+    csv_path = os.path.abspath(args.csv) if args.csv else prepare_csv(args.rows)
+    if args.url:
+        result = run(args.url.rstrip('/'), csv_path, args)
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            proc, url = start_server(csv_path, data_dir, args.workers, args.threads)
+            try:
+                result = run(url, csv_path, args)
+            finally:
+                stop_server(proc)
+    print_results(result)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存 → {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项超过阈值：{'、'.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
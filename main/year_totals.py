@@ -0,0 +1,60 @@
+"""
+跨年度汇总用的每年小结：每位志愿者这一年的总时长 / 活动次数，存成 <年份>.totals.json。
+
+查“历年累计”时只读这些小文件把各年加起来，不用把往年的流水账都加载进内存。
+文件里记着源 CSV 的签名（大小 + mtime），CSV 改过就作废，由调用方重新算好再存。
+"""
+import os
+import json
+import threading
+
+
+class YearTotals:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._cache = {}    # 年份 → (签名, {(name, phone): (总时长, 活动次数)})
+        self._lock = threading.Lock()
+
+    def path(self, year: int) -> str:
+        return os.path.join(self.folder, f'{year}.totals.json')
+
+    def get(self, year: int, signature):
+        """签名对得上的那一年的汇总（内存里没有就读文件）；没有或已过时返回 None"""
+        signature = list(signature)
+        with self._lock:
+            cached = self._cache.get(year)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        try:
+            with open(self.path(year), 'rb') as f:
+                doc = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        if doc.get('signature') != signature:
+            return None
+
+        # 学号只有数字，从右边切开，姓名里就算有制表符也不会切错
+        totals = {tuple(key.rsplit('\t', 1)): (hours, count) for key, (hours, count) in doc['users'].items()}
+        with self._lock:
+            self._cache[year] = (signature, totals)
+        return totals
+
+    def put(self, year: int, signature, totals: dict):
+        """记下一年的汇总并写文件（先写临时文件再替换）；写不了只打印，下次再算"""
+        signature = list(signature)
+        with self._lock:
+            self._cache[year] = (signature, totals)
+
+        doc = {
+            "signature": signature,
+            "users": {f'{name}\t{phone}': [hours, count] for (name, phone), (hours, count) in totals.items()},
+        }
+        path = self.path(year)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(doc, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[year_totals] 写 {path} 失败：{e}")